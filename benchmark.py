@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Нагрузочная проверка рассылки на локальной замене Bot API
+Для каждого способа рассылки и каждого числа каналов измеряет время
+рассылки, сообщения и рассылки в секунду и задержку доставки в канал
+(p50/p95/p99 от начала рассылки). Результаты пишутся в JSON, чтобы
+сравнивать их между коммитами.
+
+Запуск: python benchmark.py; настройки - переменные окружения BENCH_*.
+"""
+
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Настройки проверки
+BENCH_SIZES = [int(size) for size in os.getenv('BENCH_SIZES', '30,300,3000,30000').split(',')]
+BENCH_ENGINES = [engine.strip() for engine in os.getenv('BENCH_ENGINES', 'ptb,raw_async,raw_requests,sharded').split(',')]
+BENCH_OUTPUT = os.getenv('BENCH_OUTPUT', 'benchmark_results.json')
+BENCH_LATENCY = float(os.getenv('BENCH_LATENCY', '0.02'))
+BENCH_RATE_429 = float(os.getenv('BENCH_RATE_429', '0'))
+BENCH_ERROR_RATE = float(os.getenv('BENCH_ERROR_RATE', '0'))
+# Не меньше двух процессов, иначе способ sharded пропускается
+BENCH_WORKERS = int(os.getenv('BENCH_WORKERS', str(max(2, min(4, os.cpu_count() or 1)))))
+# Последовательная рассылка через requests на 30 000 каналов идет слишком долго
+BENCH_SYNC_LIMIT = int(os.getenv('BENCH_SYNC_LIMIT', '3000'))
+BENCH_TOKEN = '123456:BENCHMARK'
+
+logger = logging.getLogger('benchmark')
+
+_channel_ids = itertools.count(1)
+
+# Рассылка: функция (каналы, on_result) -> None
+Broadcast = Callable[[List[int], Callable[[Any, bool], None]], None]
+# Способ рассылки: (рассылка, закрытие его соединений и процессов)
+Engine = Tuple[Broadcast, Callable[[], None]]
+
+# Строка лога на каждый канал измеряла бы скорость логирования, а не рассылки
+QUIET_LOGGERS = (None, 'httpx')
+
+
+def prepare_environment() -> str:
+    """Окружение ботов; задается до их импорта, потому что config.py читает его при импорте
+
+    Вызывается только в основном процессе: процессы ShardedPublisher импортируют
+    этот модуль заново и получают окружение (OUTBOX_PATH и остальное) от него.
+    """
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    os.environ.setdefault('OUTBOX_PATH', os.path.join(workdir, 'outbox.db'))
+    # Проверяется скорость самой рассылки, а не лимит Telegram в 30 сообщений в секунду
+    os.environ.setdefault('RATE_LIMIT_GLOBAL', '1000000')
+    return workdir
+
+
+def quiet_logging():
+    """Только предупреждения и ошибки, в том числе от httpx (python-telegram-bot)"""
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_api() -> subprocess.Popen:
+    """Запуск локального Bot API в отдельном процессе (чтобы он не делил GIL с рассылкой)"""
+    port = _free_port()
+    env = dict(
+        os.environ,
+        FAKE_API_PORT=str(port),
+        FAKE_API_LATENCY=str(BENCH_LATENCY),
+        FAKE_API_RATE_429=str(BENCH_RATE_429),
+        FAKE_API_ERROR_RATE=str(BENCH_ERROR_RATE)
+    )
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_bot_api.py')],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            urllib.request.urlopen(f"{url}/stats", timeout=1).read()
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("Локальный Bot API не запустился")
+            time.sleep(0.1)
+
+    os.environ['BOT_API_URL'] = url
+    return process
+
+
+def api_requests() -> int:
+    """Число запросов, принятых локальным Bot API"""
+    with urllib.request.urlopen(f"{os.environ['BOT_API_URL']}/stats", timeout=5) as response:
+        return sum(json.load(response)['calls'].values())
+
+
+def percentile(values: List[float], share: float) -> Optional[float]:
+    """Процентиль по ближайшему рангу"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+def ptb_engine() -> Engine:
+    """TelegramPublisher: python-telegram-bot, asyncio"""
+    from fanout import run_sync
+    from telegram_bot import TelegramPublisher
+    publisher = TelegramPublisher(BENCH_TOKEN)
+
+    def run(channels, on_result):
+        async def broadcast():
+            publisher.channels = channels
+            async for progress in publisher.publish_stream("<b>Нагрузочная проверка</b>"):
+                if not progress.is_summary:
+                    on_result(progress.channel, progress.success)
+        # Публикатор и его боты живут в общем цикле событий процесса, а не в новом цикле на каждый прогон
+        run_sync(broadcast())
+
+    return run, lambda: None
+
+
+def raw_engine(async_transport: bool) -> Engine:
+    """SimpleTelegramBot: голый Bot API через aiohttp или через requests"""
+    from bot_api import ASYNC_TRANSPORT
+    from render_simple_bot import SimpleTelegramBot
+    bot = SimpleTelegramBot(BENCH_TOKEN)
+    if async_transport and not ASYNC_TRANSPORT:
+        raise ImportError("aiohttp не установлен")
+    bot.async_transport = async_transport
+
+    def run(channels, on_result):
+        bot.channels = channels
+        bot.send_message_to_all_channels("<b>Нагрузочная проверка</b>", on_result=on_result)
+
+    return run, bot.close
+
+
+def sharded_engine() -> Engine:
+    """ShardedPublisher: python-telegram-bot в нескольких процессах"""
+    if BENCH_WORKERS < 2:
+        raise ValueError("BENCH_WORKERS меньше 2")
+    from fanout import run_sync
+    from sharded_publisher import ShardedPublisher
+    publisher = ShardedPublisher(BENCH_TOKEN, BENCH_WORKERS, log_level=logging.WARNING)
+
+    def run(channels, on_result):
+        async def broadcast():
+            publisher.channels = channels
+            async for progress in publisher.publish_stream("<b>Нагрузочная проверка</b>"):
+                if not progress.is_summary:
+                    on_result(progress.channel, progress.success)
+        # Публикатор и его боты живут в общем цикле событий процесса, а не в новом цикле на каждый прогон
+        run_sync(broadcast())
+
+    return run, publisher.close
+
+
+ENGINES: Dict[str, Callable[[], Engine]] = {
+    'ptb': ptb_engine,
+    'raw_async': lambda: raw_engine(True),
+    'raw_requests': lambda: raw_engine(False),
+    'sharded': sharded_engine,
+}
+
+
+def measure(engine_name: str, engine: Broadcast, size: int) -> Dict[str, Any]:
+    """Одна рассылка в size каналов"""
+    # Новые ID каналов на каждую рассылку: лимит 20 сообщений в минуту на канал не должен тормозить проверку
+    channels = [-1000000000000 - next(_channel_ids) for _ in range(size)]
+    latencies: List[float] = []
+    successful = 0
+    requests_before = api_requests()
+    started = time.monotonic()
+
+    def on_result(channel, success):
+        nonlocal successful
+        latencies.append(time.monotonic() - started)
+        successful += 1 if success else 0
+
+    engine(channels, on_result)
+    wall_time = time.monotonic() - started
+
+    return {
+        'engine': engine_name,
+        'channels': size,
+        'wall_time': round(wall_time, 4),
+        'messages_per_sec': round(size / wall_time, 2),
+        'broadcasts_per_sec': round(1 / wall_time, 4),
+        'latency_p50': percentile(latencies, 0.50),
+        'latency_p95': percentile(latencies, 0.95),
+        'latency_p99': percentile(latencies, 0.99),
+        # Процессы sharded возвращают результаты частью целиком: задержка - до конца части, а не до канала
+        'latency_of': 'shard' if engine_name == 'sharded' else 'channel',
+        'successful': successful,
+        'failed': len(latencies) - successful,
+        'requests': api_requests() - requests_before
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+            text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(workdir: str):
+    """Запуск всех сочетаний способов рассылки и чисел каналов"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logger.info(f"📁 Рабочий каталог проверки: {workdir}")
+
+    server = start_fake_api()
+    logger.info(f"🧪 Локальный Bot API: {os.environ['BOT_API_URL']}, задержка {BENCH_LATENCY} сек")
+    # Модули ботов импортируются только после того, как задан BOT_API_URL
+    from fanout import FANOUT_CONCURRENCY
+
+    results = []
+    try:
+        for engine_name in BENCH_ENGINES:
+            try:
+                engine, close = ENGINES[engine_name]()
+            except (ImportError, ValueError, KeyError) as e:
+                logger.warning(f"⚠️ Способ {engine_name} пропущен: {e}")
+                results.append({'engine': engine_name, 'skipped': str(e)})
+                continue
+            quiet_logging()
+
+            try:
+                for size in BENCH_SIZES:
+                    if engine_name == 'raw_requests' and size > BENCH_SYNC_LIMIT:
+                        results.append({'engine': engine_name, 'channels': size, 'skipped': f"больше BENCH_SYNC_LIMIT={BENCH_SYNC_LIMIT}"})
+                        continue
+
+                    result = measure(engine_name, engine, size)
+                    results.append(result)
+                    latency_of = " (по частям)" if result['latency_of'] == 'shard' else ""
+                    logger.warning(
+                        f"📊 {engine_name}, {size} каналов: {result['wall_time']:.2f} сек, "
+                        f"{result['messages_per_sec']:.0f} сообщ./сек, задержка{latency_of} p50 {result['latency_p50']:.3f} / "
+                        f"p95 {result['latency_p95']:.3f} / p99 {result['latency_p99']:.3f} сек, "
+                        f"ошибок {result['failed']}"
+                    )
+            finally:
+                close()
+    finally:
+        server.terminate()
+        server.wait()
+
+    report = {
+        'commit': git_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'settings': {
+            'latency': BENCH_LATENCY,
+            'rate_429': BENCH_RATE_429,
+            'error_rate': BENCH_ERROR_RATE,
+            'workers': BENCH_WORKERS,
+            'concurrency': FANOUT_CONCURRENCY
+        },
+        'results': results
+    }
+    with open(BENCH_OUTPUT, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    logger.warning(f"💾 Результаты записаны в {BENCH_OUTPUT}")
+
+
+if __name__ == "__main__":
+    # Процессы ShardedPublisher запускаются через spawn и импортируют этот модуль заново
+    multiprocessing.freeze_support()
+    main(prepare_environment())
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Асинхронный транспорт Bot API для ботов без python-telegram-bot
+Запросы идут через aiohttp с общим пулом соединений, поэтому рассылка
+из render_simple_bot.py и render_media_bot.py идет параллельно, а не по очереди
+"""
+
+import asyncio
+import json
+import logging
+import mmap
+import os
+import uuid
+import weakref
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import quote_plus, urlencode
+
+from fanout import run_sync, FANOUT_CONCURRENCY
+from retry import SendError, classify_exception, error_from_response, unknown_outcome
+
+try:
+    import aiohttp
+except ImportError:
+    # Без aiohttp боты рассылают синхронно через requests
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+# Можно ли рассылать параллельно (установлен ли aiohttp)
+ASYNC_TRANSPORT = aiohttp is not None
+
+# Заголовок готового тела запроса (поля Bot API в виде формы)
+FORM_HEADERS = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+# Размер части файла при загрузке с диска
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Файл формы: (поле, путь на диске, имя файла для Telegram)
+UploadFile = Tuple[str, str, str]
+
+
+class PreparedRequest:
+    """Запрос рассылки, закодированный один раз
+
+    У всех каналов рассылки одинаковы метод, текст, подпись и parse_mode,
+    а отличается только chat_id, поэтому общая часть формы кодируется
+    один раз, и для канала к ней дописывается только chat_id.
+    """
+
+    __slots__ = ('method', 'timeout', 'tail')
+
+    def __init__(self, method: str, fields: Dict[str, Any], timeout: float):
+        self.method = method
+        self.timeout = timeout
+        self.tail = urlencode({key: value for key, value in fields.items() if value is not None}).encode('utf-8')
+
+    def body(self, chat_id: Any) -> bytes:
+        """Тело запроса в чат"""
+        return b'chat_id=' + quote_plus(str(chat_id)).encode('ascii') + b'&' + self.tail
+
+
+class MultipartBody:
+    """Тело multipart/form-data с файлами с диска
+
+    Файлы отображаются в память (mmap) и отдаются частями по UPLOAD_CHUNK_SIZE,
+    поэтому даже видео на 50 МБ не читается в память целиком. Длина тела
+    известна заранее, и запрос уходит с Content-Length, а не по частям.
+    """
+
+    def __init__(self, fields: Dict[str, Any], files: List[UploadFile]):
+        boundary = uuid.uuid4().hex
+        self.head = b''.join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8')
+            for name, value in fields.items() if value is not None
+        )
+
+        # Для каждого файла: заголовок части перед ним, путь и размер
+        self.parts: List[Tuple[bytes, str, int]] = []
+        for field, path, filename in files:
+            header = (
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename.replace(chr(34), "")}"\r\n'
+                f'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8')
+            )
+            # Перед заголовком следующей части предыдущий файл завершается переводом строки
+            self.parts.append((b'\r\n' + header if self.parts else header, path, os.path.getsize(path)))
+        self.tail = f'\r\n--{boundary}--\r\n'.encode('ascii')
+
+        length = len(self.head) + len(self.tail) + sum(len(header) + size for header, _, size in self.parts)
+        self.headers = {
+            'Content-Type': f'multipart/form-data; boundary={boundary}',
+            'Content-Length': str(length)
+        }
+
+    def chunks(self) -> Iterator[bytes]:
+        """Части тела: заголовки полей, файлы по UPLOAD_CHUNK_SIZE, завершение"""
+        yield self.head
+        for header, path, size in self.parts:
+            yield header
+            # Пустой файл отобразить в память нельзя
+            if size:
+                with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                    for offset in range(0, size, UPLOAD_CHUNK_SIZE):
+                        yield view[offset:offset + UPLOAD_CHUNK_SIZE]
+        yield self.tail
+
+    def reader(self) -> "ChunkReader":
+        """Тело для requests (файловый объект с длиной)"""
+        return ChunkReader(self.chunks(), int(self.headers['Content-Length']))
+
+    async def async_chunks(self) -> AsyncIterator[bytes]:
+        """Тело для aiohttp; файл читается в пуле потоков, чтобы не блокировать цикл событий"""
+        loop = asyncio.get_running_loop()
+        chunks = self.chunks()
+        try:
+            while True:
+                chunk = await loop.run_in_executor(None, next, chunks, None)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            chunks.close()
+
+
+class ChunkReader:
+    """Файловый объект поверх потока частей: requests читает тело по read(размер)"""
+
+    def __init__(self, chunks: Iterator[bytes], length: int):
+        self.chunks = chunks
+        self.length = length
+        self.buffer = b''
+
+    def __len__(self) -> int:
+        return self.length
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        if size is None or size < 0:
+            # Прочитать все разом - только для совместимости, requests так не делает
+            data = self.buffer + b''.join(self.chunks)
+            self.buffer = b''
+            return data
+
+        while len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+class UploadRequest:
+    """Запрос рассылки с загрузкой файлов с диска
+
+    Поля формы общие для всех каналов, а файлы читаются с диска заново
+    для каждой попытки (поток тела после отправки уже исчерпан).
+    """
+
+    __slots__ = ('method', 'timeout', 'fields', 'files')
+
+    def __init__(self, method: str, fields: Dict[str, Any], files: List[UploadFile], timeout: float):
+        self.method = method
+        self.timeout = timeout
+        self.fields = fields
+        self.files = files
+
+    def body(self, chat_id: Any) -> MultipartBody:
+        """Тело запроса в чат"""
+        return MultipartBody({'chat_id': chat_id, **self.fields}, self.files)
+
+
+class AsyncBotAPI:
+    """Вызов методов Bot API из asyncio
+
+    Сессия aiohttp привязана к циклу событий, поэтому у каждого цикла своя
+    сессия. Синхронные рассылки (планировщик, команды) идут в общем фоновом
+    цикле процесса (fanout.iterate_sync), и его сессия живет, пока бот не
+    закрыт (close_sync), а не создается на каждую рассылку.
+    """
+
+    def __init__(self, pool_size: int = FANOUT_CONCURRENCY):
+        self.pool_size = pool_size
+        self.sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+
+    def _session(self):
+        """Сессия текущего цикла событий (создается при первом запросе)"""
+        loop = asyncio.get_running_loop()
+        session = self.sessions.get(loop)
+        if session is None or session.closed:
+            # Хост один (BOT_API_URL), поэтому лимит на хост равен общему
+            connector = aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.pool_size)
+            session = aiohttp.ClientSession(connector=connector)
+            self.sessions[loop] = session
+        return session
+
+    async def call(self, api_url: str, method: str, data: Union[dict, bytes, MultipartBody], timeout: float) -> Any:
+        """Вызов метода Bot API, при ошибке выбрасывает SendError
+
+        data - поля запроса, готовое тело формы (PreparedRequest.body)
+        или тело с файлом (UploadRequest.body).
+        """
+        if isinstance(data, MultipartBody):
+            request = {'data': data.async_chunks(), 'headers': data.headers}
+        elif isinstance(data, bytes):
+            request = {'data': data, 'headers': FORM_HEADERS}
+        else:
+            # Форма aiohttp принимает только строки (requests приводит числа сам)
+            request = {'data': {key: str(value) for key, value in data.items() if value is not None}}
+
+        try:
+            async with self._session().post(
+                f"{api_url}/{method}",
+                timeout=aiohttp.ClientTimeout(total=timeout),
+                **request
+            ) as response:
+                text = await response.text()
+                status = response.status
+        except aiohttp.ClientConnectorError as e:
+            # Соединение не установлено: запрос не ушел, его можно повторить
+            raise SendError(str(e) or e.__class__.__name__, transient=True)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # Ответ потерян после отправки: повтор мог бы опубликовать пост второй раз
+            raise unknown_outcome(e)
+        except Exception as e:
+            raise classify_exception(e)
+
+        try:
+            payload = json.loads(text)
+        except ValueError:
+            payload = None
+
+        if status == 200 and payload and payload.get('ok'):
+            return payload.get('result')
+
+        raise error_from_response(status, payload, text)
+
+    async def close(self):
+        """Закрытие сессии текущего цикла событий"""
+        session = self.sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
+
+    def close_sync(self):
+        """Закрытие сессии общего фонового цикла событий (из синхронного кода, при остановке бота)"""
+        if self.sessions:
+            run_sync(self.close())
+
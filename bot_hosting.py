@@ -10,17 +10,16 @@ import schedule
 import time
 import threading
 from datetime import datetime
-from typing import List, Dict, Optional
-import pytz
-from telegram import Bot
-from telegram.error import TelegramError
+from typing import List, Union
+from fanout import run_background, run_sync, FANOUT_CONCURRENCY, FANOUT_TIMEOUT
+from outbox import schedule_post_key
+from circuit_breaker import get_circuit_breaker
+from publisher import TelegramPublisher as SharedPublisher, catch_up
 from flask import Flask, render_template_string, jsonify
 from config import (
     BOT_TOKEN, 
     CHANNELS, 
     PUBLISH_SCHEDULE, 
-    TIMEZONE, 
-    POST_TEMPLATES,
     LOG_LEVEL,
     LOG_FILE
 )
@@ -48,73 +47,11 @@ bot_status = {
     'start_time': None
 }
 
-class TelegramPublisher:
-    """Класс для публикации сообщений в Telegram каналы"""
+class TelegramPublisher(SharedPublisher):
+    """Публикатор со статистикой для веб-панели (bot_status)"""
     
-    def __init__(self, bot_token: str):
-        self.bot = Bot(token=bot_token)
-        self.channels = CHANNELS
-        self.timezone = pytz.timezone(TIMEZONE)
-        
-    async def publish_to_channel(self, channel: str, message: str, parse_mode: str = 'HTML') -> bool:
-        """Публикация сообщения в один канал"""
-        try:
-            await self.bot.send_message(
-                chat_id=channel,
-                text=message,
-                parse_mode=parse_mode
-            )
-            logger.info(f"✅ Сообщение успешно отправлено в {channel}")
-            return True
-        except TelegramError as e:
-            logger.error(f"❌ Ошибка при отправке в {channel}: {e}")
-            bot_status['errors'] += 1
-            return False
-        except Exception as e:
-            logger.error(f"❌ Неожиданная ошибка при отправке в {channel}: {e}")
-            bot_status['errors'] += 1
-            return False
-    
-    async def publish_to_all_channels(self, message: str, parse_mode: str = 'HTML') -> Dict[str, bool]:
-        """Публикация сообщения во все каналы"""
-        results = {}
-        
-        logger.info(f"🚀 Начинаем публикацию сообщения в {len(self.channels)} каналов")
-        
-        # Создаем задачи для всех каналов
-        tasks = []
-        for channel in self.channels:
-            task = self.publish_to_channel(channel, message, parse_mode)
-            tasks.append((channel, task))
-        
-        # Выполняем все задачи параллельно
-        for channel, task in tasks:
-            try:
-                result = await task
-                results[channel] = result
-            except Exception as e:
-                logger.error(f"❌ Ошибка при обработке канала {channel}: {e}")
-                results[channel] = False
-        
-        # Подсчитываем результаты
-        successful = sum(1 for success in results.values() if success)
-        failed = len(results) - successful
-        
-        logger.info(f"📊 Результаты публикации: {successful} успешно, {failed} с ошибками")
-        
-        # Обновляем статистику
-        bot_status['total_published'] += successful
-        bot_status['last_publish'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        
-        return results
-    
-    def get_current_time_moscow(self) -> datetime:
-        """Получение текущего времени в МСК"""
-        return datetime.now(self.timezone)
-    
-    def get_post_for_time(self, time_str: str) -> Optional[Dict[str, str]]:
-        """Получение шаблона поста для указанного времени"""
-        return POST_TEMPLATES.get(time_str)
+    def __init__(self, bot_token: Union[str, List[str]], concurrency: int = FANOUT_CONCURRENCY, timeout: float = FANOUT_TIMEOUT):
+        super().__init__(bot_token, concurrency, timeout, stats=bot_status)
 
 class Scheduler:
     """Планировщик для автоматической публикации"""
@@ -126,9 +63,17 @@ class Scheduler:
     def schedule_posts(self):
         """Настройка расписания публикации"""
         for time_str in self.schedule_times:
-            schedule.every().day.at(time_str).do(self.publish_scheduled_post, time_str)
+            schedule.every().day.at(time_str).do(self.run_scheduled_post, time_str)
             logger.info(f"⏰ Запланирована публикация на {time_str} МСК")
     
+    def run_scheduled_post(self, time_str: str):
+        """Запуск публикации по расписанию из потока планировщика"""
+        run_sync(self.publish_scheduled_post(time_str))
+    
+    def catch_up(self):
+        """Досылка прерванных рассылок и слотов, пропущенных во время простоя"""
+        catch_up(self.publisher, self.schedule_times, self.run_scheduled_post)
+    
     async def publish_scheduled_post(self, time_str: str):
         """Публикация по расписанию"""
         current_time = self.publisher.get_current_time_moscow()
@@ -145,7 +90,7 @@ class Scheduler:
         parse_mode = post_template.get('parse_mode', 'HTML')
         
         # Публикуем во все каналы
-        results = await self.publisher.publish_to_all_channels(message, parse_mode)
+        results = await self.publisher.publish_to_all_channels(message, parse_mode, schedule_post_key(current_time, time_str))
         
         # Логируем результаты
         for channel, success in results.items():
@@ -156,6 +101,7 @@ class Scheduler:
         """Запуск планировщика"""
         logger.info("🚀 Планировщик запущен")
         self.schedule_posts()
+        self.catch_up()
         
         while bot_status['running']:
             schedule.run_pending()
@@ -221,6 +167,15 @@ def dashboard():
                 {% endfor %}
             </div>
             
+            {% if quarantine %}
+            <div class="schedule">
+                <h3>🚧 Каналы на карантине</h3>
+                {% for item in quarantine %}
+                <div class="schedule-item">{{ item.channel }}: {{ item.last_error }} (ошибок: {{ item.failures }}, проверка: {{ item.next_probe }})</div>
+                {% endfor %}
+            </div>
+            {% endif %}
+            
             <div>
                 <strong>Последняя публикация:</strong> {{ status.last_publish or 'Нет данных' }}
             </div>
@@ -246,7 +201,8 @@ def dashboard():
                                 status=bot_status,
                                 channels_count=len(CHANNELS),
                                 schedule_count=len(PUBLISH_SCHEDULE),
-                                schedule_times=PUBLISH_SCHEDULE)
+                                schedule_times=PUBLISH_SCHEDULE,
+                                quarantine=get_circuit_breaker().quarantined())
 
 @app.route('/api/status')
 def api_status():
@@ -262,13 +218,8 @@ def test_publish():
         results = await publisher.publish_to_all_channels(message)
         return {"success": True, "results": results}
     
-    # Запускаем тест в новом цикле событий
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    result = loop.run_until_complete(test())
-    loop.close()
-    
-    return jsonify(result)
+    # Запускаем тест в общем цикле событий процесса
+    return jsonify(run_sync(test()))
 
 async def main():
     """Основная функция"""
@@ -285,7 +236,8 @@ async def main():
     
     # Тестируем подключение к боту
     try:
-        bot_info = await publisher.bot.get_me()
+        # Боты публикатора работают в общем цикле процесса вместе с планировщиком
+        bot_info = await run_background(publisher.bot.get_me())
         logger.info(f"✅ Бот подключен: @{bot_info.username}")
     except Exception as e:
         logger.error(f"❌ Ошибка подключения к боту: {e}")
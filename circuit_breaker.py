@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Карантин недоступных каналов
+После BREAKER_THRESHOLD постоянных ошибок канала (бот удален, канал не найден,
+нет прав) рассылка его пропускает и лишь изредка проверяет одной попыткой,
+не тратя запрос, таймаут и строку лога на каждый пост
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from outbox import OUTBOX_PATH
+from retry import SendError
+
+# Импортируем конфигурацию
+try:
+    from config import BREAKER_THRESHOLD, BREAKER_PROBE_HOURS
+except ImportError:
+    # Если config.py недоступен, используем переменные окружения
+    BREAKER_THRESHOLD = int(os.getenv('BREAKER_THRESHOLD', '3'))
+    BREAKER_PROBE_HOURS = float(os.getenv('BREAKER_PROBE_HOURS', '24'))
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+-- channel без типа: SQLite хранит ID канала как есть (число или @username)
+CREATE TABLE IF NOT EXISTS channel_breakers (
+    channel NOT NULL PRIMARY KEY,
+    failures INTEGER NOT NULL,
+    last_error TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    next_probe REAL
+) WITHOUT ROWID;
+"""
+
+# Ошибки, которые говорят о самом канале, а не о конкретном сообщении
+# (ошибка разметки поста не должна отправлять канал в карантин)
+DEAD_CHANNEL_ERRORS = (
+    'chat not found',
+    'bot was kicked',
+    'bot is not a member',
+    'not enough rights',
+    'have no rights',
+    'need administrator rights',
+    'chat_write_forbidden',
+    'channel_private',
+    'group chat was deleted',
+    'chat was deactivated',
+    'user is deactivated',
+    'bot was blocked by the user',
+)
+
+
+def is_dead_channel_error(error: SendError) -> bool:
+    """Постоянная ошибка, означающая, что в канал писать нельзя"""
+    description = error.description.lower()
+    return not error.transient and any(pattern in description for pattern in DEAD_CHANNEL_ERRORS)
+
+
+class CircuitBreaker:
+    """Предохранитель на каждый канал
+
+    Закрыт - канал получает рассылку. После threshold ошибок подряд открыт:
+    канал пропускается, и раз в probe_hours часов одна рассылка проходит
+    в него пробной попыткой. Успех закрывает предохранитель.
+    """
+
+    def __init__(self, path: str = OUTBOX_PATH, threshold: int = BREAKER_THRESHOLD,
+                 probe_hours: float = BREAKER_PROBE_HOURS):
+        self.threshold = threshold
+        self.probe_interval = probe_hours * 3600
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+        # Каналов с ошибками немного, поэтому все состояние держим в памяти
+        self.states: Dict[Any, Dict[str, Any]] = {}
+        self.reload()
+
+    def reload(self):
+        """Перечитывание состояния из базы: его меняют другие процессы и сброс карантина в веб-панели"""
+        with self.lock:
+            self.states = {
+                channel: {
+                    'failures': failures,
+                    'last_error': last_error,
+                    'updated_at': updated_at,
+                    'next_probe': next_probe
+                }
+                for channel, failures, last_error, updated_at, next_probe in self.conn.execute(
+                    "SELECT channel, failures, last_error, updated_at, next_probe FROM channel_breakers"
+                )
+            }
+
+    def _save(self, channel: Any, state: Dict[str, Any]):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO channel_breakers (channel, failures, last_error, updated_at, next_probe) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (channel, state['failures'], state['last_error'], state['updated_at'], state['next_probe'])
+        )
+
+    def should_skip(self, channel: Any) -> bool:
+        """Пропустить ли канал в этой рассылке
+
+        Когда подходит время пробы, канал пропускается в рассылку один раз,
+        а следующая проба откладывается еще на probe_hours.
+        """
+        state = self.states.get(channel)
+        if state is None or state['next_probe'] is None:
+            return False
+
+        with self.lock:
+            now = time.time()
+            if now < state['next_probe']:
+                return True
+
+            state['next_probe'] = now + self.probe_interval
+            self._save(channel, state)
+
+        logger.info(f"🩺 Пробная отправка в канал на карантине {channel}")
+        return False
+
+    def has_failures(self, channel: Any) -> bool:
+        """Есть ли у канала ошибки подряд (в отличие от should_skip, пробу не засчитывает)"""
+        return channel in self.states
+
+    def record_success(self, channel: Any):
+        """Успешная отправка: счетчик ошибок сбрасывается, карантин снимается"""
+        if channel not in self.states:
+            return
+
+        with self.lock:
+            state = self.states.pop(channel, None)
+            self.conn.execute("DELETE FROM channel_breakers WHERE channel = ?", (channel,))
+
+        if state and state['next_probe'] is not None:
+            logger.info(f"✅ Канал {channel} снова доступен, карантин снят")
+
+    def record_failure(self, channel: Any, error: SendError):
+        """Учет ошибки отправки; считаются только ошибки самого канала"""
+        if not is_dead_channel_error(error):
+            return
+
+        with self.lock:
+            now = time.time()
+            state = self.states.setdefault(channel, {'failures': 0, 'next_probe': None})
+            state['failures'] += 1
+            state['last_error'] = error.description
+            state['updated_at'] = now
+
+            opened = state['next_probe'] is None and state['failures'] >= self.threshold
+            if opened:
+                state['next_probe'] = now + self.probe_interval
+            self._save(channel, state)
+
+        if opened:
+            logger.warning(
+                f"🚧 Канал {channel} на карантине после {state['failures']} ошибок подряд ({error.description}), "
+                f"следующая проверка через {self.probe_interval / 3600:g} ч"
+            )
+
+    def reset(self, channel: Any) -> bool:
+        """Снять канал с карантина вручную"""
+        with self.lock:
+            self.states.pop(channel, None)
+            # Карантин мог открыть процесс-исполнитель, поэтому смотрим на базу, а не на память
+            deleted = self.conn.execute("DELETE FROM channel_breakers WHERE channel = ?", (channel,)).rowcount
+        return deleted > 0
+
+    def quarantined(self) -> List[Dict[str, Any]]:
+        """Каналы на карантине для мониторинга
+
+        Читается из базы, а не из памяти: при рассылке в нескольких процессах
+        карантин ведут процессы-исполнители.
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT channel, failures, last_error, updated_at, next_probe FROM channel_breakers "
+                "WHERE next_probe IS NOT NULL ORDER BY updated_at DESC"
+            ).fetchall()
+
+        return [
+            {
+                'channel': channel,
+                'failures': failures,
+                'last_error': last_error,
+                'last_failure': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(updated_at)),
+                'next_probe': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(next_probe))
+            }
+            for channel, failures, last_error, updated_at, next_probe in rows
+        ]
+
+    def close(self):
+        """Закрытие базы"""
+        with self.lock:
+            self.conn.close()
+
+
+# Один предохранитель на процесс: его делят планировщик, polling и веб-интерфейс
+_circuit_breaker: Optional[CircuitBreaker] = None
+_circuit_breaker_lock = threading.Lock()
+
+
+def get_circuit_breaker() -> CircuitBreaker:
+    """Получение общего предохранителя каналов процесса"""
+    global _circuit_breaker
+
+    with _circuit_breaker_lock:
+        if _circuit_breaker is None:
+            _circuit_breaker = CircuitBreaker()
+            quarantined = len(_circuit_breaker.quarantined())
+            if quarantined:
+                logger.info(f"🚧 Каналов на карантине: {quarantined}")
+        return _circuit_breaker
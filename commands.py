@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Таблица команд ботов
+Команда выбирается по имени из словаря, а не цепочкой startswith, и ее
+аргументы разбираются парсером из таблицы. Тексты /start и /help
+собираются один раз при запуске, шаблоны постов сортируются один раз.
+Одна таблица обслуживает ботов на голом Bot API и InteractiveBot.
+"""
+
+import re
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+from media_group import parse_album_command
+
+# /команда или /команда@имя_бота в начале сообщения, дальше пробел или конец текста
+COMMAND_PATTERN = re.compile(r'/([A-Za-z0-9_]+)(?:@([A-Za-z0-9_]+))?(?=\s|$)')
+
+
+def no_args(args: str) -> None:
+    """Команда без аргументов: все после имени команды игнорируется"""
+    return None
+
+
+def text_args(args: str) -> str:
+    """Весь текст после команды (/post)"""
+    return args.strip()
+
+
+def media_args(args: str) -> Tuple[str, str]:
+    """Ссылка или файл и подпись (/photo, /video)"""
+    parts = args.strip().split(' ', 1)
+    return parts[0], parts[1] if len(parts) > 1 else ""
+
+
+class Command(NamedTuple):
+    """Команда бота: имя без "/", разбор аргументов и строки для /start и /help (пустые - не показывать)"""
+    name: str
+    parse: Callable[[str], Any] = no_args
+    summary: str = ''
+    help: str = ''
+
+
+START = Command('start')
+HELP = Command('help', summary="Показать справку", help="<b>/help</b> - Показать эту справку")
+POST = Command(
+    'post', text_args, "Отправить пост во все каналы",
+    "<b>/post</b> - Отправить текст во все каналы\n"
+    "Использование: /post [текст сообщения]\n"
+    "Пример: /post Привет всем!"
+)
+PHOTO = Command(
+    'photo', media_args, "Отправить фото во все каналы",
+    "<b>/photo</b> - Отправить фото во все каналы\n"
+    "Использование: /photo [URL фото или файл из MEDIA_DIR] [подпись]\n"
+    "Пример: /photo https://example.com/photo.jpg Моя фотография"
+)
+VIDEO = Command(
+    'video', media_args, "Отправить видео во все каналы",
+    "<b>/video</b> - Отправить видео во все каналы\n"
+    "Использование: /video [URL видео или файл из MEDIA_DIR] [подпись]\n"
+    "Пример: /video https://example.com/video.mp4 Мое видео"
+)
+ALBUM = Command(
+    'album', parse_album_command, "Отправить альбом во все каналы",
+    "<b>/album</b> - Отправить альбом (от 2 до 10 фото и видео, документов или аудио) во все каналы\n"
+    "Использование: /album [URL или файл] [URL или файл] ... [подпись]\n"
+    "Пример: /album https://example.com/1.jpg https://example.com/2.mp4 Наш альбом"
+)
+STATUS = Command(
+    'status', summary="Проверить статус бота",
+    help="<b>/status</b> - Проверить статус бота\n"
+         "Показывает количество каналов и время следующей публикации"
+)
+
+# Команды текстовых ботов и бота с медиа; порядок - порядок в /start и /help
+TEXT_COMMANDS = (POST, STATUS, HELP, START)
+MEDIA_COMMANDS = (POST, PHOTO, VIDEO, ALBUM, STATUS, HELP, START)
+
+
+def split_command(text: str) -> Optional[Tuple[str, str, str]]:
+    """Имя команды (в нижнем регистре), имя бота после @ и текст аргументов; None, если это не команда"""
+    match = COMMAND_PATTERN.match(text)
+    if match is None:
+        return None
+    return match.group(1).lower(), match.group(2) or '', text[match.end():]
+
+
+def render_start(commands: Iterable[Command], schedule: Iterable[str]) -> str:
+    """Приветствие /start"""
+    return (
+        "\n🤖 <b>Добро пожаловать в бот автопостов!</b>\n\n"
+        "<b>Доступные команды:</b>\n"
+        + "".join(f"/{command.name} - {command.summary}\n" for command in commands if command.summary)
+        + "\n<b>Автоматические посты:</b>\n"
+        "Бот автоматически публикует посты по расписанию:\n"
+        + "".join(f"• {time} МСК\n" for time in schedule)
+    )
+
+
+def render_help(commands: Iterable[Command]) -> str:
+    """Справка /help"""
+    return (
+        "\n📖 <b>Справка по командам:</b>\n\n"
+        + "\n\n".join(command.help for command in commands if command.help)
+        + "\n\n<b>Автоматические посты:</b>\n"
+        "Бот публикует посты по расписанию в указанное время.\n"
+    )
+
+
+class CommandRouter:
+    """Выбор обработчика команды по имени
+
+    Обработчик получает то, что вернул парсер аргументов команды. Обычный
+    текст и неизвестные команды уходят в fallback (если он задан), а
+    команды другому боту (/post@other_bot) игнорируются.
+    """
+
+    def __init__(self, commands: Iterable[Command], handlers: Dict[str, Callable],
+                 schedule: Iterable[str] = (), fallback: Optional[Callable] = None, username: str = ''):
+        self.commands = {command.name: command for command in commands}
+        unknown = set(handlers) - set(self.commands)
+        if unknown:
+            raise ValueError(f"Обработчики для команд не из таблицы: {', '.join(sorted(unknown))}")
+
+        self.handlers = handlers
+        self.fallback = fallback
+        self.username = username
+        self.start_text = render_start(self.commands.values(), schedule)
+        self.help_text = render_help(self.commands.values())
+
+    def names(self) -> Tuple[str, ...]:
+        """Имена команд с обработчиками (для CommandHandler python-telegram-bot)"""
+        return tuple(self.handlers)
+
+    def route(self, text: str) -> Optional[Tuple[Callable, Any]]:
+        """Обработчик сообщения и его аргументы; None - сообщение не для этого бота или обработчика нет"""
+        parts = split_command(text)
+        if parts is None:
+            return (self.fallback, text) if self.fallback else None
+
+        name, username, args = parts
+        if username and self.username and username.lower() != self.username.lower():
+            return None
+
+        handler = self.handlers.get(name)
+        if handler is None:
+            return (self.fallback, text) if self.fallback else None
+        return handler, self.commands[name].parse(args)
+
+
+class PostTemplates:
+    """Шаблоны постов по времени публикации, отсортированные один раз"""
+
+    def __init__(self, templates: Dict[str, dict]):
+        self.templates = templates
+        self.times = sorted(templates)
+        self.default = next(iter(templates.values()), None)
+        # Список шаблонов для /status
+        self.status_lines = "".join(
+            f"• {time} - {templates[time]['text'][:50]}...\n" for time in self.times
+        )
+
+    def upcoming(self, time_str: str) -> Optional[dict]:
+        """Ближайший шаблон не раньше time_str (ЧЧ:ММ); после последнего - первый шаблон"""
+        index = bisect_left(self.times, time_str)
+        return self.templates[self.times[index]] if index < len(self.times) else self.default
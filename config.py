@@ -72,3 +72,102 @@ POST_TEMPLATES = {
 # Настройки логирования
 LOG_LEVEL = 'INFO'
 LOG_FILE = 'bot.log'
+
+# Параллельная рассылка: сколько каналов обрабатывается одновременно
+# и сколько секунд ждать ответа от одного канала
+FANOUT_CONCURRENCY = int(os.getenv('FANOUT_CONCURRENCY', '20'))
+FANOUT_TIMEOUT = float(os.getenv('FANOUT_TIMEOUT', '15'))
+
+# Ограничения Telegram на отправку: всего сообщений в секунду,
+# сообщений в секунду в один личный чат и сообщений в минуту в один канал
+RATE_LIMIT_GLOBAL = float(os.getenv('RATE_LIMIT_GLOBAL', '30'))
+RATE_LIMIT_PER_CHAT = float(os.getenv('RATE_LIMIT_PER_CHAT', '1'))
+RATE_LIMIT_PER_GROUP = float(os.getenv('RATE_LIMIT_PER_GROUP', '20'))
+
+# Повторная отправка при временных ошибках (429, 5xx, сеть):
+# число попыток, начальная и максимальная задержка в секундах
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', '5'))
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', '1'))
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '30'))
+
+# Очередь доставки на диске (SQLite): файл базы, размер пачки и сколько минут
+# после пропущенного из-за простоя слота расписания его еще стоит опубликовать
+OUTBOX_PATH = os.getenv('OUTBOX_PATH', 'outbox.db')
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '500'))
+OUTBOX_CATCHUP_MINUTES = int(os.getenv('OUTBOX_CATCHUP_MINUTES', '30'))
+
+# Ход ручной рассылки (/post): сообщение оператору обновляется
+# не чаще одного раза в столько секунд
+PROGRESS_UPDATE_INTERVAL = float(os.getenv('PROGRESS_UPDATE_INTERVAL', '1'))
+
+# Дополнительные боты для рассылки (токены через запятую). Лимиты Telegram
+# считаются на бота, поэтому каждый канал закрепляется за ботом-администратором
+# и общая скорость растет с числом ботов. Закрепление перепроверяется
+# раз в SHARD_REFRESH_HOURS часов
+BOT_EXTRA_TOKENS = [token.strip() for token in os.getenv('BOT_EXTRA_TOKENS', '').split(',') if token.strip()]
+SHARD_REFRESH_HOURS = float(os.getenv('SHARD_REFRESH_HOURS', '24'))
+
+# Рассылка в нескольких процессах для тысяч каналов: каналы делятся между
+# PUBLISH_WORKERS процессами по хешу (0 или 1 - рассылка в одном процессе)
+PUBLISH_WORKERS = int(os.getenv('PUBLISH_WORKERS', '0'))
+
+# Карантин недоступных каналов: после стольких постоянных ошибок подряд канал пропускается,
+# и раз в BREAKER_PROBE_HOURS часов в него делается пробная отправка
+BREAKER_THRESHOLD = int(os.getenv('BREAKER_THRESHOLD', '3'))
+BREAKER_PROBE_HOURS = float(os.getenv('BREAKER_PROBE_HOURS', '24'))
+
+# Адрес Bot API: для нагрузочных проверок без настоящих каналов укажите
+# локальный сервер из fake_bot_api.py (например, http://127.0.0.1:8081)
+BOT_API_URL = os.getenv('BOT_API_URL', 'https://api.telegram.org')
+
+# Папка с медиа на диске: /photo и /video принимают путь к файлу из нее
+# (файлы вне папки не отправляются), файл загружается в Telegram частями
+MEDIA_DIR = os.getenv('MEDIA_DIR', 'media')
+
+# Кэш медиа на диске: ссылки и файлы из MEDIA_DIR сохраняются по SHA-256
+# содержимого и скачиваются один раз; при превышении MEDIA_CACHE_MAX_MB
+# удаляются файлы, которые дольше всех не публиковались. В POST_TEMPLATES
+# можно публиковать медиа: 'media_type' ('photo', 'video', 'document'),
+# 'media_url' (ссылка, файл из MEDIA_DIR или sha256:<хеш>) и подпись в 'text'
+MEDIA_CACHE_DIR = os.getenv('MEDIA_CACHE_DIR', 'media_cache')
+MEDIA_CACHE_MAX_MB = float(os.getenv('MEDIA_CACHE_MAX_MB', '500'))
+
+# Скачивание ссылок медиа в кэш: только http/https и только публичные адреса
+# (не сети сервера); скачивание целиком ограничено MEDIA_DOWNLOAD_TIMEOUT секунд
+MEDIA_DOWNLOAD_TIMEOUT = float(os.getenv('MEDIA_DOWNLOAD_TIMEOUT', '120'))
+
+# Подготовка фото перед загрузкой (нужен Pillow): фото уменьшается до
+# IMAGE_MAX_SIDE точек по длинной стороне, метаданные удаляются, и оно
+# пережимается в JPEG с качеством IMAGE_QUALITY в IMAGE_WORKERS процессах.
+# Результат хранится в кэше медиа, каждое фото обрабатывается один раз
+IMAGE_PREPROCESS = os.getenv('IMAGE_PREPROCESS', 'true').lower() in ('1', 'true', 'yes')
+IMAGE_MAX_SIDE = int(os.getenv('IMAGE_MAX_SIDE', '2560'))
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', '87'))
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '2'))
+
+# Long polling ботов на голом Bot API: запрос getUpdates ждет обновлений на
+# стороне Telegram до POLL_TIMEOUT секунд, приходят только типы обновлений из
+# POLL_ALLOWED_UPDATES (через запятую), после ошибок пауза растет до POLL_BACKOFF_MAX
+POLL_TIMEOUT = int(os.getenv('POLL_TIMEOUT', '50'))
+POLL_ALLOWED_UPDATES = [kind.strip() for kind in os.getenv('POLL_ALLOWED_UPDATES', 'message').split(',') if kind.strip()]
+POLL_BACKOFF_MAX = float(os.getenv('POLL_BACKOFF_MAX', '60'))
+
+# Webhook вместо polling (нужен aiohttp): если задан WEBHOOK_URL (например,
+# https://my-bot.onrender.com), Telegram присылает обновления на
+# WEBHOOK_URL + WEBHOOK_PATH, а бот слушает WEBHOOK_LISTEN:WEBHOOK_PORT.
+# Запросы без секрета WEBHOOK_SECRET (по умолчанию - хеш токена) отклоняются;
+# в ботах на python-telegram-bot обновления обрабатываются параллельно, до
+# WEBHOOK_WORKERS одновременно (у ботов на голом Bot API - DISPATCH_WORKERS ниже)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', os.getenv('PORT', '8080')))
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '8'))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+
+# Команды ботов на голом Bot API выполняются вне цикла polling: быстрые - в
+# DISPATCH_WORKERS потоках, рассылки (/post, /photo, /video, /album) - в
+# DISPATCH_BROADCAST_WORKERS; внутри чата команды идут по порядку
+DISPATCH_WORKERS = int(os.getenv('DISPATCH_WORKERS', '8'))
+DISPATCH_BROADCAST_WORKERS = int(os.getenv('DISPATCH_BROADCAST_WORKERS', '2'))
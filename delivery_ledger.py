@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Журнал доставленных сообщений
+Для каждой пары (пост, канал) хранит message_id, который вернул Telegram,
+чтобы повторы и досылка после перезапуска не публиковали пост дважды
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from outbox import OUTBOX_PATH
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+-- channel без типа: SQLite хранит ID канала как есть (число или @username)
+CREATE TABLE IF NOT EXISTS ledger (
+    post_id INTEGER NOT NULL,
+    channel NOT NULL,
+    message_id INTEGER,
+    delivered_at REAL NOT NULL,
+    PRIMARY KEY (post_id, channel)
+) WITHOUT ROWID;
+"""
+
+# Сколько последних постов держать в памяти
+CACHED_POSTS = 16
+
+
+class DeliveryLedger:
+    """Журнал доставок: (id поста, канал) -> message_id"""
+
+    def __init__(self, path: str = OUTBOX_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        # Доставки последних постов: проверка перед отправкой - обычный поиск в словаре
+        self.cache: "OrderedDict[int, Dict[Any, Optional[int]]]" = OrderedDict()
+
+    def _post_deliveries(self, post_id: int) -> Dict[Any, Optional[int]]:
+        """Доставки поста из кэша; при первом обращении читаются из базы одним запросом"""
+        deliveries = self.cache.get(post_id)
+        if deliveries is None:
+            rows = self.conn.execute(
+                "SELECT channel, message_id FROM ledger WHERE post_id = ?", (post_id,)
+            ).fetchall()
+            deliveries = self.cache[post_id] = dict(rows)
+            if len(self.cache) > CACHED_POSTS:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(post_id)
+        return deliveries
+
+    def is_delivered(self, post_id: int, channel: Any) -> bool:
+        """Был ли пост уже доставлен в канал"""
+        with self.lock:
+            return channel in self._post_deliveries(post_id)
+
+    def get(self, post_id: int, channel: Any) -> Optional[int]:
+        """message_id поста в канале (None, если пост туда не доставлен)"""
+        with self.lock:
+            return self._post_deliveries(post_id).get(channel)
+
+    def record(self, post_id: int, channel: Any, message_id: Optional[int]):
+        """Запись успешной доставки"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO ledger (post_id, channel, message_id, delivered_at) VALUES (?, ?, ?, ?)",
+                (post_id, channel, message_id, time.time())
+            )
+            self._post_deliveries(post_id)[channel] = message_id
+
+    def reload(self):
+        """Сброс кэша: доставки, записанные другими процессами, перечитываются из базы"""
+        with self.lock:
+            self.cache.clear()
+
+    def messages(self, post_id: int) -> Dict[Any, Optional[int]]:
+        """Все доставки поста {канал: message_id} - для редактирования и удаления"""
+        with self.lock:
+            return dict(self._post_deliveries(post_id))
+
+    def close(self):
+        """Закрытие базы"""
+        with self.lock:
+            self.conn.close()
+
+
+# Один журнал на процесс: его делят планировщик, polling и веб-интерфейс
+_ledger: Optional[DeliveryLedger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger() -> DeliveryLedger:
+    """Получение общего журнала доставок процесса"""
+    global _ledger
+
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = DeliveryLedger()
+        return _ledger
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Обработка обновлений вне цикла polling
+Команды выполняются в пуле потоков, а не в цикле getUpdates, поэтому
+рассылка /video в 30 каналов не задерживает /status. Порядок внутри чата
+сохраняется отдельно для рассылок и для быстрых команд: следующая рассылка
+чата начинается после предыдущей, быстрые команды чата идут по очереди
+между собой. Рассылки идут в отдельном небольшом пуле, и быстрые команды
+никогда не ждут свободного потока за ними.
+"""
+
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, Tuple
+
+from commands import split_command
+
+# Импортируем конфигурацию
+try:
+    from config import DISPATCH_WORKERS, DISPATCH_BROADCAST_WORKERS
+except ImportError:
+    # Если config.py недоступен, используем переменные окружения
+    DISPATCH_WORKERS = int(os.getenv('DISPATCH_WORKERS', '8'))
+    DISPATCH_BROADCAST_WORKERS = int(os.getenv('DISPATCH_BROADCAST_WORKERS', '2'))
+
+logger = logging.getLogger(__name__)
+
+
+def update_command(update: dict) -> str:
+    """Команда обновления без имени бота (/post@my_bot -> /post); пустая строка, если это не команда"""
+    parts = split_command((update.get('message') or {}).get('text') or '')
+    return f"/{parts[0]}" if parts else ''
+
+
+def update_chat(update: dict) -> Any:
+    """ID чата обновления (None - обновление не из чата)"""
+    return ((update.get('message') or {}).get('chat') or {}).get('id')
+
+
+class ChatDispatcher:
+    """Обработка обновлений в пулах потоков с сохранением порядка внутри чата
+
+    Обновления одного чата и одной очереди (рассылки или быстрые команды)
+    выполняются по одному в порядке поступления, разные чаты - параллельно.
+
+    Порядок между очередями одного чата намеренно не сохраняется: /status,
+    отправленный после /post, отвечает сразу, не дожидаясь конца рассылки,
+    а /post после /status может закончиться раньше его ответа. Быстрые
+    команды только читают состояние, поэтому на рассылки это не влияет.
+    Порядок ключом (очередь, чат), а не чатом, - это цена того, что медленная
+    рассылка никогда не задерживает быстрые команды.
+    """
+
+    def __init__(self, handler: Callable[[dict], None], broadcast_commands: Iterable[str] = (),
+                 workers: int = DISPATCH_WORKERS, broadcast_workers: int = DISPATCH_BROADCAST_WORKERS):
+        self.handler = handler
+        self.broadcast_commands = frozenset(broadcast_commands)
+        self.executors = {
+            'fast': ThreadPoolExecutor(max(1, workers), thread_name_prefix='dispatch'),
+            'broadcast': ThreadPoolExecutor(max(1, broadcast_workers), thread_name_prefix='dispatch-broadcast')
+        }
+        self.lock = threading.Lock()
+        # Очереди чатов, у которых сейчас выполняется команда: (очередь, чат) -> ожидающие обновления
+        self.waiting: Dict[Tuple[str, Any], Deque[dict]] = {}
+        # Принятые, но еще не начатые обновления (их offset уже сохранен)
+        self.queued = 0
+
+    def submit(self, update: dict):
+        """Передача обновления в обработку; возвращается сразу"""
+        lane = 'broadcast' if update_command(update) in self.broadcast_commands else 'fast'
+        key = (lane, update_chat(update))
+
+        with self.lock:
+            self.queued += 1
+            waiting = self.waiting.get(key)
+            if waiting is not None:
+                waiting.append(update)
+                return
+            self.waiting[key] = deque()
+
+        self.executors[lane].submit(self._run, key, update)
+
+    def _run(self, key: Tuple[str, Any], update: dict):
+        """Выполнение обновлений чата по очереди, пока они не кончатся"""
+        while True:
+            with self.lock:
+                self.queued -= 1
+            try:
+                self.handler(update)
+            except Exception as e:
+                logger.error(f"❌ Ошибка обработки обновления {update.get('update_id')}: {e}")
+
+            with self.lock:
+                waiting = self.waiting[key]
+                if not waiting:
+                    del self.waiting[key]
+                    return
+                update = waiting.popleft()
+
+    def shutdown(self, wait: bool = True):
+        """Остановка пулов; wait=True дожидается начатых команд"""
+        with self.lock:
+            queued = self.queued
+        if queued and not wait:
+            logger.warning(f"⚠️ {queued} принятых команд не выполнено: после перезапуска Telegram их не пришлет")
+        for executor in self.executors.values():
+            executor.shutdown(wait=wait)
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Локальная замена Telegram Bot API для нагрузочных проверок
+Отвечает на sendMessage, sendPhoto, sendVideo, sendDocument, sendAudio, sendMediaGroup,
+getUpdates, getMe и getChat так же, как Telegram, но без настоящих каналов;
+задержка ответа, доля ответов 429 и доля ошибок настраиваются.
+
+Запуск: python fake_bot_api.py, затем BOT_API_URL=http://127.0.0.1:8081
+для любого из ботов. Настройки - переменные окружения FAKE_API_*.
+"""
+
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+# Настройки берутся только из переменных окружения: сервер нужен для проверок, а не для работы бота
+FAKE_API_HOST = os.getenv('FAKE_API_HOST', '127.0.0.1')
+FAKE_API_PORT = int(os.getenv('FAKE_API_PORT', '8081'))
+FAKE_API_LATENCY = float(os.getenv('FAKE_API_LATENCY', '0.05'))
+FAKE_API_RATE_429 = float(os.getenv('FAKE_API_RATE_429', '0'))
+FAKE_API_RETRY_AFTER = int(os.getenv('FAKE_API_RETRY_AFTER', '1'))
+FAKE_API_ERROR_RATE = float(os.getenv('FAKE_API_ERROR_RATE', '0'))
+FAKE_API_DEAD_CHATS = [chat.strip() for chat in os.getenv('FAKE_API_DEAD_CHATS', '').split(',') if chat.strip()]
+
+logger = logging.getLogger(__name__)
+
+# Методы, которые публикуют или меняют сообщения: только к ним применяются 429 и ошибки
+SEND_METHODS = ('sendMessage', 'sendPhoto', 'sendVideo', 'sendDocument', 'sendAudio', 'sendMediaGroup', 'editMessageText')
+
+# Поле запроса и поле ответа для каждого типа медиа
+MEDIA_FIELDS = {
+    'sendPhoto': 'photo',
+    'sendVideo': 'video',
+    'sendDocument': 'document',
+    'sendAudio': 'audio',
+}
+
+
+class BotAPIError(Exception):
+    """Ответ Bot API с ошибкой"""
+
+    def __init__(self, code: int, description: str, retry_after: Optional[int] = None):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+        self.retry_after = retry_after
+
+    def payload(self) -> Dict[str, Any]:
+        payload = {'ok': False, 'error_code': self.code, 'description': self.description}
+        if self.retry_after:
+            payload['parameters'] = {'retry_after': self.retry_after}
+        return payload
+
+
+class _Server(ThreadingHTTPServer):
+    # Рассылка открывает десятки соединений разом, очередь по умолчанию (5) их не вмещает
+    request_queue_size = 1024
+    daemon_threads = True
+
+
+class FakeBotAPI:
+    """Сервер, отвечающий как Bot API
+
+    Каждый запрос обслуживается в своем потоке, поэтому задержка ответа
+    не мешает параллельным запросам, как и у настоящего Telegram.
+    """
+
+    def __init__(self, host: str = FAKE_API_HOST, port: int = FAKE_API_PORT, latency: float = FAKE_API_LATENCY,
+                 rate_429: float = FAKE_API_RATE_429, retry_after: int = FAKE_API_RETRY_AFTER,
+                 error_rate: float = FAKE_API_ERROR_RATE, dead_chats: Iterable[Any] = FAKE_API_DEAD_CHATS):
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.dead_chats = {str(chat) for chat in dead_chats}
+
+        self.lock = threading.Lock()
+        self.updates_ready = threading.Condition(self.lock)
+        self.updates: List[Dict[str, Any]] = []
+        self.update_ids = itertools.count(1)
+        self.message_ids: Dict[str, itertools.count] = {}
+        self.file_ids = itertools.count(1)
+        self.files: Dict[str, int] = {}
+        # Счетчики запросов {метод: число} и ответов {код: число}
+        self.calls: Counter = Counter()
+        self.responses: Counter = Counter()
+
+        self.server = _Server((host, port), self._handler())
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Адрес для BOT_API_URL"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        """Запуск в фоновом потоке, возвращает адрес для BOT_API_URL"""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f"🧪 Локальный Bot API запущен: {self.url}")
+        return self.url
+
+    def stop(self):
+        """Остановка сервера"""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_update(self, text: str, chat_id: int = 1, user_id: int = 1) -> Dict[str, Any]:
+        """Добавление входящего сообщения, которое бот получит через getUpdates"""
+        with self.updates_ready:
+            update = {
+                'update_id': next(self.update_ids),
+                'message': {
+                    'message_id': self._next_message_id(chat_id),
+                    'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'private'},
+                    'from': {'id': user_id, 'is_bot': False, 'first_name': 'Оператор'},
+                    'text': text
+                }
+            }
+            self.updates.append(update)
+            self.updates_ready.notify_all()
+        return update
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики запросов для отчетов нагрузочных проверок"""
+        with self.lock:
+            return {
+                'calls': dict(self.calls),
+                'responses': {str(code): count for code, count in self.responses.items()},
+                'files': len(self.files)
+            }
+
+    def _next_message_id(self, chat_id: Any) -> int:
+        counter = self.message_ids.setdefault(str(chat_id), itertools.count(1))
+        return next(counter)
+
+    def _message(self, chat_id: Any, **fields) -> Dict[str, Any]:
+        with self.lock:
+            message_id = self._next_message_id(chat_id)
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': _chat_id(chat_id), 'type': 'channel'}
+        }
+        message.update(fields)
+        return message
+
+    def _media(self, kind: str, media: Any, files: Dict[str, bytes]) -> Dict[str, Any]:
+        """Описание медиа в ответе: известный file_id возвращается как есть, иначе это новая загрузка"""
+        if isinstance(media, str) and media.startswith('attach://'):
+            media = files.get(media[len('attach://'):], b'')
+
+        with self.lock:
+            if isinstance(media, str) and media in self.files:
+                file_id = media
+            else:
+                file_id = f"fake-{kind}-{next(self.file_ids)}"
+                self.files[file_id] = len(media) if isinstance(media, bytes) else 0
+            size = self.files[file_id]
+
+        description = {'file_id': file_id, 'file_unique_id': file_id, 'file_size': size}
+        if kind == 'photo':
+            # Telegram возвращает фото в нескольких размерах
+            return {'photo': [dict(description, width=320, height=240), dict(description, width=1280, height=960)]}
+        if kind == 'video':
+            description.update(width=1280, height=720, duration=10)
+        if kind == 'audio':
+            description.update(duration=180)
+        return {kind: description}
+
+    def _check_chat(self, chat_id: Any):
+        if chat_id is None:
+            raise BotAPIError(400, "Bad Request: chat_id is empty")
+        if str(chat_id) in self.dead_chats:
+            raise BotAPIError(403, "Forbidden: bot was kicked from the channel chat")
+
+    def _inject_failure(self):
+        """Случайный ответ 429 или ошибка сервера с заданной долей"""
+        roll = random.random()
+        if roll < self.rate_429:
+            raise BotAPIError(429, f"Too Many Requests: retry after {self.retry_after}", self.retry_after)
+        if roll < self.rate_429 + self.error_rate:
+            raise BotAPIError(500, "Internal Server Error")
+
+    def call(self, token: str, method: str, params: Dict[str, Any], files: Dict[str, bytes]) -> Any:
+        """Выполнение метода Bot API, возвращает поле result ответа"""
+        with self.lock:
+            self.calls[method] += 1
+
+        if method in SEND_METHODS:
+            self._check_chat(params.get('chat_id'))
+            self._inject_failure()
+
+        chat_id = params.get('chat_id')
+
+        if method == 'getMe':
+            bot_id = _bot_id(token)
+            return {'id': bot_id, 'is_bot': True, 'first_name': 'Fake Bot', 'username': f"fake_{bot_id}_bot"}
+        if method == 'getChat':
+            return {
+                'id': _chat_id(chat_id),
+                'type': 'channel',
+                'title': f"Канал {chat_id}",
+                # Обязательные поля ChatFullInfo в новых версиях Bot API
+                'accent_color_id': 0,
+                'max_reaction_count': 11
+            }
+        if method == 'getChatMember':
+            return {'status': 'administrator', 'user': {'id': _int(params.get('user_id')), 'is_bot': True}}
+        if method == 'getUpdates':
+            return self._get_updates(params)
+        if method in ('setWebhook', 'deleteWebhook'):
+            return True
+        if method == 'sendMessage':
+            return self._message(chat_id, text=params.get('text', ''))
+        if method == 'editMessageText':
+            return self._message(chat_id, text=params.get('text', ''))
+        if method in MEDIA_FIELDS:
+            kind = MEDIA_FIELDS[method]
+            media = files.get(kind, params.get(kind))
+            if media is None:
+                raise BotAPIError(400, f"Bad Request: there is no {kind} in the request")
+            return self._message(chat_id, caption=params.get('caption', ''), **self._media(kind, media, files))
+        if method == 'sendMediaGroup':
+            return self._send_media_group(chat_id, params, files)
+
+        raise BotAPIError(404, "Not Found: method not found")
+
+    def _send_media_group(self, chat_id: Any, params: Dict[str, Any], files: Dict[str, bytes]) -> List[Dict[str, Any]]:
+        media = params.get('media')
+        if isinstance(media, str):
+            media = json.loads(media)
+        if not isinstance(media, list) or not 2 <= len(media) <= 10:
+            raise BotAPIError(400, "Bad Request: media group must include 2-10 items")
+
+        group_id = str(next(self.file_ids))
+        return [
+            self._message(chat_id, media_group_id=group_id, caption=item.get('caption', ''),
+                          **self._media(item.get('type', 'photo'), item.get('media'), files))
+            for item in media
+        ]
+
+    def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Длинный опрос: ответ приходит, как только есть обновления, или через timeout секунд"""
+        offset = _int(params.get('offset')) or 0
+        timeout = float(params.get('timeout') or 0)
+        deadline = time.monotonic() + timeout
+
+        with self.updates_ready:
+            # Обновления до offset подтверждены ботом
+            self.updates = [update for update in self.updates if update['update_id'] >= offset]
+            while not self.updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.updates_ready.wait(remaining)
+            return list(self.updates[:_int(params.get('limit')) or 100])
+
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, как у настоящего Bot API
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+            def do_GET(self):
+                self._handle()
+
+            def do_POST(self):
+                self._handle()
+
+            def _handle(self):
+                path = urlsplit(self.path)
+                if path.path == '/stats':
+                    return self._reply(200, api.stats())
+
+                token, method = _parse_path(path.path)
+                if token is None:
+                    return self._reply(404, {'ok': False, 'error_code': 404, 'description': "Not Found"})
+
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                params, files = _parse_body(self.headers.get('Content-Type', ''), body)
+                params.update(parse_qsl(path.query))
+
+                if method in SEND_METHODS and api.latency:
+                    time.sleep(random.uniform(0.5, 1.5) * api.latency)
+
+                try:
+                    self._reply(200, {'ok': True, 'result': api.call(token, method, params, files)})
+                except BotAPIError as e:
+                    self._reply(e.code, e.payload())
+
+            def _reply(self, code: int, payload: Dict[str, Any]):
+                with api.lock:
+                    api.responses[code] += 1
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def _int(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _chat_id(chat_id: Any) -> Any:
+    """ID чата в ответе: число, если это число, иначе @username как есть"""
+    number = _int(chat_id)
+    return chat_id if number is None else number
+
+
+def _bot_id(token: str) -> int:
+    return _int(token.split(':', 1)[0]) or 1
+
+
+def _parse_path(path: str) -> Tuple[Optional[str], Optional[str]]:
+    """Токен и метод из пути /bot<токен>/<метод>"""
+    parts = path.strip('/').split('/')
+    if len(parts) != 2 or not parts[0].startswith('bot'):
+        return None, None
+    return parts[0][len('bot'):], parts[1]
+
+
+def _parse_body(content_type: str, body: bytes) -> Tuple[Dict[str, Any], Dict[str, bytes]]:
+    """Поля запроса и загруженные файлы из формы, multipart или JSON"""
+    if not body:
+        return {}, {}
+
+    if content_type.startswith('application/json'):
+        return json.loads(body), {}
+
+    if content_type.startswith('multipart/form-data'):
+        message = BytesParser(policy=HTTP).parsebytes(
+            b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body
+        )
+        params: Dict[str, Any] = {}
+        files: Dict[str, bytes] = {}
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if part.get_filename() is not None:
+                files[name] = part.get_payload(decode=True)
+            else:
+                # Поля формы ботов - в UTF-8 без указания charset
+                params[name] = part.get_payload(decode=True).decode('utf-8')
+        return params, files
+
+    return dict(parse_qsl(body.decode('utf-8'), keep_blank_values=True)), {}
+
+
+def main():
+    """Запуск сервера в текущем процессе"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    api = FakeBotAPI()
+    logger.info(f"🧪 Локальный Bot API: {api.url}")
+    logger.info(f"⏱ Задержка: {api.latency} сек, 429: {api.rate_429:.0%}, ошибки: {api.error_rate:.0%}")
+    logger.info(f"👉 Для ботов: BOT_API_URL={api.url}, счетчики запросов: {api.url}/stats")
+
+    try:
+        api.server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("👋 Локальный Bot API остановлен")
+    finally:
+        api.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Параллельная рассылка сообщений по каналам
+Ограничивает число одновременных запросов и время ожидания каждого канала
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from rate_limiter import RateLimiter
+from retry import RetryPolicy, classify_exception, unknown_outcome
+
+# Импортируем конфигурацию
+try:
+    from config import FANOUT_CONCURRENCY, FANOUT_TIMEOUT, BOT_API_URL
+except ImportError:
+    # Если config.py недоступен, используем переменные окружения
+    FANOUT_CONCURRENCY = int(os.getenv('FANOUT_CONCURRENCY', '20'))
+    FANOUT_TIMEOUT = float(os.getenv('FANOUT_TIMEOUT', '15'))
+    BOT_API_URL = os.getenv('BOT_API_URL', 'https://api.telegram.org')
+
+logger = logging.getLogger(__name__)
+
+# Адреса Bot API без токена (в python-telegram-bot токен дописывается к ним)
+BOT_API_BASE_URL = f"{BOT_API_URL.rstrip('/')}/bot"
+BOT_API_FILE_URL = f"{BOT_API_URL.rstrip('/')}/file/bot"
+
+
+def bot_api_url(bot_token: str) -> str:
+    """Адрес методов Bot API для бота (BOT_API_URL можно направить на локальный сервер)"""
+    return f"{BOT_API_BASE_URL}{bot_token}"
+
+
+def create_bot(bot_token: str, pool_size: int = FANOUT_CONCURRENCY):
+    """Создание Bot с пулом соединений под параллельную рассылку"""
+    from telegram import Bot
+
+    try:
+        # python-telegram-bot 20.x: по умолчанию в пуле всего одно соединение
+        from telegram.request import HTTPXRequest
+    except ImportError:
+        # python-telegram-bot 13.x
+        return Bot(token=bot_token, base_url=BOT_API_BASE_URL, base_file_url=BOT_API_FILE_URL)
+
+    request = HTTPXRequest(connection_pool_size=pool_size)
+    return Bot(token=bot_token, base_url=BOT_API_BASE_URL, base_file_url=BOT_API_FILE_URL, request=request)
+
+
+def create_session(pool_size: int = FANOUT_CONCURRENCY):
+    """Сессия requests с keep-alive для ботов на голом Bot API
+
+    Соединение с Bot API переиспользуется, и каждый запрос стоит
+    один обмен вместо TCP- и TLS-рукопожатия; пул рассчитан на pool_size
+    одновременных запросов (рассылка, polling и планировщик делят сессию).
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    # Хост один (BOT_API_URL), поэтому важен размер пула, а не число пулов
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class FanOutProgress(NamedTuple):
+    """Результат одного канала вместе с общим ходом рассылки
+
+    В итоговой сводке, которая приходит последней, channel равен None.
+    """
+    channel: Any
+    success: bool
+    done: int
+    total: int
+    successful: int
+    elapsed: float
+
+    @property
+    def failed(self) -> int:
+        return self.done - self.successful
+
+    @property
+    def is_summary(self) -> bool:
+        return self.channel is None
+
+    @property
+    def remaining(self) -> Optional[float]:
+        """Оценка оставшегося времени в секундах по средней скорости (None, пока оценивать не по чему)"""
+        if not self.done or self.done >= self.total:
+            return None
+        return self.elapsed / self.done * (self.total - self.done)
+
+
+class ProgressCounter:
+    """Счетчики хода рассылки для потока результатов (канал, успех)"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.successful = 0
+        self.started = time.monotonic()
+
+    def add(self, channel: Any, success: bool) -> FanOutProgress:
+        """Учет результата канала"""
+        self.done += 1
+        self.successful += 1 if success else 0
+        return FanOutProgress(channel, success, self.done, self.total, self.successful, time.monotonic() - self.started)
+
+    def summary(self) -> FanOutProgress:
+        """Итоговая сводка"""
+        return FanOutProgress(
+            None, self.successful == self.done, self.done, self.total, self.successful, time.monotonic() - self.started
+        )
+
+
+async def iter_fan_out(
+    channels: Iterable[Any],
+    send: Callable[[Any], Awaitable[bool]],
+    concurrency: Optional[int] = None,
+    timeout: Optional[float] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    retry_policy: Optional[RetryPolicy] = None,
+    skip: Optional[Callable[[Any], bool]] = None
+) -> AsyncIterator[Tuple[Any, bool]]:
+    """Параллельная отправка во все каналы с выдачей (канал, успех) по мере готовности
+
+    Одновременно выполняется не более concurrency запросов, каждый канал
+    ограничен timeout секундами. Ожидание в rate_limiter в таймаут не входит.
+    Временные ошибки (SendError с transient: 429, 5xx, нет соединения)
+    повторяются по retry_policy; пауза перед повтором не занимает слот
+    параллельности. Таймаут не повторяется: запрос мог дойти до Telegram.
+    Каналы, для которых skip(channel) истинно, сразу получают неудачу без
+    запроса и без места в rate_limiter. Каналы берутся из channels
+    постепенно, поэтому память не растет с длиной списка.
+    """
+    concurrency = concurrency or FANOUT_CONCURRENCY
+    timeout = timeout or FANOUT_TIMEOUT
+    semaphore = asyncio.Semaphore(concurrency)
+    # Запас задач сверх concurrency занимает слоты, пока другие каналы ждут повтора
+    max_pending = concurrency * 4
+
+    async def attempt_send(channel) -> bool:
+        async with semaphore:
+            if rate_limiter:
+                await rate_limiter.acquire_async(channel)
+            try:
+                return await asyncio.wait_for(send(channel), timeout)
+            except asyncio.TimeoutError as e:
+                # Запрос мог уже дойти до Telegram: повтор опубликовал бы пост второй раз
+                raise unknown_outcome(TimeoutError(f"Таймаут {timeout} сек")) from e
+
+    async def run(channel):
+        attempt = 1
+        while True:
+            try:
+                return channel, await attempt_send(channel)
+            except Exception as e:
+                error = classify_exception(e)
+
+            if error.retry_after and rate_limiter:
+                rate_limiter.penalize(channel, error.retry_after)
+
+            if not retry_policy or not retry_policy.should_retry(error, attempt):
+                logger.error(f"❌ Ошибка при обработке канала {channel}: {error}")
+                return channel, False
+
+            delay = retry_policy.delay(attempt, error.retry_after)
+            logger.warning(f"🔁 Повтор отправки в {channel} через {delay:.1f} сек (попытка {attempt + 1}/{retry_policy.max_attempts}): {error}")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    remaining = iter(channels)
+    pending = set()
+
+    try:
+        while True:
+            for channel in remaining:
+                if skip and skip(channel):
+                    yield channel, False
+                    continue
+                pending.add(asyncio.ensure_future(run(channel)))
+                if len(pending) >= max_pending:
+                    break
+
+            if not pending:
+                return
+
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        # Потребитель прервал перебор - отменяем оставшиеся отправки и дожидаемся отмены
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def iter_fan_out_leaders(
+    channels: List[Any],
+    pick_leaders: Callable[[List[Any]], List[Any]],
+    rounds: int,
+    fan_out: Callable[[List[Any]], AsyncIterator[Tuple[Any, bool]]]
+) -> AsyncIterator[Tuple[Any, bool]]:
+    """Рассылка, в которой сначала отправляются каналы из pick_leaders, а затем все остальные
+
+    Так медиа загружается в первый канал каждого бота, а остальные каналы
+    получают его по file_id. pick_leaders(оставшиеся каналы) вызывается
+    перед каждым кругом и возвращает пустой список, когда первые отправки
+    удались; всего не больше rounds кругов. fan_out(каналы) - поток (канал, успех).
+    """
+    while True:
+        leaders = pick_leaders(channels) if rounds > 0 else []
+        if leaders:
+            # Если отправка не удалась, в следующем круге pick_leaders выберет другой канал
+            rounds -= 1
+            batch = leaders
+            channels = [channel for channel in channels if channel not in leaders]
+        else:
+            batch, channels = channels, []
+
+        results = fan_out(batch)
+        try:
+            async for result in results:
+                yield result
+        finally:
+            await results.aclose()
+
+        if not channels:
+            return
+
+
+async def track_progress(results: AsyncIterator[Tuple[Any, bool]], total: int) -> AsyncIterator[FanOutProgress]:
+    """Добавление к потоку результатов счетчиков и итоговой сводки"""
+    counter = ProgressCounter(total)
+
+    try:
+        async for channel, success in results:
+            yield counter.add(channel, success)
+    finally:
+        # При прерванном переборе исходный поток закрывается сразу, а не сборщиком мусора
+        await results.aclose()
+
+    yield counter.summary()
+
+
+async def fan_out(
+    channels: Iterable[Any],
+    send: Callable[[Any], Awaitable[bool]],
+    concurrency: Optional[int] = None,
+    timeout: Optional[float] = None,
+    rate_limiter: Optional[RateLimiter] = None,
+    retry_policy: Optional[RetryPolicy] = None,
+    skip: Optional[Callable[[Any], bool]] = None
+) -> Dict[Any, bool]:
+    """Параллельная отправка во все каналы; результаты собираются в порядке завершения"""
+    results = {}
+    async for channel, success in iter_fan_out(channels, send, concurrency, timeout, rate_limiter, retry_policy, skip):
+        results[channel] = success
+
+    return results
+
+
+# Один постоянный цикл событий на процесс для синхронного кода (потоки Flask, планировщик)
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_background_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """Общий цикл событий процесса, работающий в отдельном потоке
+
+    Bot из python-telegram-bot и сессия aiohttp держат соединения,
+    привязанные к циклу, в котором созданы. Поэтому все рассылки из
+    синхронного кода идут в одном цикле, а не в новом на каждый вызов:
+    соединения переиспользуются и не попадают в закрытый цикл.
+    """
+    global _background_loop
+
+    with _background_loop_lock:
+        if _background_loop is None:
+            _background_loop = asyncio.new_event_loop()
+            threading.Thread(target=_background_loop.run_forever, name='asyncio-background', daemon=True).start()
+        return _background_loop
+
+
+def run_sync(coroutine: Awaitable[Any]) -> Any:
+    """Выполнение корутины в общем цикле процесса с ожиданием результата (из синхронного кода)"""
+    loop = get_background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        raise RuntimeError("run_sync нельзя вызывать из общего цикла событий: он бы ждал сам себя")
+    return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+
+async def run_background(coroutine: Awaitable[Any]) -> Any:
+    """Выполнение корутины в общем цикле процесса из другого цикла событий"""
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, get_background_loop()))
+
+
+def iterate_sync(results: AsyncIterator[Any]) -> Iterator[Any]:
+    """Перебор асинхронного потока из синхронного кода (потоки Flask, планировщик) в общем цикле процесса"""
+    try:
+        while True:
+            try:
+                yield run_sync(results.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        run_sync(results.aclose())
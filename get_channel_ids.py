@@ -6,8 +6,8 @@
 
 import asyncio
 import logging
-from telegram import Bot
 from config import BOT_TOKEN
+from fanout import create_bot
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -15,7 +15,7 @@ logger = logging.getLogger(__name__)
 
 async def get_channel_info(bot_token: str, channel_username: str):
     """Получение информации о канале по @username"""
-    bot = Bot(token=bot_token)
+    bot = create_bot(bot_token)
     
     try:
         # Пробуем получить информацию о канале
@@ -35,7 +35,7 @@ async def get_channel_info(bot_token: str, channel_username: str):
 
 async def get_my_chats(bot_token: str):
     """Получение списка всех чатов, где есть бот"""
-    bot = Bot(token=bot_token)
+    bot = create_bot(bot_token)
     
     try:
         # Получаем информацию о боте
@@ -66,7 +66,7 @@ async def get_my_chats(bot_token: str):
 
 async def test_channel_access(bot_token: str, channel_id: int):
     """Тестирование доступа к каналу по ID"""
-    bot = Bot(token=bot_token)
+    bot = create_bot(bot_token)
     
     try:
         chat = await bot.get_chat(channel_id)
@@ -89,7 +89,7 @@ async def main():
     
     try:
         # Тестируем подключение к боту
-        bot = Bot(token=BOT_TOKEN)
+        bot = create_bot(BOT_TOKEN)
         bot_info = await bot.get_me()
         print(f"✅ Бот подключен: @{bot_info.username}")
         print()
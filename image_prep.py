@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Подготовка фото перед загрузкой в Telegram
+Telegram все равно пережимает фото и хранит их не больше 2560 точек по
+длинной стороне, поэтому снимок в полном разрешении только дольше
+загружается. Фото уменьшается, из него удаляются метаданные (EXIF, GPS)
+и оно пережимается в JPEG в отдельных процессах, не занимая ботов.
+Результат хранится в кэше медиа, а соответствие хешей - в базе, поэтому
+каждое фото обрабатывается один раз. Без Pillow фото загружаются как есть.
+"""
+
+import logging
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Optional
+
+from media_cache import SHA256_PREFIX, MediaStore, get_media_store
+from outbox import OUTBOX_PATH
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+except ImportError:
+    # Без Pillow фото отправляются без обработки
+    Image = None
+
+# Импортируем конфигурацию
+try:
+    from config import IMAGE_PREPROCESS, IMAGE_MAX_SIDE, IMAGE_QUALITY, IMAGE_WORKERS
+except ImportError:
+    # Если config.py недоступен, используем переменные окружения
+    IMAGE_PREPROCESS = os.getenv('IMAGE_PREPROCESS', 'true').lower() in ('1', 'true', 'yes')
+    IMAGE_MAX_SIDE = int(os.getenv('IMAGE_MAX_SIDE', '2560'))
+    IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', '87'))
+    IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '2'))
+
+logger = logging.getLogger(__name__)
+
+# Обрабатываются ли фото перед загрузкой (включено и установлен Pillow)
+IMAGE_PREP_ENABLED = IMAGE_PREPROCESS and Image is not None
+
+SCHEMA = """
+-- Хеш исходного фото -> хеш фото для загрузки при данных настройках
+-- (prepared совпадает с sha256, если обработка не уменьшила файл)
+CREATE TABLE IF NOT EXISTS prepared_images (
+    sha256 TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    prepared TEXT NOT NULL,
+    PRIMARY KEY (sha256, settings)
+) WITHOUT ROWID;
+"""
+
+
+def _prepare_image(source: str, directory: str, max_side: int, quality: int) -> Optional[str]:
+    """Обработка фото в процессе пула
+
+    Возвращает временный файл с JPEG в directory или None, если файл не
+    фото, анимация или обработка его не уменьшила.
+    """
+    try:
+        image = Image.open(source)
+    except UnidentifiedImageError:
+        return None
+
+    with image:
+        if getattr(image, 'is_animated', False):
+            return None
+
+        # Поворот из EXIF применяется к точкам до удаления метаданных
+        prepared = ImageOps.exif_transpose(image)
+        if prepared.mode in ('RGBA', 'LA', 'PA') or (prepared.mode == 'P' and 'transparency' in prepared.info):
+            # Прозрачные области JPEG не поддерживает: подкладываем белый фон
+            rgba = prepared.convert('RGBA')
+            prepared = Image.new('RGB', rgba.size, (255, 255, 255))
+            prepared.paste(rgba, mask=rgba.getchannel('A'))
+        elif prepared.mode != 'RGB':
+            prepared = prepared.convert('RGB')
+        prepared.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        fd, path = tempfile.mkstemp(dir=directory, suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            # Метаданные не передаются: в JPEG попадают только точки
+            prepared.save(f, 'JPEG', quality=quality, optimize=True, progressive=True)
+
+    if os.path.getsize(path) >= os.path.getsize(source):
+        os.unlink(path)
+        return None
+    return path
+
+
+class ImagePreprocessor:
+    """Подготовка фото в пуле процессов с кэшем результата по SHA-256 исходного файла"""
+
+    def __init__(self, store: MediaStore, path: str = OUTBOX_PATH, max_side: int = IMAGE_MAX_SIDE,
+                 quality: int = IMAGE_QUALITY, workers: int = IMAGE_WORKERS):
+        self.store = store
+        self.max_side = max_side
+        self.quality = quality
+        self.workers = max(1, workers)
+        # Другие настройки дают другой файл, поэтому фото обрабатывается заново
+        self.settings = f"{max_side}:{quality}"
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+        self.prepared: Dict[str, str] = dict(self.conn.execute(
+            "SELECT sha256, prepared FROM prepared_images WHERE settings = ?", (self.settings,)
+        ))
+        # Фото, которые обрабатываются сейчас: второй запрос того же фото ждет первый
+        self.pending: Dict[str, Future] = {}
+        self.pool: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        """Пул процессов создается при первом фото (под self.lock)
+
+        Процессы запускаются через spawn: fork процесса с потоками ботов
+        может унаследовать захваченные блокировки.
+        """
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self.pool
+
+    def prepare(self, digest: str) -> str:
+        """SHA-256 фото для загрузки: обработанная копия из кэша или исходное фото
+
+        Блокирует вызывающий поток на время обработки, поэтому из asyncio
+        вызывается через run_in_executor.
+        """
+        prepared = self.prepared.get(digest)
+        if prepared and self.store.path(prepared):
+            return prepared
+
+        with self.lock:
+            waiting = self.pending.get(digest)
+            if waiting is None:
+                self.pending[digest] = done = Future()
+        if waiting is not None:
+            return waiting.result()
+
+        prepared = digest
+        try:
+            prepared = self._process(digest)
+        finally:
+            with self.lock:
+                self.pending.pop(digest, None)
+            done.set_result(prepared)
+        return prepared
+
+    def _process(self, digest: str) -> str:
+        """Обработка фото в пуле и сохранение результата в кэш медиа"""
+        source = self.store.path(digest)
+        if source is None:
+            # Исходное фото вытеснено из кэша: оно отправится по ссылке или file_id
+            return digest
+
+        source_size = os.path.getsize(source)
+        try:
+            with self.lock:
+                future = self._executor().submit(_prepare_image, source, self.store.directory, self.max_side, self.quality)
+            result = future.result()
+            prepared = self.store.add_file(result) if result else digest
+        except Exception as e:
+            # Ошибка не запоминается: при следующей публикации фото обработается снова
+            logger.warning(f"⚠️ Не удалось подготовить фото {SHA256_PREFIX}{digest}: {e}")
+            return digest
+
+        with self.lock:
+            self.prepared[digest] = prepared
+            self.conn.execute(
+                "INSERT OR REPLACE INTO prepared_images (sha256, settings, prepared) VALUES (?, ?, ?)",
+                (digest, self.settings, prepared)
+            )
+
+        if prepared != digest:
+            logger.info(
+                f"🖼️ Фото {SHA256_PREFIX}{digest[:12]} подготовлено: "
+                f"{source_size // 1024} КБ -> {os.path.getsize(self.store.blob_path(prepared)) // 1024} КБ"
+            )
+        return prepared
+
+    def close(self):
+        """Остановка пула процессов и закрытие базы"""
+        with self.lock:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+            self.conn.close()
+
+
+# Один пул обработки на процесс: его делят планировщик, polling и веб-интерфейс
+_image_preprocessor: Optional[ImagePreprocessor] = None
+_image_preprocessor_lock = threading.Lock()
+
+
+def get_image_preprocessor() -> ImagePreprocessor:
+    """Получение общего обработчика фото процесса"""
+    global _image_preprocessor
+
+    with _image_preprocessor_lock:
+        if _image_preprocessor is None:
+            _image_preprocessor = ImagePreprocessor(get_media_store())
+        return _image_preprocessor
+
+
+def prepare_media(media_type: str, digest: Optional[str]) -> Optional[str]:
+    """SHA-256 медиа для загрузки: фото проходит подготовку, остальное медиа не меняется"""
+    if not IMAGE_PREP_ENABLED or media_type != 'photo' or digest is None:
+        return digest
+    return get_image_preprocessor().prepare(digest)
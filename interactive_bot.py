@@ -9,17 +9,19 @@ import logging
 import schedule
 import time
 import threading
-from datetime import datetime
-from typing import List, Dict, Optional
-import pytz
-from telegram import Bot, Update
+from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters
 from telegram.error import TelegramError
+from fanout import run_sync, BOT_API_BASE_URL, BOT_API_FILE_URL
+from outbox import schedule_post_key
+from publisher import TelegramPublisher, catch_up
+from progress_message import ProgressThrottle, format_progress
+from commands import TEXT_COMMANDS, CommandRouter, PostTemplates
+from webhook import WEBHOOK_ENABLED, WEBHOOK_WORKERS, serve_application
 from config import (
     BOT_TOKEN, 
     CHANNELS, 
     PUBLISH_SCHEDULE, 
-    TIMEZONE, 
     POST_TEMPLATES,
     LOG_LEVEL,
     LOG_FILE
@@ -36,68 +38,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class TelegramPublisher:
-    """Класс для публикации сообщений в Telegram каналы"""
-    
-    def __init__(self, bot_token: str):
-        self.bot = Bot(token=bot_token)
-        self.channels = CHANNELS
-        self.timezone = pytz.timezone(TIMEZONE)
-        
-    async def publish_to_channel(self, channel: str, message: str, parse_mode: str = 'HTML') -> bool:
-        """Публикация сообщения в один канал"""
-        try:
-            await self.bot.send_message(
-                chat_id=channel,
-                text=message,
-                parse_mode=parse_mode
-            )
-            logger.info(f"✅ Сообщение успешно отправлено в {channel}")
-            return True
-        except TelegramError as e:
-            logger.error(f"❌ Ошибка при отправке в {channel}: {e}")
-            return False
-        except Exception as e:
-            logger.error(f"❌ Неожиданная ошибка при отправке в {channel}: {e}")
-            return False
-    
-    async def publish_to_all_channels(self, message: str, parse_mode: str = 'HTML') -> Dict[str, bool]:
-        """Публикация сообщения во все каналы"""
-        results = {}
-        
-        logger.info(f"🚀 Начинаем публикацию сообщения в {len(self.channels)} каналов")
-        
-        # Создаем задачи для всех каналов
-        tasks = []
-        for channel in self.channels:
-            task = self.publish_to_channel(channel, message, parse_mode)
-            tasks.append((channel, task))
-        
-        # Выполняем все задачи параллельно
-        for channel, task in tasks:
-            try:
-                result = await task
-                results[channel] = result
-            except Exception as e:
-                logger.error(f"❌ Ошибка при обработке канала {channel}: {e}")
-                results[channel] = False
-        
-        # Подсчитываем результаты
-        successful = sum(1 for success in results.values() if success)
-        failed = len(results) - successful
-        
-        logger.info(f"📊 Результаты публикации: {successful} успешно, {failed} с ошибками")
-        
-        return results
-    
-    def get_current_time_moscow(self) -> datetime:
-        """Получение текущего времени в МСК"""
-        return datetime.now(self.timezone)
-    
-    def get_post_for_time(self, time_str: str) -> Optional[Dict[str, str]]:
-        """Получение шаблона поста для указанного времени"""
-        return POST_TEMPLATES.get(time_str)
-
 class InteractiveBot:
     """Интерактивный бот с командами"""
     
@@ -105,103 +45,79 @@ class InteractiveBot:
         self.bot_token = bot_token
         self.publisher = TelegramPublisher(bot_token)
         self.application = None
+        # Таблица команд: тексты /start и /help собираются один раз
+        self.router = CommandRouter(TEXT_COMMANDS, {
+            'start': self.start_command,
+            'help': self.help_command,
+            'post': self.post_command,
+            'status': self.status_command
+        }, PUBLISH_SCHEDULE)
+        self.templates = PostTemplates(POST_TEMPLATES)
         
-    async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик всех команд: обработчик и аргументы выбираются по таблице команд"""
+        route = self.router.route(update.message.text)
+        if route:
+            handler, args = route
+            await handler(update, args)
+    
+    async def start_command(self, update: Update, args: None):
         """Обработчик команды /start"""
-        welcome_text = """
-🤖 <b>Добро пожаловать в бот автопостов!</b>
-
-<b>Доступные команды:</b>
-/post - Отправить пост во все каналы
-/status - Проверить статус бота
-/help - Показать справку
-
-<b>Автоматические посты:</b>
-Бот автоматически публикует посты по расписанию:
-"""
-        for time in PUBLISH_SCHEDULE:
-            welcome_text += f"• {time} МСК\n"
-        
-        await update.message.reply_text(welcome_text, parse_mode='HTML')
+        await update.message.reply_text(self.router.start_text, parse_mode='HTML')
     
-    async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def help_command(self, update: Update, args: None):
         """Обработчик команды /help"""
-        help_text = """
-📖 <b>Справка по командам:</b>
-
-<b>/post</b> - Отправить пост во все каналы
-Использование: /post [текст сообщения]
-Пример: /post Привет всем!
-
-<b>/status</b> - Проверить статус бота
-Показывает количество каналов и время следующей публикации
-
-<b>/help</b> - Показать эту справку
-
-<b>Автоматические посты:</b>
-Бот публикует посты по расписанию в указанное время.
-"""
-        await update.message.reply_text(help_text, parse_mode='HTML')
+        await update.message.reply_text(self.router.help_text, parse_mode='HTML')
     
-    async def post_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def post_command(self, update: Update, message_text: str):
         """Обработчик команды /post"""
-        # Получаем текст сообщения (все после /post)
-        if context.args:
-            message_text = ' '.join(context.args)
-        else:
-            # Если текст не указан, используем шаблон по умолчанию
-            current_time = self.publisher.get_current_time_moscow()
-            time_str = current_time.strftime('%H:%M')
-            
-            # Ищем ближайший шаблон
-            template = None
-            for scheduled_time in sorted(POST_TEMPLATES.keys()):
-                if scheduled_time >= time_str:
-                    template = POST_TEMPLATES[scheduled_time]
-                    break
-            
-            if not template:
-                # Если не найден шаблон, используем первый доступный
-                template = list(POST_TEMPLATES.values())[0]
-            
-            message_text = template['text']
+        if not message_text:
+            # Если текст не указан, используем ближайший шаблон
+            time_str = self.publisher.get_current_time_moscow().strftime('%H:%M')
+            message_text = self.templates.upcoming(time_str)['text']
         
-        # Отправляем сообщение о начале публикации
-        await update.message.reply_text(
+        # Отправляем сообщение о начале публикации; дальше оно редактируется по ходу рассылки
+        status_message = await update.message.reply_text(
             f"🚀 Начинаю публикацию в {len(self.publisher.channels)} каналов...\n"
             f"📝 Текст: {message_text[:100]}{'...' if len(message_text) > 100 else ''}"
         )
         
         try:
-            # Публикуем во все каналы
-            results = await self.publisher.publish_to_all_channels(message_text)
-            
-            # Подсчитываем результаты
-            successful = sum(1 for success in results.values() if success)
-            failed = len(results) - successful
+            # Публикуем во все каналы, получая результат каждого канала по мере готовности
+            throttle = ProgressThrottle()
+            details = []
+            async for progress in self.publisher.publish_stream(message_text):
+                if progress.is_summary:
+                    summary = progress
+                    continue
+                
+                status = "✅" if progress.success else "❌"
+                details.append(f"{status} {progress.channel}")
+                
+                text = throttle.update(progress)
+                if text:
+                    await self.edit_status(status_message, text)
             
-            # Отправляем отчет
-            report = f"""
-📊 <b>Результаты публикации:</b>
-
-✅ Успешно: {successful}
-❌ Ошибки: {failed}
-📤 Всего каналов: {len(results)}
-
-<b>Детали:</b>
-"""
-            
-            for channel, success in results.items():
-                status = "✅" if success else "❌"
-                report += f"{status} {channel}\n"
-            
-            await update.message.reply_text(report, parse_mode='HTML')
+            # Итоговый отчет - в то же сообщение
+            report = format_progress(summary) + "\n\n<b>Детали:</b>\n" + "\n".join(details)
+            if not await self.edit_status(status_message, report):
+                await update.message.reply_text(format_progress(summary), parse_mode='HTML')
             
         except Exception as e:
             await update.message.reply_text(f"❌ Ошибка при публикации: {e}")
             logger.error(f"Ошибка в команде /post: {e}")
     
-    async def status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def edit_status(self, status_message, text: str) -> bool:
+        """Редактирование сообщения о ходе публикации через общий ограничитель отправки"""
+        await self.publisher.rate_limiter.acquire_async(status_message.chat_id)
+        try:
+            await status_message.edit_text(text, parse_mode='HTML')
+            return True
+        except TelegramError as e:
+            logger.warning(f"⚠️ Не удалось обновить сообщение о ходе публикации: {e}")
+            return False
+    
+    async def status_command(self, update: Update, args: None):
         """Обработчик команды /status"""
         try:
             # Получаем информацию о боте
@@ -218,13 +134,7 @@ class InteractiveBot:
 
 <b>Следующие публикации:</b>
 """
-            
-            # Показываем ближайшие запланированные посты
-            for time_str in sorted(POST_TEMPLATES.keys()):
-                template = POST_TEMPLATES[time_str]
-                status_text += f"• {time_str} - {template['text'][:50]}...\n"
-            
-            await update.message.reply_text(status_text, parse_mode='HTML')
+            await update.message.reply_text(status_text + self.templates.status_lines, parse_mode='HTML')
             
         except Exception as e:
             await update.message.reply_text(f"❌ Ошибка при получении статуса: {e}")
@@ -246,9 +156,17 @@ class Scheduler:
     def schedule_posts(self):
         """Настройка расписания публикации"""
         for time_str in self.schedule_times:
-            schedule.every().day.at(time_str).do(self.publish_scheduled_post, time_str)
+            schedule.every().day.at(time_str).do(self.run_scheduled_post, time_str)
             logger.info(f"⏰ Запланирована публикация на {time_str} МСК")
     
+    def run_scheduled_post(self, time_str: str):
+        """Запуск публикации по расписанию из потока планировщика"""
+        run_sync(self.publish_scheduled_post(time_str))
+    
+    def catch_up(self):
+        """Досылка прерванных рассылок и слотов, пропущенных во время простоя"""
+        catch_up(self.publisher, self.schedule_times, self.run_scheduled_post)
+    
     async def publish_scheduled_post(self, time_str: str):
         """Публикация по расписанию"""
         current_time = self.publisher.get_current_time_moscow()
@@ -265,7 +183,7 @@ class Scheduler:
         parse_mode = post_template.get('parse_mode', 'HTML')
         
         # Публикуем во все каналы
-        results = await self.publisher.publish_to_all_channels(message, parse_mode)
+        results = await self.publisher.publish_to_all_channels(message, parse_mode, schedule_post_key(current_time, time_str))
         
         # Логируем результаты
         for channel, success in results.items():
@@ -276,6 +194,7 @@ class Scheduler:
         """Запуск планировщика"""
         logger.info("🚀 Планировщик запущен")
         self.schedule_posts()
+        self.catch_up()
         
         while True:
             schedule.run_pending()
@@ -294,26 +213,29 @@ async def main():
     interactive_bot = InteractiveBot(BOT_TOKEN)
     
     # Создаем приложение
-    application = Application.builder().token(BOT_TOKEN).build()
+    builder = Application.builder().token(BOT_TOKEN).base_url(BOT_API_BASE_URL).base_file_url(BOT_API_FILE_URL)
+    if WEBHOOK_ENABLED:
+        # Обновления из webhook обрабатываются параллельно: долгий /post не задерживает другие команды
+        builder = builder.concurrent_updates(WEBHOOK_WORKERS)
+    application = builder.build()
     interactive_bot.application = application
     
     # Добавляем обработчики команд
-    application.add_handler(CommandHandler("start", interactive_bot.start_command))
-    application.add_handler(CommandHandler("help", interactive_bot.help_command))
-    application.add_handler(CommandHandler("post", interactive_bot.post_command))
-    application.add_handler(CommandHandler("status", interactive_bot.status_command))
+    application.add_handler(CommandHandler(interactive_bot.router.names(), interactive_bot.command))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, interactive_bot.handle_message))
     
     # Тестируем подключение к боту
     try:
         bot_info = await interactive_bot.publisher.bot.get_me()
         logger.info(f"✅ Бот подключен: @{bot_info.username}")
+        interactive_bot.router.username = bot_info.username
     except Exception as e:
         logger.error(f"❌ Ошибка подключения к боту: {e}")
         return
     
-    # Запускаем планировщик в отдельном потоке
-    scheduler = Scheduler(interactive_bot.publisher)
+    # Запускаем планировщик в отдельном потоке. У него свой публикатор: боты
+    # InteractiveBot работают в цикле Application, а планировщик - в общем цикле процесса
+    scheduler = Scheduler(TelegramPublisher(BOT_TOKEN))
     scheduler_thread = threading.Thread(target=scheduler.run_scheduler, daemon=True)
     scheduler_thread.start()
     
@@ -322,9 +244,12 @@ async def main():
     logger.info(f"📢 Каналы: {len(CHANNELS)} каналов")
     logger.info("🎯 Интерактивные команды: /start, /help, /post, /status")
     
-    # Запускаем бота
+    # Запускаем бота: webhook (если задан WEBHOOK_URL) или polling
     try:
-        await application.run_polling()
+        if WEBHOOK_ENABLED:
+            await serve_application(application, BOT_TOKEN)
+        else:
+            await application.run_polling()
     except KeyboardInterrupt:
         logger.info("👋 Бот остановлен пользователем")
 
@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""
+Кэш медиа и их file_id
+Медиа хранится на диске по SHA-256 содержимого, а Telegram возвращает file_id
+загруженного файла, и повторная отправка по file_id не загружает файл заново.
+file_id действует только для бота, который загрузил файл, поэтому кэш ведется
+на каждого бота; сведения о кэше хранятся в базе очереди
+"""
+
+import hashlib
+import ipaddress
+import logging
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+from outbox import OUTBOX_PATH
+from retry import SendError
+from token_pool import bot_id
+
+# Импортируем конфигурацию
+try:
+    from config import MEDIA_DIR, MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_MB, MEDIA_DOWNLOAD_TIMEOUT
+except ImportError:
+    # Если config.py недоступен, используем переменные окружения
+    MEDIA_DIR = os.getenv('MEDIA_DIR', 'media')
+    MEDIA_CACHE_DIR = os.getenv('MEDIA_CACHE_DIR', 'media_cache')
+    MEDIA_CACHE_MAX_MB = float(os.getenv('MEDIA_CACHE_MAX_MB', '500'))
+    MEDIA_DOWNLOAD_TIMEOUT = float(os.getenv('MEDIA_DOWNLOAD_TIMEOUT', '120'))
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+-- source - тип медиа и sha256:<хеш>, адрес медиа или файл с размером и временем изменения;
+-- вместо токена хранится только ID бота (часть токена до двоеточия)
+CREATE TABLE IF NOT EXISTS media_file_ids (
+    bot_id INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    uploaded_at REAL NOT NULL,
+    PRIMARY KEY (bot_id, source)
+) WITHOUT ROWID;
+
+-- Файлы кэша медиа на диске
+CREATE TABLE IF NOT EXISTS media_blobs (
+    sha256 TEXT NOT NULL PRIMARY KEY,
+    size INTEGER NOT NULL,
+    used_at REAL NOT NULL
+) WITHOUT ROWID;
+
+-- Ссылки и файлы из MEDIA_DIR, уже сохраненные в кэш: source -> хеш содержимого
+CREATE TABLE IF NOT EXISTS media_sources (
+    source TEXT NOT NULL PRIMARY KEY,
+    sha256 TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Медиа, заданное хешем содержимого (например, в POST_TEMPLATES): sha256:<хеш>
+SHA256_PREFIX = 'sha256:'
+
+# Бот может загрузить в Telegram файл не больше 50 МБ
+MAX_UPLOAD_SIZE = 50 * 1024 * 1024
+
+# Размер части при скачивании и хешировании
+CHUNK_SIZE = 1024 * 1024
+
+# Схемы ссылок, которые скачиваются в кэш
+DOWNLOAD_SCHEMES = ('http', 'https')
+
+# Переадресаций при скачивании ссылки (каждая проверяется, как исходная ссылка)
+MAX_REDIRECTS = 5
+
+# Ошибки, после которых сохраненный file_id больше не годится
+FILE_ID_ERRORS = (
+    'wrong file identifier',
+    'wrong remote file identifier',
+    'file reference',
+)
+
+
+def local_media_path(media_url: str) -> Optional[str]:
+    """Путь к файлу, если медиа задано путем в MEDIA_DIR (а не ссылкой или file_id)
+
+    Путь считается от MEDIA_DIR; файлы вне этой папки не отправляются,
+    чтобы командой бота нельзя было выложить произвольный файл сервера.
+    """
+    if '://' in media_url and not media_url.startswith('file://'):
+        return None
+
+    root = os.path.realpath(MEDIA_DIR)
+    path = os.path.realpath(os.path.join(root, media_url[len('file://'):] if media_url.startswith('file://') else media_url))
+    try:
+        inside = os.path.commonpath([root, path]) == root
+    except ValueError:
+        # Разные диски в Windows
+        inside = False
+    return path if inside and os.path.isfile(path) else None
+
+
+def public_address(host: str, port: int) -> str:
+    """Адрес хоста после DNS, если все его адреса публичные
+
+    Ссылку из команды бота нельзя направить в сеть сервера: частные,
+    loopback, link-local и зарезервированные адреса отклоняются.
+    """
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise ValueError(f"хост {host} не найден: {e}")
+
+    addresses = [ipaddress.ip_address(info[4][0].split('%', 1)[0]) for info in infos]
+    for address in addresses:
+        if not address.is_global or address.is_multicast:
+            raise ValueError(f"адрес {address} хоста {host} не публичный")
+    return str(addresses[0])
+
+
+def pinned_session(url: str):
+    """Сессия requests, ссылка на проверенный публичный IP и заголовки для скачивания url
+
+    Для https соединение идет на IP, а SNI и проверка сертификата - по имени хоста.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    parsed = urlparse(url)
+    scheme = parsed.scheme.lower()
+    if scheme not in DOWNLOAD_SCHEMES or not parsed.hostname:
+        raise ValueError(f"ссылка {url} не http/https")
+
+    port = parsed.port or (443 if scheme == 'https' else 80)
+    address = public_address(parsed.hostname, port)
+
+    class PinnedAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            kwargs['server_hostname'] = parsed.hostname
+            kwargs['assert_hostname'] = parsed.hostname
+            super().init_poolmanager(*args, **kwargs)
+
+    session = requests.Session()
+    if scheme == 'https':
+        session.mount('https://', PinnedAdapter())
+
+    host = f"[{address}]" if ':' in address else address
+    pinned_url = parsed._replace(scheme=scheme, netloc=f"{host}:{port}").geturl()
+    return session, pinned_url, {'Host': parsed.netloc.rsplit('@', 1)[-1]}
+
+
+def media_source(media_url: str) -> str:
+    """Ключ медиа в кэше: адрес, а для файла - путь, размер и время изменения (измененный файл загружается заново)"""
+    path = local_media_path(media_url)
+    if path is None:
+        return media_url
+
+    stat = os.stat(path)
+    return f"file://{path}?size={stat.st_size}&mtime={stat.st_mtime_ns}"
+
+
+def media_filename(media_url: str) -> str:
+    """Имя файла медиа для загрузки (в кэше файлы названы хешем)"""
+    name = os.path.basename(urlparse(media_url).path if '://' in media_url else media_url)
+    return name or 'file'
+
+
+def is_file_id_error(error: SendError) -> bool:
+    """Telegram не принял file_id (файл удален или file_id от другого бота)"""
+    description = error.description.lower()
+    return any(pattern in description for pattern in FILE_ID_ERRORS)
+
+
+def sent_file_id(field: str, message: Optional[dict]) -> Optional[str]:
+    """file_id из отправленного сообщения (field - поле запроса: photo, video, document)
+
+    У фото берется самый большой размер; видео и документ Telegram может
+    вернуть как animation, поэтому проверяются и соседние поля.
+    """
+    if not message:
+        return None
+
+    if field == 'photo':
+        sizes = message.get('photo') or []
+        return sizes[-1].get('file_id') if sizes else None
+
+    for key in (field, 'animation', 'video', 'document'):
+        media = message.get(key)
+        if media and media.get('file_id'):
+            return media['file_id']
+    return None
+
+
+def media_key(item: dict) -> str:
+    """Ключ медиа поста в кэше file_id: тип и хеш содержимого, если медиа в кэше, иначе тип и адрес
+
+    Тип входит в ключ: file_id фото нельзя отправить документом и наоборот.
+    """
+    digest = item.get('media_sha256')
+    source = f"{SHA256_PREFIX}{digest}" if digest else media_source(item['media_url'])
+    return f"{item['media_type']}:{source}"
+
+
+class FileIdCache:
+    """file_id медиа: (бот, источник медиа) -> file_id"""
+
+    def __init__(self, path: str = OUTBOX_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+        # Проверка перед каждой отправкой - поиск в словаре, а не запрос к базе
+        self.file_ids: Dict[Tuple[int, str], str] = {}
+        self.reload()
+
+    def reload(self):
+        """Перечитывание file_id из базы: их загружают и удаляют и другие процессы"""
+        with self.lock:
+            self.file_ids = {
+                (row_bot_id, source): file_id
+                for row_bot_id, source, file_id in self.conn.execute(
+                    "SELECT bot_id, source, file_id FROM media_file_ids"
+                )
+            }
+
+    def get(self, token: str, source: str) -> Optional[str]:
+        """file_id медиа для бота (None, если бот его еще не загружал)"""
+        return self.file_ids.get((bot_id(token), source))
+
+    def put(self, token: str, source: str, file_id: str):
+        """Запоминание file_id, который Telegram вернул боту после загрузки"""
+        key = (bot_id(token), source)
+        with self.lock:
+            if self.file_ids.get(key) == file_id:
+                return
+            self.file_ids[key] = file_id
+            self.conn.execute(
+                "INSERT OR REPLACE INTO media_file_ids (bot_id, source, file_id, uploaded_at) VALUES (?, ?, ?, ?)",
+                (key[0], source, file_id, time.time())
+            )
+        logger.info(f"📎 Медиа {source} загружено ботом {key[0]}, дальше отправляется по file_id")
+
+    def forget(self, token: str, source: str) -> bool:
+        """Удаление file_id, который Telegram больше не принимает"""
+        key = (bot_id(token), source)
+        with self.lock:
+            file_id = self.file_ids.pop(key, None)
+            self.conn.execute(
+                "DELETE FROM media_file_ids WHERE bot_id = ? AND source = ?", key
+            )
+        return file_id is not None
+
+    def close(self):
+        """Закрытие базы"""
+        with self.lock:
+            self.conn.close()
+
+
+# Один кэш на процесс: его делят планировщик, polling и веб-интерфейс
+_file_id_cache: Optional[FileIdCache] = None
+_file_id_cache_lock = threading.Lock()
+
+
+def get_file_id_cache() -> FileIdCache:
+    """Получение общего кэша file_id процесса"""
+    global _file_id_cache
+
+    with _file_id_cache_lock:
+        if _file_id_cache is None:
+            _file_id_cache = FileIdCache()
+        return _file_id_cache
+
+
+class MediaStore:
+    """Медиа на диске по SHA-256 содержимого с вытеснением давно не использованных
+
+    Файл лежит в directory/<первые 2 символа хеша>/<хеш>. Ссылка или файл
+    из MEDIA_DIR сопоставляется хешу один раз, поэтому повторная публикация
+    не скачивает медиа заново. Когда общий размер превышает max_bytes,
+    удаляются файлы, которые дольше всех не отправлялись.
+    """
+
+    def __init__(self, path: str = OUTBOX_PATH, directory: str = MEDIA_CACHE_DIR,
+                 max_bytes: int = int(MEDIA_CACHE_MAX_MB * 1024 * 1024)):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        os.makedirs(directory, exist_ok=True)
+
+        self.sources: Dict[str, str] = dict(self.conn.execute("SELECT source, sha256 FROM media_sources"))
+        self.total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM media_blobs").fetchone()[0]
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def touch(self, digest: str):
+        """Отметка, что медиа снова публикуется (такие файлы вытесняются последними)"""
+        with self.lock:
+            self.conn.execute("UPDATE media_blobs SET used_at = ? WHERE sha256 = ?", (time.time(), digest))
+
+    def path(self, digest: str) -> Optional[str]:
+        """Файл медиа в кэше (отмечается как использованный); None, если он вытеснен"""
+        path = self.blob_path(digest)
+        if not os.path.isfile(path):
+            return None
+
+        self.touch(digest)
+        return path
+
+    def resolve(self, media_url: str) -> Optional[str]:
+        """SHA-256 медиа; в первый раз ссылка скачивается, а файл из MEDIA_DIR копируется в кэш
+
+        None - медиа задано file_id или его не удалось сохранить; тогда
+        оно отправляется по media_url, как без кэша.
+        """
+        if media_url.startswith(SHA256_PREFIX):
+            digest = media_url[len(SHA256_PREFIX):].lower()
+            if len(digest) != 64 or any(c not in '0123456789abcdef' for c in digest):
+                return None
+            self.touch(digest)
+            return digest
+
+        path = local_media_path(media_url)
+        if path is None and urlparse(media_url).scheme.lower() not in DOWNLOAD_SCHEMES:
+            return None
+
+        source = media_source(media_url)
+        digest = self.sources.get(source)
+        # Вытесненный файл заново не скачивается: у ботов остаются его file_id
+        if digest:
+            self.touch(digest)
+            return digest
+
+        try:
+            if path:
+                with open(path, 'rb') as f:
+                    digest = self._add(iter(lambda: f.read(CHUNK_SIZE), b''))
+            else:
+                digest = self._download(media_url)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить медиа {media_url} в кэш: {e}")
+            return None
+
+        with self.lock:
+            self.sources[source] = digest
+            self.conn.execute(
+                "INSERT OR REPLACE INTO media_sources (source, sha256) VALUES (?, ?)", (source, digest)
+            )
+        logger.info(f"💾 Медиа {media_url} сохранено в кэш: {SHA256_PREFIX}{digest}")
+        return digest
+
+    def add_file(self, path: str) -> str:
+        """Перенос готового файла (например, обработанного фото) в кэш; исходный файл удаляется"""
+        try:
+            with open(path, 'rb') as f:
+                return self._add(iter(lambda: f.read(CHUNK_SIZE), b''))
+        finally:
+            os.unlink(path)
+
+    def _download(self, url: str) -> str:
+        """Скачивание ссылки в кэш по частям
+
+        Переадресации проходятся вручную, и каждый адрес проверяется
+        public_address; соединение идет на проверенный IP, поэтому повторный
+        DNS-запрос не подменит адрес. Скачивание целиком ограничено
+        MEDIA_DOWNLOAD_TIMEOUT секундами, размер - MAX_UPLOAD_SIZE.
+        """
+        deadline = time.monotonic() + MEDIA_DOWNLOAD_TIMEOUT
+
+        for _ in range(MAX_REDIRECTS + 1):
+            session, pinned_url, headers = pinned_session(url)
+            timeout = min(max(deadline - time.monotonic(), 0.1), 30)
+            with session, session.get(pinned_url, headers=headers, stream=True,
+                                      allow_redirects=False, timeout=timeout) as response:
+                if not response.is_redirect:
+                    response.raise_for_status()
+                    return self._add(self._until(deadline, response.iter_content(CHUNK_SIZE)))
+                url = urljoin(url, response.headers['location'])
+
+        raise ValueError(f"больше {MAX_REDIRECTS} переадресаций")
+
+    @staticmethod
+    def _until(deadline: float, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Части скачивания, пока не истек общий срок (timeout requests ограничивает только одно чтение)"""
+        for chunk in chunks:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"скачивание дольше {MEDIA_DOWNLOAD_TIMEOUT:g} сек")
+            yield chunk
+
+    def _add(self, chunks: Iterable[bytes]) -> str:
+        """Запись медиа в кэш с подсчетом хеша на лету; файл появляется в кэше целиком или не появляется"""
+        hasher = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if size > MAX_UPLOAD_SIZE:
+                        raise ValueError(f"файл больше {MAX_UPLOAD_SIZE // (1024 * 1024)} МБ")
+                    hasher.update(chunk)
+                    f.write(chunk)
+
+            digest = hasher.hexdigest()
+            os.makedirs(os.path.dirname(self.blob_path(digest)), exist_ok=True)
+            os.replace(temp_path, self.blob_path(digest))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+        with self.lock:
+            added = self.conn.execute(
+                "INSERT OR IGNORE INTO media_blobs (sha256, size, used_at) VALUES (?, ?, ?)",
+                (digest, size, time.time())
+            ).rowcount
+            if added:
+                self.total += size
+            self._evict(keep=digest)
+        return digest
+
+    def _evict(self, keep: str):
+        """Удаление давно не отправлявшихся файлов, пока кэш больше max_bytes (под self.lock)"""
+        while self.total > self.max_bytes:
+            row = self.conn.execute(
+                "SELECT sha256, size FROM media_blobs WHERE sha256 != ? ORDER BY used_at LIMIT 1", (keep,)
+            ).fetchone()
+            if row is None:
+                return
+
+            digest, size = row
+            try:
+                os.unlink(self.blob_path(digest))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # Файл не удалить (нет прав, занят) - он больше не учитывается, чтобы вытеснение не застряло на нем
+                logger.warning(f"⚠️ Не удалось удалить медиа {SHA256_PREFIX}{digest} из кэша: {e}")
+            self.conn.execute("DELETE FROM media_blobs WHERE sha256 = ?", (digest,))
+            self.total -= size
+            logger.info(f"🧹 Медиа {SHA256_PREFIX}{digest} вытеснено из кэша ({size // 1024} КБ)")
+
+    def close(self):
+        """Закрытие базы"""
+        with self.lock:
+            self.conn.close()
+
+
+# Один кэш медиа на процесс
+_media_store: Optional[MediaStore] = None
+_media_store_lock = threading.Lock()
+
+
+def get_media_store() -> MediaStore:
+    """Получение общего кэша медиа процесса"""
+    global _media_store
+
+    with _media_store_lock:
+        if _media_store is None:
+            _media_store = MediaStore()
+        return _media_store
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Альбомы (sendMediaGroup)
+Несколько фото, видео, документов или аудио уходят в канал одним запросом и
+показываются одним постом; общие для ботов проверка и разбор команды /album
+и рассылка альбомов через python-telegram-bot (AlbumPublisher)
+"""
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from fanout import iter_fan_out, iter_fan_out_leaders
+from image_prep import prepare_media
+from media_cache import (
+    SHA256_PREFIX, get_file_id_cache, get_media_store, is_file_id_error, local_media_path, media_key, sent_file_id
+)
+from retry import SendError, classify_exception
+
+logger = logging.getLogger(__name__)
+
+# Telegram принимает в альбоме от 2 до 10 элементов
+ALBUM_MIN_ITEMS = 2
+ALBUM_MAX_ITEMS = 10
+
+# Типы медиа альбома; фото и видео смешиваются, документы и аудио - только между собой
+ALBUM_TYPES = ('photo', 'video', 'document', 'audio')
+SEPARATE_TYPES = {'document': "Документы", 'audio': "Аудио"}
+
+PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.m4v', '.webm', '.mkv', '.avi')
+AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.ogg', '.oga', '.flac', '.wav')
+
+# Элемент альбома: (тип медиа, ссылка, файл из MEDIA_DIR, file_id или sha256:<хеш>)
+AlbumItem = Tuple[str, str]
+
+
+def guess_media_type(media_url: str) -> str:
+    """Тип элемента альбома по расширению файла
+
+    Ссылка без расширения считается фото (так часто отдают картинки),
+    файл с незнакомым расширением - документом.
+    """
+    path = urlparse(media_url).path if '://' in media_url else media_url
+    extension = os.path.splitext(path)[1].lower()
+    if not extension or extension in PHOTO_EXTENSIONS:
+        return 'photo'
+    if extension in VIDEO_EXTENSIONS:
+        return 'video'
+    if extension in AUDIO_EXTENSIONS:
+        return 'audio'
+    return 'document'
+
+
+def validate_album(items: List[AlbumItem]):
+    """Проверка альбома до записи рассылки в очередь; при ошибке выбрасывает ValueError"""
+    if not ALBUM_MIN_ITEMS <= len(items) <= ALBUM_MAX_ITEMS:
+        raise ValueError(f"В альбоме должно быть от {ALBUM_MIN_ITEMS} до {ALBUM_MAX_ITEMS} элементов, а не {len(items)}")
+
+    types = {media_type for media_type, _ in items}
+    unknown = types - set(ALBUM_TYPES)
+    if unknown:
+        raise ValueError(f"Неизвестный тип медиа в альбоме: {', '.join(sorted(unknown))}")
+    for media_type, name in SEPARATE_TYPES.items():
+        if media_type in types and len(types) > 1:
+            raise ValueError(f"{name} нельзя смешивать в альбоме с другими типами медиа")
+
+
+def parse_album_command(args: str) -> Tuple[List[AlbumItem], str]:
+    """Разбор аргументов /album: сначала медиа (ссылки, файлы из MEDIA_DIR, sha256:<хеш>), затем подпись"""
+    words = args.split()
+    items: List[AlbumItem] = []
+    for word in words:
+        if '://' not in word and not word.startswith(SHA256_PREFIX) and local_media_path(word) is None:
+            break
+        items.append((guess_media_type(word), word))
+
+    caption = args.split(None, len(items))[len(items)] if len(words) > len(items) else ""
+    return items, caption
+
+
+def album_post(items: List[AlbumItem], caption: str, parse_mode: str) -> dict:
+    """Пост-альбом для очереди рассылки; каждый элемент сохраняется в кэш медиа, как и одиночное медиа
+
+    Элементы скачиваются и фото подготавливаются параллельно.
+    """
+    media_store = get_media_store()
+    with ThreadPoolExecutor(len(items)) as executor:
+        digests = list(executor.map(
+            lambda item: prepare_media(item[0], media_store.resolve(item[1])), items
+        ))
+
+    return {
+        'album': [
+            {'media_type': media_type, 'media_url': media_url, 'media_sha256': digest}
+            for (media_type, media_url), digest in zip(items, digests)
+        ],
+        'caption': caption,
+        'parse_mode': parse_mode
+    }
+
+
+def input_media(item: dict, file_id: Optional[str] = None, caption: Optional[str] = None, parse_mode: Optional[str] = None):
+    """Элемент альбома для python-telegram-bot: сохраненный file_id, файл с диска или ссылка
+
+    Файл из кэша медиа или MEDIA_DIR передается открытым файлом (путь
+    python-telegram-bot понимает только для локального Bot API); ссылку
+    Telegram скачивает сам.
+    """
+    from telegram import InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo
+    media_class = {
+        'photo': InputMediaPhoto, 'video': InputMediaVideo, 'document': InputMediaDocument, 'audio': InputMediaAudio
+    }[item['media_type']]
+
+    path = None
+    if file_id is None:
+        digest = item.get('media_sha256')
+        path = (get_media_store().path(digest) if digest else None) or local_media_path(item['media_url'])
+    if path is None:
+        return media_class(media=file_id or item['media_url'], caption=caption, parse_mode=parse_mode)
+
+    # InputFile читает файл при создании, поэтому его можно сразу закрыть
+    with open(path, 'rb') as f:
+        return media_class(media=f, caption=caption, parse_mode=parse_mode)
+
+
+class AlbumPublisher:
+    """Рассылка альбомов через python-telegram-bot для TelegramPublisher
+
+    Альбом сначала загружается в один канал каждого бота, а остальные
+    каналы получают его по file_id. Пул ботов, очередь, журнал доставки,
+    карантин и параметры рассылки берутся у publisher.
+    """
+
+    # Кругов первой загрузки альбома: если отправка в выбранный канал не удалась, берется следующий
+    UPLOAD_ROUNDS = 3
+    # Таймаут отправки альбома: загрузка десяти файлов идет дольше текстового сообщения
+    UPLOAD_TIMEOUT = 120
+
+    def __init__(self, publisher: Any):
+        self.publisher = publisher
+        self.file_ids = get_file_id_cache()
+
+    async def publish_to_channel(self, channel: str, post: dict, post_id: Optional[int] = None) -> bool:
+        """Публикация альбома (sendMediaGroup) в один канал
+
+        Медиа, которое бот канала уже загрузил, отправляется по file_id.
+        """
+        from telegram.error import TelegramError
+
+        publisher = self.publisher
+        if post_id is not None and publisher.ledger.is_delivered(post_id, channel):
+            logger.info(f"⏭️ Пост {post_id} уже опубликован в {channel}")
+            return True
+
+        token = publisher.token_pool.token_for(channel)
+        items = post['album']
+        sources = [media_key(item) for item in items]
+        try:
+            # Подпись альбома - подпись первого элемента
+            media = [
+                input_media(item, self.file_ids.get(token, source), post.get('caption') if i == 0 else None, post.get('parse_mode', 'HTML'))
+                for i, (item, source) in enumerate(zip(items, sources))
+            ]
+            sent = await publisher.bots[token].send_media_group(chat_id=channel, media=media)
+            for item, source, message in zip(items, sources, sent):
+                if self.file_ids.get(token, source) is None:
+                    file_id = sent_file_id(item['media_type'], message.to_dict())
+                    if file_id:
+                        self.file_ids.put(token, source, file_id)
+            if post_id is not None:
+                publisher.ledger.record(post_id, channel, sent[0].message_id)
+            publisher.breaker.record_success(channel)
+            logger.info(f"✅ Альбом успешно отправлен в {channel}")
+            return True
+        except TelegramError as e:
+            error = classify_exception(e)
+            # Telegram не принял сохраненный file_id: забываем file_id альбома, повтор загрузит медиа заново
+            if is_file_id_error(error) and any([self.file_ids.forget(token, source) for source in sources]):
+                logger.warning(f"♻️ file_id альбома устарел, загружаем заново в {channel}")
+                raise SendError(error.description, transient=True)
+            if error.transient:
+                # Временные ошибки повторяет fan_out
+                raise error
+            # Нет ответа (например, долгая загрузка десяти файлов) - это не ошибка канала
+            if not error.outcome_unknown:
+                publisher.breaker.record_failure(channel, error)
+            logger.error(f"❌ Ошибка при отправке альбома в {channel}: {e}")
+            return False
+        except Exception as e:
+            # Ошибка не от Telegram ничего не говорит о канале: без карантина и без записи в журнал доставки
+            logger.error(f"❌ Неожиданная ошибка при отправке альбома в {channel}: {e}", exc_info=True)
+            return False
+
+    def upload_leaders(self, post_id: int, post: dict, channels: List) -> List:
+        """Каналы для первой загрузки альбома: по одному на каждого бота, у которого еще нет file_id
+
+        Выбираются каналы без ошибок, куда пост еще не доставлен.
+        """
+        publisher = self.publisher
+        leaders = {}
+        sources = [media_key(item) for item in post['album']]
+        for channel in channels:
+            token = publisher.token_pool.token_for(channel)
+            if token in leaders or all(self.file_ids.get(token, source) is not None for source in sources):
+                continue
+            if publisher.ledger.is_delivered(post_id, channel) or publisher.breaker.has_failures(channel):
+                continue
+            leaders[token] = channel
+        return list(leaders.values())
+
+    def stream_batch(self, post_id: int, post: dict, channels: List) -> AsyncIterator[Tuple[str, bool]]:
+        """Отправка альбома в часть каналов параллельно, сначала - по каналу на каждого бота"""
+        publisher = self.publisher
+
+        def fan_out(batch: List) -> AsyncIterator[Tuple[str, bool]]:
+            return iter_fan_out(
+                batch,
+                lambda channel: self.publish_to_channel(channel, post, post_id),
+                publisher.concurrency,
+                max(publisher.timeout, self.UPLOAD_TIMEOUT),
+                publisher.rate_limiter,
+                publisher.retry_policy,
+                # Каналы на карантине пропускаются без запроса
+                publisher.breaker.should_skip
+            )
+
+        return iter_fan_out_leaders(
+            channels,
+            lambda remaining: self.upload_leaders(post_id, post, remaining),
+            self.UPLOAD_ROUNDS,
+            fan_out
+        )
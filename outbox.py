@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Очередь доставки (outbox) в SQLite
+Рассылка сначала записывается на диск парами (пост, канал), а затем
+отправляется; после перезапуска досылаются только недоставленные пары
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Импортируем конфигурацию
+try:
+    from config import OUTBOX_PATH, OUTBOX_BATCH_SIZE, OUTBOX_CATCHUP_MINUTES
+except ImportError:
+    # Если config.py недоступен, используем переменные окружения
+    OUTBOX_PATH = os.getenv('OUTBOX_PATH', 'outbox.db')
+    OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '500'))
+    OUTBOX_CATCHUP_MINUTES = int(os.getenv('OUTBOX_CATCHUP_MINUTES', '30'))
+
+logger = logging.getLogger(__name__)
+
+# Статусы доставки
+PENDING = 0
+IN_PROGRESS = 1
+DELIVERED = 2
+FAILED = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    post_key TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+
+-- channel без типа: SQLite хранит ID канала как есть (число или @username)
+CREATE TABLE IF NOT EXISTS deliveries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    post_id INTEGER NOT NULL REFERENCES posts(id),
+    channel NOT NULL,
+    status INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    UNIQUE (post_id, channel)
+);
+
+-- Выборка следующей пачки идет по индексу, а не по всей таблице
+CREATE INDEX IF NOT EXISTS deliveries_by_status ON deliveries (status);
+CREATE INDEX IF NOT EXISTS deliveries_by_post_status ON deliveries (post_id, status);
+"""
+
+# (id доставки, id поста, канал)
+Delivery = Tuple[int, int, Any]
+
+
+def schedule_post_key(date: datetime, time_str: str) -> str:
+    """Ключ поста по расписанию: один пост на каждый слот каждого дня"""
+    return f"schedule:{date.strftime('%Y-%m-%d')} {time_str}"
+
+
+class Outbox:
+    """Очередь доставки постов по каналам"""
+
+    def __init__(self, path: str = OUTBOX_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def enqueue(self, post_key: Optional[str], payload: Dict[str, Any], channels: Iterable[Any]) -> int:
+        """Запись поста и всех его доставок одной транзакцией
+
+        Повторная постановка поста с тем же ключом ничего не добавляет
+        и возвращает id уже записанного поста.
+        """
+        post_key = post_key or f"manual:{uuid.uuid4().hex}"
+        now = time.time()
+
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT id FROM posts WHERE post_key = ?", (post_key,)).fetchone()
+                if row:
+                    self.conn.execute("COMMIT")
+                    logger.info(f"📦 Пост {post_key} уже есть в очереди доставки")
+                    return row[0]
+
+                cursor = self.conn.execute(
+                    "INSERT INTO posts (post_key, payload, created_at) VALUES (?, ?, ?)",
+                    (post_key, json.dumps(payload, ensure_ascii=False), now)
+                )
+                post_id = cursor.lastrowid
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO deliveries (post_id, channel, status, updated_at) VALUES (?, ?, ?, ?)",
+                    ((post_id, channel, PENDING, now) for channel in channels)
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        return post_id
+
+    def has_post(self, post_key: str) -> bool:
+        """Был ли пост с таким ключом уже поставлен в очередь"""
+        with self.lock:
+            row = self.conn.execute("SELECT 1 FROM posts WHERE post_key = ?", (post_key,)).fetchone()
+        return row is not None
+
+    def claim(self, limit: int = OUTBOX_BATCH_SIZE, post_id: Optional[int] = None) -> List[Delivery]:
+        """Взять следующую пачку недоставленных пар и пометить их как отправляемые"""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                if post_id is None:
+                    rows = self.conn.execute(
+                        "SELECT id, post_id, channel FROM deliveries WHERE status = ? ORDER BY id LIMIT ?",
+                        (PENDING, limit)
+                    ).fetchall()
+                else:
+                    rows = self.conn.execute(
+                        "SELECT id, post_id, channel FROM deliveries WHERE post_id = ? AND status = ? ORDER BY id LIMIT ?",
+                        (post_id, PENDING, limit)
+                    ).fetchall()
+                self.conn.executemany(
+                    "UPDATE deliveries SET status = ?, updated_at = ? WHERE id = ?",
+                    ((IN_PROGRESS, time.time(), row[0]) for row in rows)
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        return rows
+
+    def complete(self, results: Dict[int, bool]):
+        """Сохранение результатов пачки одной транзакцией: {id доставки: успех}"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany(
+                    "UPDATE deliveries SET status = ?, updated_at = ? WHERE id = ?",
+                    ((DELIVERED if success else FAILED, now, delivery_id)
+                     for delivery_id, success in results.items())
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def recover(self) -> int:
+        """Вернуть в очередь пары, отправка которых прервалась перезапуском"""
+        with self.lock:
+            cursor = self.conn.execute(
+                "UPDATE deliveries SET status = ?, updated_at = ? WHERE status = ?",
+                (PENDING, time.time(), IN_PROGRESS)
+            )
+        if cursor.rowcount:
+            logger.info(f"♻️ Возвращено в очередь {cursor.rowcount} прерванных доставок")
+        return cursor.rowcount
+
+    def release(self, delivery_ids: Iterable[int]):
+        """Вернуть в очередь взятые, но не отправленные пары"""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany(
+                    "UPDATE deliveries SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                    ((PENDING, time.time(), delivery_id, IN_PROGRESS) for delivery_id in delivery_ids)
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def pending_count(self, post_id: Optional[int] = None) -> int:
+        """Количество недоставленных пар (всего или одного поста)"""
+        with self.lock:
+            if post_id is None:
+                row = self.conn.execute(
+                    "SELECT COUNT(*) FROM deliveries WHERE status IN (?, ?)",
+                    (PENDING, IN_PROGRESS)
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    "SELECT COUNT(*) FROM deliveries WHERE post_id = ? AND status = ?",
+                    (post_id, PENDING)
+                ).fetchone()
+        return row[0]
+
+    def payload(self, post_id: int) -> Dict[str, Any]:
+        """Содержимое поста"""
+        with self.lock:
+            row = self.conn.execute("SELECT payload FROM posts WHERE id = ?", (post_id,)).fetchone()
+        return json.loads(row[0])
+
+    def missed_slots(self, schedule_times: Iterable[str], now: datetime,
+                     window_minutes: int = OUTBOX_CATCHUP_MINUTES) -> List[str]:
+        """Слоты расписания за последние window_minutes минут, которые не были поставлены в очередь"""
+        missed = []
+        for time_str in schedule_times:
+            hour, minute = map(int, time_str.split(':'))
+            slot = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if slot <= now < slot + timedelta(minutes=window_minutes):
+                if not self.has_post(schedule_post_key(now, time_str)):
+                    missed.append(time_str)
+        return missed
+
+    def close(self):
+        """Закрытие базы"""
+        with self.lock:
+            self.conn.close()
+
+
+def _group_by_post(outbox: Outbox, batch: List[Delivery], payloads: Dict[int, Dict[str, Any]]):
+    """Разбиение пачки на посты: (id поста, пост, {канал: id доставки})"""
+    groups: Dict[int, Dict[Any, int]] = {}
+    for delivery_id, post_id, channel in batch:
+        groups.setdefault(post_id, {})[channel] = delivery_id
+
+    for post_id, channels in groups.items():
+        if post_id not in payloads:
+            payloads[post_id] = outbox.payload(post_id)
+        yield post_id, payloads[post_id], channels
+
+
+async def iter_drain_async(
+    outbox: Outbox,
+    stream_batch: Callable[[int, Dict[str, Any], List[Any]], AsyncIterator[Tuple[Any, bool]]],
+    post_id: Optional[int] = None,
+    batch_size: int = OUTBOX_BATCH_SIZE
+) -> AsyncIterator[Tuple[Any, bool]]:
+    """Отправка недоставленных пар из очереди с выдачей (канал, успех) по мере готовности
+
+    stream_batch(id поста, пост, каналы) - асинхронный поток (канал, успех).
+    Результаты сохраняются пачками; если перебор прерван, неотправленные
+    пары возвращаются в очередь.
+    """
+    payloads: Dict[int, Dict[str, Any]] = {}
+
+    while True:
+        batch = outbox.claim(batch_size, post_id)
+        if not batch:
+            return
+
+        try:
+            for batch_post_id, post, channels in _group_by_post(outbox, batch, payloads):
+                sent: Dict[int, bool] = {}
+                stream = stream_batch(batch_post_id, post, list(channels))
+                try:
+                    async for channel, success in stream:
+                        sent[channels[channel]] = success
+                        yield channel, success
+                finally:
+                    await stream.aclose()
+                    outbox.complete(sent)
+        finally:
+            # Завершенные пары release не трогает, остальные возвращаются в очередь
+            outbox.release(delivery_id for delivery_id, _, _ in batch)
+
+
+async def drain_async(
+    outbox: Outbox,
+    stream_batch: Callable[[int, Dict[str, Any], List[Any]], AsyncIterator[Tuple[Any, bool]]],
+    post_id: Optional[int] = None,
+    batch_size: int = OUTBOX_BATCH_SIZE
+) -> Dict[Any, bool]:
+    """Отправка недоставленных пар из очереди (asyncio), результат - {канал: успех}"""
+    results = {}
+    async for channel, success in iter_drain_async(outbox, stream_batch, post_id, batch_size):
+        results[channel] = success
+
+    return results
+
+
+def drain_sync(
+    outbox: Outbox,
+    send_batch: Callable[[int, Dict[str, Any], List[Any]], Dict[Any, bool]],
+    post_id: Optional[int] = None,
+    batch_size: int = OUTBOX_BATCH_SIZE
+) -> Dict[Any, bool]:
+    """Отправка недоставленных пар из очереди (синхронно)"""
+    results = {}
+    payloads: Dict[int, Dict[str, Any]] = {}
+
+    while True:
+        batch = outbox.claim(batch_size, post_id)
+        if not batch:
+            return results
+
+        for batch_post_id, post, channels in _group_by_post(outbox, batch, payloads):
+            sent = send_batch(batch_post_id, post, list(channels))
+            outbox.complete({channels[channel]: sent.get(channel, False) for channel in channels})
+            results.update(sent)
+
+
+def publish_missed_slots(outbox: Outbox, schedule_times: Iterable[str], now: datetime,
+                         publish: Callable[[str], Any]):
+    """Публикация слотов расписания, пропущенных во время простоя (вызывать только при старте)"""
+    for time_str in outbox.missed_slots(schedule_times, now):
+        logger.info(f"⏰ Публикация на {time_str} МСК пропущена во время простоя, публикуем сейчас")
+        publish(time_str)
+
+
+# Одна база на процесс: ее делят планировщик, polling и веб-интерфейс
+_outbox: Optional[Outbox] = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox() -> Outbox:
+    """Получение общей очереди доставки процесса"""
+    global _outbox
+
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = Outbox()
+            logger.info(f"📦 Очередь доставки: {OUTBOX_PATH}, недоставлено: {_outbox.pending_count()}")
+        return _outbox
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Long polling getUpdates для ботов на голом Bot API
+Telegram держит запрос getUpdates до POLL_TIMEOUT секунд и отвечает, как
+только приходит обновление: команда обрабатывается сразу, а бот без
+сообщений делает один запрос в POLL_TIMEOUT секунд. Пауза между запросами
+бывает только после ошибки и растет экспоненциально до POLL_BACKOFF_MAX.
+Номер последнего принятого обновления хранится в базе, поэтому после
+перезапуска бот не получает команды повторно.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from typing import List, Optional
+
+from outbox import OUTBOX_PATH
+from retry import RetryPolicy, classify_exception
+from token_pool import bot_id
+
+# Импортируем конфигурацию
+try:
+    from config import POLL_TIMEOUT, POLL_ALLOWED_UPDATES, POLL_BACKOFF_MAX
+except ImportError:
+    # Если config.py недоступен, используем переменные окружения
+    POLL_TIMEOUT = int(os.getenv('POLL_TIMEOUT', '50'))
+    POLL_ALLOWED_UPDATES = [kind.strip() for kind in os.getenv('POLL_ALLOWED_UPDATES', 'message').split(',') if kind.strip()]
+    POLL_BACKOFF_MAX = float(os.getenv('POLL_BACKOFF_MAX', '60'))
+
+# Таймаут HTTP-запроса getUpdates: сервер сам держит его до POLL_TIMEOUT секунд
+POLL_HTTP_TIMEOUT = POLL_TIMEOUT + 10
+
+SCHEMA = """
+-- update_id последнего принятого обновления; вместо токена хранится только ID бота
+CREATE TABLE IF NOT EXISTS update_offsets (
+    bot_id INTEGER NOT NULL PRIMARY KEY,
+    update_id INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def updates_request(offset: int, allowed_updates: List[str] = POLL_ALLOWED_UPDATES) -> dict:
+    """Поля запроса getUpdates: подтверждение обновлений до offset, долгое ожидание и нужные типы обновлений"""
+    return {
+        'offset': offset,
+        'timeout': POLL_TIMEOUT,
+        'allowed_updates': json.dumps(allowed_updates)
+    }
+
+
+class PollBackoff:
+    """Пауза перед повтором getUpdates после ошибок подряд
+
+    Растет экспоненциально со случайным разбросом до max_delay; если
+    Telegram вернул retry_after, ждем столько, сколько он сказал.
+    Успешный ответ сбрасывает счетчик.
+    """
+
+    def __init__(self, max_delay: float = POLL_BACKOFF_MAX):
+        self.policy = RetryPolicy(max_attempts=0, base_delay=1, max_delay=max_delay)
+        self.failures = 0
+
+    def failure(self, error: Exception) -> float:
+        """Учет ошибки; возвращает паузу перед следующим запросом"""
+        self.failures += 1
+        return self.policy.delay(self.failures, classify_exception(error).retry_after)
+
+    def success(self):
+        self.failures = 0
+
+
+class UpdateOffsets:
+    """Номер последнего принятого обновления каждого бота
+
+    Без него бот после перезапуска начинает с offset 1, и Telegram заново
+    присылает неподтвержденные команды: /post публикуется второй раз.
+    """
+
+    def __init__(self, path: str = OUTBOX_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Запись в WAL без fsync переживает перезапуск процесса; после сбоя питания
+        # возможен лишь повтор последней пачки обновлений
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def get(self, token: str) -> int:
+        """update_id последнего принятого обновления бота (0, если бот еще ничего не получал)"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT update_id FROM update_offsets WHERE bot_id = ?", (bot_id(token),)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def save(self, token: str, update_id: int):
+        """Запоминание последнего принятого обновления (одна запись на пачку getUpdates)"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO update_offsets (bot_id, update_id) VALUES (?, ?)",
+                (bot_id(token), update_id)
+            )
+
+    def close(self):
+        """Закрытие базы"""
+        with self.lock:
+            self.conn.close()
+
+
+# Одно хранилище на процесс
+_update_offsets: Optional[UpdateOffsets] = None
+_update_offsets_lock = threading.Lock()
+
+
+def get_update_offsets() -> UpdateOffsets:
+    """Получение общего хранилища номеров обновлений процесса"""
+    global _update_offsets
+
+    with _update_offsets_lock:
+        if _update_offsets is None:
+            _update_offsets = UpdateOffsets()
+        return _update_offsets
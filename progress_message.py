@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Ход ручной рассылки в одном сообщении
+Оператор получает одно сообщение, которое редактируется по мере отправки
+с частотой не выше PROGRESS_UPDATE_INTERVAL
+"""
+
+import os
+import time
+from typing import Optional
+
+from fanout import FanOutProgress
+
+# Импортируем конфигурацию
+try:
+    from config import PROGRESS_UPDATE_INTERVAL
+except ImportError:
+    # Если config.py недоступен, используем переменные окружения
+    PROGRESS_UPDATE_INTERVAL = float(os.getenv('PROGRESS_UPDATE_INTERVAL', '1'))
+
+
+def format_progress(progress: FanOutProgress, title: str = "публикации") -> str:
+    """Текст сообщения о ходе рассылки (HTML); для итоговой сводки - отчет о результатах"""
+    if progress.is_summary:
+        return f"""📊 <b>Результаты {title}:</b>
+
+✅ Успешно: {progress.successful}
+❌ Ошибки: {progress.failed}
+📤 Всего каналов: {progress.done}
+⏱ Время: {progress.elapsed:.0f} сек"""
+
+    text = f"""⏳ <b>Ход {title}:</b> {progress.done} из {progress.total}
+
+✅ Успешно: {progress.successful}
+❌ Ошибки: {progress.failed}"""
+
+    remaining = progress.remaining
+    if remaining is not None:
+        text += f"\n⏱ Осталось: ~{remaining:.0f} сек"
+    return text
+
+
+class ProgressThrottle:
+    """Решает, пора ли обновлять сообщение о ходе рассылки
+
+    Промежуточные обновления не чаще interval секунд и только если текст
+    изменился (Telegram отклоняет редактирование без изменений); итоговая
+    сводка проходит всегда. Само редактирование вызывающий код отправляет
+    через общий ограничитель, поэтому оно входит в общий лимит бота.
+    """
+
+    def __init__(self, interval: float = PROGRESS_UPDATE_INTERVAL):
+        self.interval = interval
+        self.last_update = 0.0
+        self.last_text: Optional[str] = None
+
+    def update(self, progress: FanOutProgress, title: str = "публикации") -> Optional[str]:
+        """Новый текст сообщения или None, если обновлять пока не нужно"""
+        now = time.monotonic()
+        if not progress.is_summary and now - self.last_update < self.interval:
+            return None
+
+        text = format_progress(progress, title)
+        if text == self.last_text:
+            return None
+
+        self.last_update = now
+        self.last_text = text
+        return text
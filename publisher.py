@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Публикация постов в каналы через python-telegram-bot
+Общий TelegramPublisher всех ботов на python-telegram-bot (текст и альбомы
+через очередь доставки) и досылка при старте (catch_up)
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
+
+import pytz
+from telegram.error import TelegramError
+
+from fanout import iter_fan_out, run_sync, track_progress, create_bot, FanOutProgress, FANOUT_CONCURRENCY, FANOUT_TIMEOUT
+from token_pool import ADMIN_STATUSES, TokenPool, bot_id, pool_tokens
+from retry import RetryPolicy, classify_exception
+from outbox import drain_async, get_outbox, iter_drain_async, publish_missed_slots
+from delivery_ledger import get_ledger
+from circuit_breaker import get_circuit_breaker
+from media_group import AlbumItem, AlbumPublisher, album_post, validate_album
+
+# Импортируем конфигурацию
+try:
+    from config import CHANNELS, TIMEZONE, POST_TEMPLATES
+except ImportError:
+    # Если config.py недоступен, каналы и шаблоны передает бот
+    CHANNELS = []
+    TIMEZONE = os.getenv('TIMEZONE', 'Europe/Moscow')
+    POST_TEMPLATES = {}
+
+logger = logging.getLogger(__name__)
+
+
+class TelegramPublisher:
+    """Класс для публикации сообщений в Telegram каналы
+
+    channels, post_templates и timezone по умолчанию берутся из config.py;
+    в stats (bot_status веб-панели) ведется счетчик публикаций и ошибок.
+    """
+
+    def __init__(self, bot_token: Union[str, List[str]], concurrency: int = FANOUT_CONCURRENCY, timeout: float = FANOUT_TIMEOUT,
+                 channels: Optional[List] = None, post_templates: Optional[Dict[str, Dict[str, str]]] = None,
+                 timezone: Optional[str] = None, stats: Optional[Dict[str, Any]] = None):
+        # Рассылку делят несколько ботов: у каждого свои лимиты Telegram
+        self.token_pool = TokenPool(pool_tokens(bot_token))
+        self.bots = {token: create_bot(token, concurrency) for token in self.token_pool.tokens}
+        self.bot = self.bots[self.token_pool.primary]
+        self.channels = CHANNELS if channels is None else channels
+        self.post_templates = POST_TEMPLATES if post_templates is None else post_templates
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.rate_limiter = self.token_pool.rate_limiter
+        self.retry_policy = RetryPolicy()
+        self.outbox = get_outbox()
+        self.ledger = get_ledger()
+        self.breaker = get_circuit_breaker()
+        # Альбомы (sendMediaGroup) рассылаются с повторным использованием file_id
+        self.albums = AlbumPublisher(self)
+        self.timezone = pytz.timezone(timezone or TIMEZONE)
+        self.stats = stats
+
+    async def publish_to_channel(self, channel: str, message: str, parse_mode: str = 'HTML', post_id: Optional[int] = None) -> bool:
+        """Публикация сообщения в один канал"""
+        # Повтор или досылка после перезапуска не должны публиковать пост второй раз
+        if post_id is not None and self.ledger.is_delivered(post_id, channel):
+            logger.info(f"⏭️ Пост {post_id} уже опубликован в {channel}")
+            return True
+
+        try:
+            bot = self.bots[self.token_pool.token_for(channel)]
+            sent = await bot.send_message(
+                chat_id=channel,
+                text=message,
+                parse_mode=parse_mode
+            )
+            if post_id is not None:
+                self.ledger.record(post_id, channel, sent.message_id)
+            self.breaker.record_success(channel)
+            logger.info(f"✅ Сообщение успешно отправлено в {channel}")
+            return True
+        except TelegramError as e:
+            error = classify_exception(e)
+            if error.transient:
+                # Временные ошибки повторяет fan_out
+                raise error
+            self.breaker.record_failure(channel, error)
+            logger.error(f"❌ Ошибка при отправке в {channel}: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"❌ Неожиданная ошибка при отправке в {channel}: {e}", exc_info=True)
+            return False
+
+    async def _is_admin(self, token: str, channel) -> bool:
+        """Может ли бот пула публиковать в канал"""
+        member = await self.bots[token].get_chat_member(chat_id=channel, user_id=bot_id(token))
+        return member.status in ADMIN_STATUSES
+
+    async def assign_channels(self):
+        """Закрепление каналов за ботами пула (проверяются только каналы без закрепления)"""
+        await self.token_pool.refresh_async(self._is_admin, self.channels, self.concurrency, self.timeout)
+
+    def _stream_batch(self, post_id: int, post: dict, channels: List) -> AsyncIterator[Tuple[str, bool]]:
+        """Отправка поста в часть каналов параллельно, не более self.concurrency одновременно"""
+        if post.get('album'):
+            return self.albums.stream_batch(post_id, post, channels)
+        return iter_fan_out(
+            channels,
+            lambda channel: self.publish_to_channel(channel, post['text'], post.get('parse_mode', 'HTML'), post_id),
+            self.concurrency,
+            self.timeout,
+            self.rate_limiter,
+            self.retry_policy,
+            # Каналы на карантине пропускаются без запроса
+            self.breaker.should_skip
+        )
+
+    async def publish_stream(self, message: str, parse_mode: str = 'HTML', post_key: Optional[str] = None) -> AsyncIterator[FanOutProgress]:
+        """Публикация во все каналы с выдачей результата каждого канала по мере готовности
+
+        Последней приходит итоговая сводка (channel равен None).
+        """
+        logger.info(f"🚀 Начинаем публикацию сообщения в {len(self.channels)} каналов")
+
+        async for progress in self._publish_post_stream({'text': message, 'parse_mode': parse_mode}, post_key):
+            yield progress
+
+    async def publish_album_stream(self, items: List[AlbumItem], caption: str = '', parse_mode: str = 'HTML',
+                                   post_key: Optional[str] = None) -> AsyncIterator[FanOutProgress]:
+        """Публикация альбома (2-10 фото и видео, документов или аудио) во все каналы одним запросом на канал
+
+        Неверный альбом выбрасывает ValueError до записи рассылки в очередь.
+        """
+        validate_album(items)
+        logger.info(f"🚀 Начинаем публикацию альбома из {len(items)} медиа в {len(self.channels)} каналов")
+
+        # Медиа скачивается в кэш до рассылки, а это блокирующая операция
+        post = await asyncio.get_running_loop().run_in_executor(None, album_post, items, caption, parse_mode)
+        async for progress in self._publish_post_stream(post, post_key):
+            yield progress
+
+    async def _publish_post_stream(self, post: dict, post_key: Optional[str]) -> AsyncIterator[FanOutProgress]:
+        """Запись поста в очередь доставки и рассылка с выдачей результатов по мере готовности"""
+        await self.assign_channels()
+
+        # Сначала записываем рассылку на диск, чтобы после перезапуска дослать недоставленное
+        post_id = self.outbox.enqueue(post_key, post, self.channels)
+        results = iter_drain_async(self.outbox, self._stream_batch, post_id)
+
+        async for progress in track_progress(results, self.outbox.pending_count(post_id)):
+            if progress.is_summary:
+                self._count_summary(progress)
+            yield progress
+
+    def _count_summary(self, summary: FanOutProgress):
+        """Итог рассылки в лог и в статистику stats"""
+        logger.info(f"📊 Результаты публикации: {summary.successful} успешно, {summary.failed} с ошибками")
+
+        if self.stats is not None:
+            self.stats['total_published'] += summary.successful
+            # Ошибкой считается только итоговая неудача канала, а не каждая попытка до повтора
+            self.stats['errors'] += summary.failed
+            self.stats['last_publish'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    async def publish_to_all_channels(self, message: str, parse_mode: str = 'HTML', post_key: Optional[str] = None) -> Dict[str, bool]:
+        """Публикация сообщения во все каналы"""
+        results = {}
+        async for progress in self.publish_stream(message, parse_mode, post_key):
+            if not progress.is_summary:
+                results[progress.channel] = progress.success
+
+        return results
+
+    async def publish_album_to_all_channels(self, items: List[AlbumItem], caption: str = '', parse_mode: str = 'HTML',
+                                            post_key: Optional[str] = None) -> Dict[str, bool]:
+        """Публикация альбома во все каналы"""
+        results = {}
+        async for progress in self.publish_album_stream(items, caption, parse_mode, post_key):
+            if not progress.is_summary:
+                results[progress.channel] = progress.success
+
+        return results
+
+    async def resume_outbox(self) -> Dict[str, bool]:
+        """Досылка рассылок, прерванных перезапуском (вызывать только при старте)"""
+        self.outbox.recover()
+        await self.assign_channels()
+        results = await drain_async(self.outbox, self._stream_batch)
+
+        if results:
+            successful = sum(1 for success in results.values() if success)
+            logger.info(f"♻️ Дослано после перезапуска: {successful} из {len(results)}")
+            if self.stats is not None:
+                self.stats['errors'] += len(results) - successful
+
+        return results
+
+    def get_current_time_moscow(self) -> datetime:
+        """Получение текущего времени в МСК"""
+        return datetime.now(self.timezone)
+
+    def get_post_for_time(self, time_str: str) -> Optional[Dict[str, str]]:
+        """Получение шаблона поста для указанного времени"""
+        return self.post_templates.get(time_str)
+
+
+def catch_up(publisher: TelegramPublisher, schedule_times: List[str], publish: Callable[[str], Any]):
+    """Досылка прерванных рассылок и слотов, пропущенных во время простоя (вызывать только при старте)
+
+    publish получает время слота и публикует его синхронно, как планировщик.
+    """
+    run_sync(publisher.resume_outbox())
+    publish_missed_slots(publisher.outbox, schedule_times, publisher.get_current_time_moscow(), publish)
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Ограничение частоты запросов к Telegram Bot API
+Общий лимит бота плюс отдельный лимит на каждый чат, чтобы не получать 429
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional, Union
+
+# Импортируем конфигурацию
+try:
+    from config import RATE_LIMIT_GLOBAL, RATE_LIMIT_PER_CHAT, RATE_LIMIT_PER_GROUP
+except ImportError:
+    # Если config.py недоступен, используем переменные окружения
+    RATE_LIMIT_GLOBAL = float(os.getenv('RATE_LIMIT_GLOBAL', '30'))
+    RATE_LIMIT_PER_CHAT = float(os.getenv('RATE_LIMIT_PER_CHAT', '1'))
+    RATE_LIMIT_PER_GROUP = float(os.getenv('RATE_LIMIT_PER_GROUP', '20'))
+
+logger = logging.getLogger(__name__)
+
+ChatId = Union[int, str]
+
+# Сколько корзин чатов хранить, прежде чем удалять простаивающие
+MAX_IDLE_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Корзина токенов: rate запросов в секунду с запасом capacity
+
+    Токены выдаются в долг: reserve() сразу занимает слот и возвращает,
+    сколько секунд нужно подождать до него. Блокировка не удерживается
+    во время ожидания, поэтому корзину можно делить между потоками
+    и циклами событий.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.interval = 1.0 / rate
+        self.tolerance = (capacity - 1) * self.interval
+        self.next_free = 0.0
+
+    def reserve(self, now: float) -> float:
+        """Занять ближайший слот и вернуть задержку до него (без блокировки)"""
+        start = max(now, self.next_free - self.tolerance)
+        self.next_free = max(self.next_free, start) + self.interval
+        return start - now
+
+    def is_idle(self, now: float) -> bool:
+        """Корзина полностью восстановилась и ничем не отличается от новой"""
+        return self.next_free <= now
+
+
+class RateLimiter:
+    """Общий ограничитель отправки для всех точек входа бота"""
+
+    def __init__(
+        self,
+        global_rate: float = RATE_LIMIT_GLOBAL,
+        per_chat_rate: float = RATE_LIMIT_PER_CHAT,
+        per_group_rate: float = RATE_LIMIT_PER_GROUP
+    ):
+        self.global_bucket = TokenBucket(global_rate)
+        self.per_chat_rate = per_chat_rate
+        self.per_group_rate = per_group_rate / 60.0  # в конфиге - сообщений в минуту
+        self.chat_buckets: Dict[str, TokenBucket] = {}
+        self.lock = threading.Lock()
+
+    def _chat_rate(self, chat_id: ChatId) -> float:
+        """Лимит для чата: каналы и группы строже личных чатов"""
+        chat = str(chat_id)
+        if chat.startswith('-') or chat.startswith('@'):
+            return self.per_group_rate
+        return self.per_chat_rate
+
+    def _reserve_chat(self, chat_id: Optional[ChatId]) -> float:
+        if chat_id is None:
+            return 0.0
+
+        with self.lock:
+            now = time.monotonic()
+            key = str(chat_id)
+            bucket = self.chat_buckets.get(key)
+            if bucket is None:
+                if len(self.chat_buckets) >= MAX_IDLE_BUCKETS:
+                    self._prune(now)
+                bucket = self.chat_buckets[key] = TokenBucket(self._chat_rate(chat_id))
+            return bucket.reserve(now)
+
+    def _reserve_global(self) -> float:
+        with self.lock:
+            return self.global_bucket.reserve(time.monotonic())
+
+    def _prune(self, now: float):
+        """Удаление корзин чатов, которые давно не использовались"""
+        idle = [key for key, bucket in self.chat_buckets.items() if bucket.is_idle(now)]
+        for key in idle:
+            del self.chat_buckets[key]
+
+    def penalize(self, chat_id: Optional[ChatId], seconds: float):
+        """Не отправлять в чат (или никуда, если chat_id не указан) seconds секунд после 429"""
+        with self.lock:
+            now = time.monotonic()
+            if chat_id is None:
+                bucket = self.global_bucket
+            else:
+                key = str(chat_id)
+                bucket = self.chat_buckets.get(key)
+                if bucket is None:
+                    bucket = self.chat_buckets[key] = TokenBucket(self._chat_rate(chat_id))
+            bucket.next_free = max(bucket.next_free, now + seconds)
+
+    def acquire(self, chat_id: Optional[ChatId] = None):
+        """Дождаться разрешения на отправку (для потоков и синхронного кода)"""
+        delay = self._reserve_chat(chat_id)
+        if delay > 0:
+            time.sleep(delay)
+
+        delay = self._reserve_global()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, chat_id: Optional[ChatId] = None):
+        """Дождаться разрешения на отправку (для asyncio)"""
+        delay = self._reserve_chat(chat_id)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        delay = self._reserve_global()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# Один ограничитель на бота в процессе: его делят планировщик, polling и веб-интерфейс
+# (лимиты Telegram считаются на бота, поэтому у каждого токена свой ограничитель)
+_rate_limiters: Dict[Optional[str], RateLimiter] = {}
+_rate_limiter_lock = threading.Lock()
+# Доля общего лимита бота, доступная процессу (рассылка в нескольких процессах)
+_process_share = 1.0
+
+
+def set_process_share(share: float):
+    """Ограничить общий лимит каждого бота в этом процессе долей share
+
+    Вызывать до первого get_rate_limiter(): лимиты на чат не меняются,
+    так как каждый канал обслуживает только один процесс.
+    """
+    global _process_share
+    _process_share = share
+
+
+def get_rate_limiter(bot_token: Optional[str] = None) -> RateLimiter:
+    """Получение общего ограничителя бота"""
+    with _rate_limiter_lock:
+        rate_limiter = _rate_limiters.get(bot_token)
+        if rate_limiter is None:
+            global_rate = RATE_LIMIT_GLOBAL * _process_share
+            rate_limiter = _rate_limiters[bot_token] = RateLimiter(global_rate=global_rate)
+            bot = f"боту {bot_token.split(':', 1)[0]}" if bot_token else "боту"
+            logger.info(
+                f"🚦 Ограничение отправки по {bot}: {global_rate:g} сообщ./сек всего, "
+                f"{RATE_LIMIT_PER_CHAT:g} сообщ./сек в личный чат, "
+                f"{RATE_LIMIT_PER_GROUP:g} сообщ./мин в канал"
+            )
+        return rate_limiter
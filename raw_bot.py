@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Общая основа ботов на прямых запросах к Bot API (render_simple_bot, render_media_bot)
+Транспорт requests/aiohttp, закрепление каналов за ботами пула, досылка из
+очереди доставки, long polling и webhook; команды и рассылку постов задают наследники
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Union
+
+import pytz
+import requests
+
+from token_pool import ADMIN_STATUSES, TokenPool, bot_id, pool_tokens
+from retry import RetryPolicy, SendError, classify_exception, error_from_response, retry_call, retry_call_async
+from outbox import drain_sync, get_outbox, iter_drain_async
+from delivery_ledger import get_ledger
+from dispatcher import ChatDispatcher
+from webhook import WebhookServer, webhook_address, webhook_request, webhook_secret
+from polling import POLL_HTTP_TIMEOUT, POLL_TIMEOUT, PollBackoff, get_update_offsets, updates_request
+from circuit_breaker import get_circuit_breaker
+from fanout import ProgressCounter, bot_api_url, create_session, iterate_sync
+from bot_api import ASYNC_TRANSPORT, FORM_HEADERS, AsyncBotAPI, MultipartBody
+from progress_message import ProgressThrottle, format_progress
+
+logger = logging.getLogger(__name__)
+
+
+class RawTelegramBot:
+    """Бот на прямых HTTP-запросах к Bot API
+
+    Наследник задает router (таблица команд), _send_batch, _stream_batch_async
+    и при необходимости BROADCAST_COMMANDS.
+    """
+    
+    # Команды-рассылки: выполняются в отдельном пуле и не задерживают быстрые команды
+    BROADCAST_COMMANDS = ()
+    
+    def __init__(self, bot_token: Union[str, List[str]], channels: List, timezone: str):
+        # Рассылку делят несколько ботов: у каждого свои лимиты Telegram
+        self.token_pool = TokenPool(pool_tokens(bot_token))
+        self.bot_token = self.token_pool.primary
+        self.api_urls = {token: bot_api_url(token) for token in self.token_pool.tokens}
+        self.api_url = self.api_urls[self.bot_token]
+        self.channels = channels
+        self.timezone = pytz.timezone(timezone)
+        # Номер последнего принятого обновления переживает перезапуск: команды не выполняются повторно
+        self.update_offsets = get_update_offsets()
+        self.last_update_id = self.update_offsets.get(self.bot_token)
+        # Команды выполняются вне цикла polling, по порядку внутри каждого чата
+        self.dispatcher = ChatDispatcher(self.handle_update, self.BROADCAST_COMMANDS)
+        self.rate_limiter = self.token_pool.rate_limiter
+        self.retry_policy = RetryPolicy()
+        self.outbox = get_outbox()
+        self.ledger = get_ledger()
+        self.breaker = get_circuit_breaker()
+        # Одна сессия с keep-alive на все запросы вместо нового соединения на каждый
+        self.session = create_session()
+        # Параллельная рассылка через aiohttp (если установлен; async_transport = False включает requests)
+        self.async_api = AsyncBotAPI()
+        self.async_transport = ASYNC_TRANSPORT
+        
+    def _request(self, method: str, data: Union[dict, bytes, MultipartBody], timeout: float, chat_id=None):
+        """Вызов метода Bot API, при ошибке выбрасывает SendError
+
+        data - поля запроса, готовое тело формы или тело с файлом (тогда chat_id передается отдельно).
+        """
+        if isinstance(data, dict):
+            chat_id = data.get('chat_id')
+        self.rate_limiter.acquire(chat_id)
+        
+        try:
+            api_url = self.api_urls[self.token_pool.token_for(chat_id)]
+            headers = FORM_HEADERS if isinstance(data, bytes) else None
+            if isinstance(data, MultipartBody):
+                # Файл уходит частями прямо с диска
+                headers, data = data.headers, data.reader()
+            response = self.session.post(f"{api_url}/{method}", data=data, headers=headers, timeout=timeout)
+        except requests.RequestException as e:
+            raise classify_exception(e)
+        
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = None
+        
+        if response.status_code == 200 and payload and payload.get('ok'):
+            return payload.get('result')
+        
+        error = error_from_response(response.status_code, payload, response.text)
+        if error.retry_after:
+            self.rate_limiter.penalize(chat_id, error.retry_after)
+        raise error
+    
+    async def _call_async(self, method: str, data: Union[dict, bytes, MultipartBody], timeout: float, chat_id=None):
+        """Вызов метода Bot API из asyncio без ограничителя (при рассылке его проходит iter_fan_out)"""
+        if isinstance(data, dict):
+            chat_id = data.get('chat_id')
+        api_url = self.api_urls[self.token_pool.token_for(chat_id)]
+        return await self.async_api.call(api_url, method, data, timeout)
+    
+    async def _request_async(self, method: str, data: Union[dict, bytes, MultipartBody], timeout: float, chat_id=None):
+        """Вызов метода Bot API из asyncio, при ошибке выбрасывает SendError"""
+        if isinstance(data, dict):
+            chat_id = data.get('chat_id')
+        await self.rate_limiter.acquire_async(chat_id)
+        
+        try:
+            return await self._call_async(method, data, timeout, chat_id)
+        except SendError as error:
+            if error.retry_after:
+                self.rate_limiter.penalize(chat_id, error.retry_after)
+            raise
+    
+    def send_message(self, chat_id: str, text: str, parse_mode: str = 'HTML') -> bool:
+        """Отправка текстового сообщения"""
+        try:
+            data = {
+                'chat_id': chat_id,
+                'text': text,
+                'parse_mode': parse_mode
+            }
+            retry_call(lambda: self._request('sendMessage', data, 10), self.retry_policy, chat_id)
+            logger.info(f"✅ Сообщение отправлено в {chat_id}")
+            return True
+                
+        except Exception as e:
+            logger.error(f"❌ Ошибка отправки в {chat_id}: {e}")
+            return False
+    
+    async def send_message_async(self, chat_id: str, text: str, parse_mode: str = 'HTML') -> bool:
+        """Отправка текстового сообщения из asyncio"""
+        try:
+            data = {
+                'chat_id': chat_id,
+                'text': text,
+                'parse_mode': parse_mode
+            }
+            await retry_call_async(lambda: self._request_async('sendMessage', data, 10), self.retry_policy, chat_id)
+            logger.info(f"✅ Сообщение отправлено в {chat_id}")
+            return True
+                
+        except Exception as e:
+            logger.error(f"❌ Ошибка отправки в {chat_id}: {e}")
+            return False
+    
+    def _is_admin(self, token: str, channel) -> bool:
+        """Может ли бот пула публиковать в канал"""
+        data = {
+            'chat_id': channel,
+            'user_id': bot_id(token)
+        }
+        response = self.session.post(f"{self.api_urls[token]}/getChatMember", data=data, timeout=10)
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = None
+        
+        if response.status_code == 429 or response.status_code >= 500:
+            # Проверка не состоялась - это не ответ "не администратор"
+            raise error_from_response(response.status_code, payload, response.text)
+        member = (payload or {}).get('result') or {}
+        return member.get('status') in ADMIN_STATUSES
+    
+    def assign_channels(self):
+        """Закрепление каналов за ботами пула (проверяются только каналы без закрепления)"""
+        self.token_pool.refresh_sync(self._is_admin, self.channels)
+    
+    async def _is_admin_async(self, token: str, channel) -> bool:
+        """Может ли бот пула публиковать в канал (asyncio)"""
+        data = {
+            'chat_id': channel,
+            'user_id': bot_id(token)
+        }
+        member = await self.async_api.call(self.api_urls[token], 'getChatMember', data, 10) or {}
+        return member.get('status') in ADMIN_STATUSES
+    
+    async def assign_channels_async(self):
+        """Закрепление каналов за ботами пула (asyncio, каналы проверяются параллельно)"""
+        await self.token_pool.refresh_async(self._is_admin_async, self.channels)
+    
+    def _drain(self, post_id: Optional[int] = None, on_result=None) -> Dict[str, bool]:
+        """Отправка из очереди доставки: параллельно через aiohttp, если он доступен, иначе по одному каналу"""
+        if not self.async_transport:
+            return drain_sync(
+                self.outbox,
+                lambda batch_post_id, batch_post, channels: self._send_batch(batch_post_id, batch_post, channels, on_result),
+                post_id
+            )
+        
+        results = {}
+        for channel, success in iterate_sync(iter_drain_async(self.outbox, self._stream_batch_async, post_id)):
+            results[channel] = success
+            if on_result:
+                on_result(channel, success)
+        return results
+    
+    def resume_outbox(self) -> Dict[str, bool]:
+        """Досылка рассылок, прерванных перезапуском (вызывать только при старте)"""
+        self.outbox.recover()
+        self.assign_channels()
+        results = self._drain()
+        
+        if results:
+            successful = sum(1 for success in results.values() if success)
+            logger.info(f"♻️ Дослано после перезапуска: {successful} из {len(results)}")
+        
+        return results
+    
+    def send_status(self, chat_id: str, text: str) -> Optional[int]:
+        """Отправка служебного сообщения оператору, возвращает его message_id"""
+        try:
+            data = {
+                'chat_id': chat_id,
+                'text': text
+            }
+            sent = retry_call(lambda: self._request('sendMessage', data, 10), self.retry_policy, chat_id)
+            return sent.get('message_id')
+                
+        except Exception as e:
+            logger.error(f"❌ Ошибка отправки в {chat_id}: {e}")
+            return None
+    
+    def edit_message(self, chat_id: str, message_id: int, text: str, parse_mode: str = 'HTML') -> bool:
+        """Редактирование сообщения (запрос проходит через общий ограничитель отправки)"""
+        try:
+            data = {
+                'chat_id': chat_id,
+                'message_id': message_id,
+                'text': text,
+                'parse_mode': parse_mode
+            }
+            self._request('editMessageText', data, 10)
+            return True
+                
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось обновить сообщение {message_id} в {chat_id}: {e}")
+            return False
+    
+    def _broadcast_with_progress(self, chat_id: str, start_text: str, title: str, broadcast) -> Dict[str, bool]:
+        """Рассылка с ходом в одном сообщении оператору
+
+        broadcast(on_result) выполняет рассылку; сообщение start_text
+        редактируется не чаще PROGRESS_UPDATE_INTERVAL и в конце заменяется отчетом.
+        """
+        status_id = self.send_status(chat_id, start_text)
+        counter = ProgressCounter(len(self.channels))
+        throttle = ProgressThrottle()
+        
+        def on_result(channel, success):
+            text = throttle.update(counter.add(channel, success), title)
+            if text and status_id:
+                self.edit_message(chat_id, status_id, text)
+        
+        results = broadcast(on_result)
+        
+        report = format_progress(counter.summary(), title)
+        if not status_id or not self.edit_message(chat_id, status_id, report):
+            self.send_message(chat_id, report, 'HTML')
+        return results
+    
+    def _call_primary(self, method: str, data: dict, timeout: float):
+        """Вызов метода Bot API основным ботом без ограничителя рассылки, при ошибке выбрасывает SendError"""
+        try:
+            response = self.session.post(f"{self.api_url}/{method}", data=data, timeout=timeout)
+        except requests.RequestException as e:
+            raise classify_exception(e)
+        
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = None
+        
+        if response.status_code == 200 and payload and payload.get('ok'):
+            return payload.get('result')
+        raise error_from_response(response.status_code, payload, response.text)
+    
+    def get_updates(self):
+        """Получение обновлений от Telegram (long polling), при ошибке выбрасывает SendError
+
+        Запрос ждет на стороне Telegram до POLL_TIMEOUT секунд и возвращается,
+        как только появляется обновление.
+        """
+        return self._call_primary('getUpdates', updates_request(self.last_update_id + 1), POLL_HTTP_TIMEOUT) or []
+    
+    async def get_updates_async(self):
+        """Получение обновлений от Telegram (long polling из asyncio), при ошибке выбрасывает SendError"""
+        params = updates_request(self.last_update_id + 1)
+        return await self.async_api.call(self.api_url, 'getUpdates', params, POLL_HTTP_TIMEOUT) or []
+    
+    def process_message(self, message):
+        """Обработка сообщения: обработчик команды выбирается по таблице команд"""
+        try:
+            chat_id = message['chat']['id']
+            route = self.router.route(message.get('text', ''))
+            if route:
+                handler, args = route
+                handler(chat_id, args)
+                
+        except Exception as e:
+            logger.error(f"❌ Ошибка обработки сообщения: {e}")
+    
+    def load_username(self):
+        """Имя бота для команд вида /post@имя_бота: команды другим ботам в группах не выполняются"""
+        try:
+            self.router.username = self._call_primary('getMe', {}, 10).get('username', '')
+        except SendError as e:
+            logger.warning(f"⚠️ Не удалось получить имя бота, команды принимаются с любым @именем: {e}")
+    
+    def run_polling(self):
+        """Запуск long polling для получения сообщений
+
+        Следующий запрос уходит сразу после обработки обновлений: пустой ответ
+        приходит не чаще раза в POLL_TIMEOUT секунд, а пауза бывает только
+        после ошибок и растет до POLL_BACKOFF_MAX.
+        """
+        logger.info(f"🚀 Запуск long polling для получения сообщений (ожидание до {POLL_TIMEOUT} сек)")
+        if self.last_update_id:
+            logger.info(f"↪️ Продолжаем с обновления {self.last_update_id + 1}")
+        backoff = PollBackoff()
+        self.load_username()
+        
+        # Пока у бота зарегистрирован webhook, Telegram отвечает на getUpdates ошибкой 409
+        try:
+            self._call_primary('deleteWebhook', {}, 10)
+        except SendError as e:
+            logger.warning(f"⚠️ Не удалось удалить webhook: {e}")
+        
+        while True:
+            try:
+                updates = self.get_updates()
+            except Exception as e:
+                delay = backoff.failure(e)
+                logger.error(f"❌ Ошибка получения обновлений: {e}, повтор через {delay:.1f} сек")
+                time.sleep(delay)
+                continue
+            backoff.success()
+            
+            # Цикл только передает обновления в обработку и сразу запрашивает следующие
+            for update in updates:
+                self.last_update_id = update['update_id']
+                self.dispatcher.submit(update)
+            if updates:
+                # Offset сохраняется при приеме, а не после выполнения: обновление
+                # обрабатывается не больше одного раза. Повтор после перезапуска
+                # опубликовал бы /post второй раз, а прерванную рассылку и так
+                # досылает очередь доставки. Цена - команды, которые ждали в
+                # диспетчере за рассылкой, при перезапуске теряются (close пишет их число в лог)
+                self.update_offsets.save(self.bot_token, self.last_update_id)
+    
+    def handle_update(self, update: dict):
+        """Обработка одного обновления Telegram (из polling или webhook)"""
+        if 'message' in update:
+            self.process_message(update['message'])
+    
+    def run_webhook(self):
+        """Прием обновлений через webhook: Telegram сам присылает их на WEBHOOK_URL
+
+        Обновления обрабатываются тем же диспетчером, что и при polling, поэтому
+        долгая рассылка не задерживает ответ Telegram и другие команды.
+        """
+        self.load_username()
+        self._call_primary('setWebhook', webhook_request(self.bot_token), 30)
+        logger.info(f"🚀 Webhook зарегистрирован: {webhook_address()}")
+        asyncio.run(WebhookServer(self.dispatcher.submit, webhook_secret(self.bot_token)).serve())
+    
+    def close(self):
+        """Закрытие соединений с Bot API"""
+        # Начатые команды не прерываются, но и не задерживают остановку
+        self.dispatcher.shutdown(wait=False)
+        self.session.close()
+        self.async_api.close_sync()
+        self.token_pool.close()
+    
+    async def close_async(self):
+        """Закрытие соединений aiohttp текущего цикла событий"""
+        await self.async_api.close()
@@ -9,11 +9,15 @@ import logging
 import schedule
 import time
 import threading
-from datetime import datetime
-from typing import List, Dict, Optional
-import pytz
+from typing import List, Union
 import os
 from flask import Flask, render_template_string, jsonify
+from fanout import iterate_sync, run_sync, BOT_API_BASE_URL, BOT_API_FILE_URL, FANOUT_CONCURRENCY, FANOUT_TIMEOUT
+from outbox import schedule_post_key
+from publisher import TelegramPublisher as SharedPublisher, catch_up
+from progress_message import ProgressThrottle, format_progress
+from commands import TEXT_COMMANDS, CommandRouter, PostTemplates
+from webhook import WEBHOOK_ENABLED, WEBHOOK_WORKERS, serve_application
 
 # Импортируем конфигурацию
 try:
@@ -63,13 +67,13 @@ logger = logging.getLogger(__name__)
 
 # Импорты для старой версии python-telegram-bot
 try:
-    from telegram import Bot, Update
+    from telegram import Update
     from telegram.ext import Updater, CommandHandler, MessageHandler, Filters
     from telegram.error import TelegramError
     TELEGRAM_BOT_VERSION = "13.x"
 except ImportError:
     try:
-        from telegram import Bot, Update
+        from telegram import Update
         from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters
         from telegram.error import TelegramError
         TELEGRAM_BOT_VERSION = "20.x"
@@ -77,67 +81,11 @@ except ImportError:
         logger.error("❌ Не удалось импортировать python-telegram-bot")
         exit(1)
 
-class TelegramPublisher:
-    """Класс для публикации сообщений в Telegram каналы"""
+class TelegramPublisher(SharedPublisher):
+    """Публикатор с настройками этого файла (config.py или значения по умолчанию выше)"""
     
-    def __init__(self, bot_token: str):
-        self.bot = Bot(token=bot_token)
-        self.channels = CHANNELS
-        self.timezone = pytz.timezone(TIMEZONE)
-        
-    async def publish_to_channel(self, channel: str, message: str, parse_mode: str = 'HTML') -> bool:
-        """Публикация сообщения в один канал"""
-        try:
-            await self.bot.send_message(
-                chat_id=channel,
-                text=message,
-                parse_mode=parse_mode
-            )
-            logger.info(f"✅ Сообщение успешно отправлено в {channel}")
-            return True
-        except TelegramError as e:
-            logger.error(f"❌ Ошибка при отправке в {channel}: {e}")
-            return False
-        except Exception as e:
-            logger.error(f"❌ Неожиданная ошибка при отправке в {channel}: {e}")
-            return False
-    
-    async def publish_to_all_channels(self, message: str, parse_mode: str = 'HTML') -> Dict[str, bool]:
-        """Публикация сообщения во все каналы"""
-        results = {}
-        
-        logger.info(f"🚀 Начинаем публикацию сообщения в {len(self.channels)} каналов")
-        
-        # Создаем задачи для всех каналов
-        tasks = []
-        for channel in self.channels:
-            task = self.publish_to_channel(channel, message, parse_mode)
-            tasks.append((channel, task))
-        
-        # Выполняем все задачи параллельно
-        for channel, task in tasks:
-            try:
-                result = await task
-                results[channel] = result
-            except Exception as e:
-                logger.error(f"❌ Ошибка при обработке канала {channel}: {e}")
-                results[channel] = False
-        
-        # Подсчитываем результаты
-        successful = sum(1 for success in results.values() if success)
-        failed = len(results) - successful
-        
-        logger.info(f"📊 Результаты публикации: {successful} успешно, {failed} с ошибками")
-        
-        return results
-    
-    def get_current_time_moscow(self) -> datetime:
-        """Получение текущего времени в МСК"""
-        return datetime.now(self.timezone)
-    
-    def get_post_for_time(self, time_str: str) -> Optional[Dict[str, str]]:
-        """Получение шаблона поста для указанного времени"""
-        return POST_TEMPLATES.get(time_str)
+    def __init__(self, bot_token: Union[str, List[str]], concurrency: int = FANOUT_CONCURRENCY, timeout: float = FANOUT_TIMEOUT):
+        super().__init__(bot_token, concurrency, timeout, CHANNELS, POST_TEMPLATES, TIMEZONE)
 
 class Scheduler:
     """Планировщик для автоматической публикации"""
@@ -149,9 +97,17 @@ class Scheduler:
     def schedule_posts(self):
         """Настройка расписания публикации"""
         for time_str in self.schedule_times:
-            schedule.every().day.at(time_str).do(self.publish_scheduled_post, time_str)
+            schedule.every().day.at(time_str).do(self.run_scheduled_post, time_str)
             logger.info(f"⏰ Запланирована публикация на {time_str} МСК")
     
+    def run_scheduled_post(self, time_str: str):
+        """Запуск публикации по расписанию из потока планировщика"""
+        run_sync(self.publish_scheduled_post(time_str))
+    
+    def catch_up(self):
+        """Досылка прерванных рассылок и слотов, пропущенных во время простоя"""
+        catch_up(self.publisher, self.schedule_times, self.run_scheduled_post)
+    
     async def publish_scheduled_post(self, time_str: str):
         """Публикация по расписанию"""
         current_time = self.publisher.get_current_time_moscow()
@@ -168,7 +124,7 @@ class Scheduler:
         parse_mode = post_template.get('parse_mode', 'HTML')
         
         # Публикуем во все каналы
-        results = await self.publisher.publish_to_all_channels(message, parse_mode)
+        results = await self.publisher.publish_to_all_channels(message, parse_mode, schedule_post_key(current_time, time_str))
         
         # Логируем результаты
         for channel, success in results.items():
@@ -179,6 +135,7 @@ class Scheduler:
         """Запуск планировщика"""
         logger.info("🚀 Планировщик запущен")
         self.schedule_posts()
+        self.catch_up()
         
         while True:
             schedule.run_pending()
@@ -188,119 +145,84 @@ class Scheduler:
 publisher = None
 scheduler = None
 
-def start_command(update, context):
-    """Обработчик команды /start"""
-    welcome_text = """
-🤖 <b>Добро пожаловать в бот автопостов!</b>
-
-<b>Доступные команды:</b>
-/post - Отправить пост во все каналы
-/status - Проверить статус бота
-/help - Показать справку
+def command(update, context):
+    """Обработчик всех команд: обработчик и аргументы выбираются по таблице команд"""
+    route = router.route(update.message.text)
+    if route:
+        handler, args = route
+        return handler(update, args)
 
-<b>Автоматические посты:</b>
-Бот автоматически публикует посты по расписанию:
-"""
-    for time in PUBLISH_SCHEDULE:
-        welcome_text += f"• {time} МСК\n"
-    
-    update.message.reply_text(welcome_text, parse_mode='HTML')
+def start_command(update, args):
+    """Обработчик команды /start"""
+    update.message.reply_text(router.start_text, parse_mode='HTML')
 
-def help_command(update, context):
+def help_command(update, args):
     """Обработчик команды /help"""
-    help_text = """
-📖 <b>Справка по командам:</b>
-
-<b>/post</b> - Отправить пост во все каналы
-Использование: /post [текст сообщения]
-Пример: /post Привет всем!
-
-<b>/status</b> - Проверить статус бота
-Показывает количество каналов и время следующей публикации
+    update.message.reply_text(router.help_text, parse_mode='HTML')
 
-<b>/help</b> - Показать эту справку
-
-<b>Автоматические посты:</b>
-Бот публикует посты по расписанию в указанное время.
-"""
-    update.message.reply_text(help_text, parse_mode='HTML')
-
-def post_command(update, context):
+def post_command(update, message_text):
     """Обработчик команды /post"""
     global publisher
     
-    # Получаем текст сообщения (все после /post)
-    if context.args:
-        message_text = ' '.join(context.args)
-    else:
-        # Если текст не указан, используем шаблон по умолчанию
-        current_time = publisher.get_current_time_moscow()
-        time_str = current_time.strftime('%H:%M')
-        
-        # Ищем ближайший шаблон
-        template = None
-        for scheduled_time in sorted(POST_TEMPLATES.keys()):
-            if scheduled_time >= time_str:
-                template = POST_TEMPLATES[scheduled_time]
-                break
-        
-        if not template:
-            # Если не найден шаблон, используем первый доступный
-            template = list(POST_TEMPLATES.values())[0]
-        
-        message_text = template['text']
+    if not message_text:
+        # Если текст не указан, используем ближайший шаблон
+        time_str = publisher.get_current_time_moscow().strftime('%H:%M')
+        message_text = templates.upcoming(time_str)['text']
     
-    # Отправляем сообщение о начале публикации
-    update.message.reply_text(
+    # Отправляем сообщение о начале публикации; дальше оно редактируется по ходу рассылки
+    status_message = update.message.reply_text(
         f"🚀 Начинаю публикацию в {len(publisher.channels)} каналов...\n"
         f"📝 Текст: {message_text[:100]}{'...' if len(message_text) > 100 else ''}"
     )
     
+    def edit_status(text):
+        """Редактирование сообщения о ходе публикации через общий ограничитель отправки"""
+        publisher.rate_limiter.acquire(status_message.chat_id)
+        try:
+            status_message.edit_text(text, parse_mode='HTML')
+            return True
+        except TelegramError as e:
+            logger.warning(f"⚠️ Не удалось обновить сообщение о ходе публикации: {e}")
+            return False
+    
     # Запускаем публикацию в отдельном потоке
     def publish_async():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
         try:
-            results = loop.run_until_complete(publisher.publish_to_all_channels(message_text))
-            
-            # Подсчитываем результаты
-            successful = sum(1 for success in results.values() if success)
-            failed = len(results) - successful
-            
-            # Отправляем отчет
-            report = f"""
-📊 <b>Результаты публикации:</b>
-
-✅ Успешно: {successful}
-❌ Ошибки: {failed}
-📤 Всего каналов: {len(results)}
-
-<b>Детали:</b>
-"""
-            
-            for channel, success in results.items():
-                status = "✅" if success else "❌"
-                report += f"{status} {channel}\n"
+            # Получаем результат каждого канала по мере готовности
+            throttle = ProgressThrottle()
+            details = []
+            for progress in iterate_sync(publisher.publish_stream(message_text)):
+                if progress.is_summary:
+                    summary = progress
+                    continue
+                
+                status = "✅" if progress.success else "❌"
+                details.append(f"{status} {progress.channel}")
+                
+                text = throttle.update(progress)
+                if text:
+                    edit_status(text)
             
-            update.message.reply_text(report, parse_mode='HTML')
+            # Итоговый отчет - в то же сообщение
+            report = format_progress(summary) + "\n\n<b>Детали:</b>\n" + "\n".join(details)
+            if not edit_status(report):
+                update.message.reply_text(format_progress(summary), parse_mode='HTML')
             
         except Exception as e:
             update.message.reply_text(f"❌ Ошибка при публикации: {e}")
             logger.error(f"Ошибка в команде /post: {e}")
-        finally:
-            loop.close()
     
     # Запускаем в отдельном потоке
     thread = threading.Thread(target=publish_async)
     thread.start()
 
-def status_command(update, context):
+def status_command(update, args):
     """Обработчик команды /status"""
     global publisher
     
     try:
-        # Получаем информацию о боте
-        bot_info = publisher.bot.get_me()
+        # Получаем информацию о боте (боты публикатора работают в общем цикле процесса)
+        bot_info = run_sync(publisher.bot.get_me())
         current_time = publisher.get_current_time_moscow()
         
         status_text = f"""
@@ -313,13 +235,7 @@ def status_command(update, context):
 
 <b>Следующие публикации:</b>
 """
-        
-        # Показываем ближайшие запланированные посты
-        for time_str in sorted(POST_TEMPLATES.keys()):
-            template = POST_TEMPLATES[time_str]
-            status_text += f"• {time_str} - {template['text'][:50]}...\n"
-        
-        update.message.reply_text(status_text, parse_mode='HTML')
+        update.message.reply_text(status_text + templates.status_lines, parse_mode='HTML')
         
     except Exception as e:
         update.message.reply_text(f"❌ Ошибка при получении статуса: {e}")
@@ -331,6 +247,15 @@ def handle_message(update, context):
         "👋 Привет! Используй /help для просмотра доступных команд."
     )
 
+# Таблица команд: тексты /start и /help собираются один раз при импорте
+router = CommandRouter(TEXT_COMMANDS, {
+    'start': start_command,
+    'help': help_command,
+    'post': post_command,
+    'status': status_command
+}, PUBLISH_SCHEDULE)
+templates = PostTemplates(POST_TEMPLATES)
+
 def main():
     """Основная функция"""
     global publisher, scheduler
@@ -360,14 +285,11 @@ def main():
     # Создаем бота в зависимости от версии библиотеки
     if TELEGRAM_BOT_VERSION == "13.x":
         # Старая версия с Updater
-        updater = Updater(token=BOT_TOKEN, use_context=True)
+        updater = Updater(token=BOT_TOKEN, base_url=BOT_API_BASE_URL, base_file_url=BOT_API_FILE_URL, use_context=True)
         dispatcher = updater.dispatcher
         
         # Добавляем обработчики команд
-        dispatcher.add_handler(CommandHandler("start", start_command))
-        dispatcher.add_handler(CommandHandler("help", help_command))
-        dispatcher.add_handler(CommandHandler("post", post_command))
-        dispatcher.add_handler(CommandHandler("status", status_command))
+        dispatcher.add_handler(CommandHandler(router.names(), command))
         dispatcher.add_handler(MessageHandler(Filters.text & ~Filters.command, handle_message))
         
         # Запускаем бота
@@ -378,17 +300,21 @@ def main():
         updater.idle()
     else:
         # Новая версия с Application
-        app = Application.builder().token(BOT_TOKEN).build()
+        builder = Application.builder().token(BOT_TOKEN).base_url(BOT_API_BASE_URL).base_file_url(BOT_API_FILE_URL)
+        if WEBHOOK_ENABLED:
+            # Обновления из webhook обрабатываются параллельно: долгий /post не задерживает другие команды
+            builder = builder.concurrent_updates(WEBHOOK_WORKERS)
+        app = builder.build()
         
         # Добавляем обработчики команд
-        app.add_handler(CommandHandler("start", start_command))
-        app.add_handler(CommandHandler("help", help_command))
-        app.add_handler(CommandHandler("post", post_command))
-        app.add_handler(CommandHandler("status", status_command))
+        app.add_handler(CommandHandler(router.names(), command))
         app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
         
-        # Запускаем бота
-        app.run_polling()
+        # Запускаем бота: webhook (если задан WEBHOOK_URL) или polling
+        if WEBHOOK_ENABLED:
+            asyncio.run(serve_application(app, BOT_TOKEN))
+        else:
+            app.run_polling()
         logger.info("🚀 Бот запущен и готов к работе!")
 
 if __name__ == "__main__":
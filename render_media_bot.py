@@ -10,14 +10,25 @@ import schedule
 import time
 import threading
 from datetime import datetime
-from typing import List, Dict, Optional
-import pytz
+from typing import List, Dict, Optional, Tuple, Union
 import os
-import requests
 import json
 import base64
 import io
 
+from retry import SendError, deliver_with_requeue, retry_call, retry_call_async
+from outbox import drain_async, publish_missed_slots, schedule_post_key
+from commands import MEDIA_COMMANDS, CommandRouter, PostTemplates
+from webhook import WEBHOOK_ENABLED
+from media_cache import (
+    get_file_id_cache, get_media_store, is_file_id_error, local_media_path, media_filename, media_key, sent_file_id
+)
+from fanout import iter_fan_out, iter_fan_out_leaders
+from bot_api import PreparedRequest, UploadRequest
+from image_prep import prepare_media
+from media_group import AlbumItem, ALBUM_MAX_ITEMS, album_post, validate_album
+from raw_bot import RawTelegramBot
+
 # Импортируем конфигурацию
 try:
     from config import (
@@ -64,124 +75,389 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class MediaTelegramBot:
+class MediaTelegramBot(RawTelegramBot):
     """Telegram бот с поддержкой медиа"""
     
-    def __init__(self, bot_token: str):
-        self.bot_token = bot_token
-        self.api_url = f"https://api.telegram.org/bot{bot_token}"
-        self.channels = CHANNELS
-        self.timezone = pytz.timezone(TIMEZONE)
-        self.last_update_id = 0
+    # Команды-рассылки: выполняются в отдельном пуле и не задерживают быстрые команды
+    BROADCAST_COMMANDS = ('/post', '/photo', '/video', '/album')
+    
+    # Метод Bot API, поле запроса и таймаут для каждого типа медиа
+    MEDIA_METHODS = {
+        'photo': ('sendPhoto', 'photo', 15),
+        'video': ('sendVideo', 'video', 20),
+        'document': ('sendDocument', 'document', 20),
+        'audio': ('sendAudio', 'audio', 20),
+    }
+    
+    # Сколько раз подряд искать канал для первой загрузки медиа, если загрузка не удалась
+    UPLOAD_ROUNDS = 3
+    
+    # Таймаут загрузки файла с диска (видео до 50 МБ)
+    UPLOAD_TIMEOUT = 120
+    
+    def __init__(self, bot_token: Union[str, List[str]]):
+        super().__init__(bot_token, CHANNELS, TIMEZONE)
+        # Таблица команд: тексты /start и /help собираются один раз
+        self.router = CommandRouter(MEDIA_COMMANDS, {
+            'start': self.start_command,
+            'help': self.help_command,
+            'post': self.post_command,
+            'photo': self.photo_command,
+            'video': self.video_command,
+            'album': self.album_command,
+            'status': self.status_command
+        }, PUBLISH_SCHEDULE, fallback=self.greet)
+        self.templates = PostTemplates(POST_TEMPLATES)
+        # Медиа загружается в Telegram один раз на бота, дальше отправляется по file_id
+        self.file_ids = get_file_id_cache()
+        # Само медиа хранится на диске по хешу содержимого и скачивается один раз
+        self.media_store = get_media_store()
         
-    def send_message(self, chat_id: str, text: str, parse_mode: str = 'HTML') -> bool:
-        """Отправка текстового сообщения"""
-        try:
-            url = f"{self.api_url}/sendMessage"
-            data = {
-                'chat_id': chat_id,
-                'text': text,
+    def _prepare_post(self, post: dict, file_ids: Tuple[Optional[str], ...] = ()) -> Union[PreparedRequest, UploadRequest]:
+        """Запрос отправки поста, общий для всех каналов рассылки
+
+        Медиа отправляется по file_id, если он известен (file_ids - по одному
+        на элемент из _media_items), иначе загружается с диска из кэша медиа
+        или из MEDIA_DIR; ссылка, которую не удалось сохранить в кэш,
+        передается Telegram как есть.
+        """
+        parse_mode = post.get('parse_mode', 'HTML')
+        if post.get('album'):
+            return self._prepare_album(post, file_ids)
+        
+        media_type = post.get('media_type')
+        if media_type:
+            method, field, timeout = self.MEDIA_METHODS[media_type]
+            file_id = file_ids[0] if file_ids else None
+            path = None if file_id else self._media_path(post)
+            if path:
+                fields = {
+                    'caption': post.get('caption', ''),
+                    'parse_mode': parse_mode
+                }
+                return UploadRequest(method, fields, [(field, path, media_filename(post['media_url']))], self.UPLOAD_TIMEOUT)
+            
+            fields = {
+                field: file_id or post['media_url'],
+                'caption': post.get('caption', ''),
                 'parse_mode': parse_mode
             }
-            response = requests.post(url, data=data, timeout=10)
+            return PreparedRequest(method, fields, timeout)
+        
+        fields = {
+            'text': post['text'],
+            'parse_mode': parse_mode
+        }
+        return PreparedRequest('sendMessage', fields, 10)
+    
+    def _prepare_album(self, post: dict, file_ids: Tuple[Optional[str], ...] = ()) -> Union[PreparedRequest, UploadRequest]:
+        """Запрос sendMediaGroup: все элементы альбома одним запросом, подпись - у первого элемента"""
+        media = []
+        files = []
+        for index, item in enumerate(post['album']):
+            file_id = file_ids[index] if file_ids else None
+            entry = {'type': item['media_type'], 'media': file_id or item['media_url']}
             
-            if response.status_code == 200:
-                logger.info(f"✅ Сообщение отправлено в {chat_id}")
-                return True
-            else:
-                logger.error(f"❌ Ошибка отправки в {chat_id}: {response.text}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"❌ Ошибка при отправке в {chat_id}: {e}")
-            return False
+            path = None if file_id else self._media_path(item)
+            if path:
+                # Файл с диска уходит частью формы, а в описании альбома на него ссылка attach://
+                entry['media'] = f"attach://file{index}"
+                files.append((f"file{index}", path, media_filename(item['media_url'])))
+            
+            if index == 0 and post.get('caption'):
+                entry['caption'] = post['caption']
+                entry['parse_mode'] = post.get('parse_mode', 'HTML')
+            media.append(entry)
+        
+        fields = {'media': json.dumps(media, ensure_ascii=False)}
+        if files:
+            return UploadRequest('sendMediaGroup', fields, files, self.UPLOAD_TIMEOUT)
+        
+        timeout = max(self.MEDIA_METHODS[item['media_type']][2] for item in post['album'])
+        return PreparedRequest('sendMediaGroup', fields, timeout)
+    
+    def _media_path(self, item: dict) -> Optional[str]:
+        """Файл медиа на диске: из кэша медиа или из MEDIA_DIR (None - медиа есть только по ссылке)"""
+        digest = item.get('media_sha256')
+        return (self.media_store.path(digest) if digest else None) or local_media_path(item['media_url'])
+    
+    def _media_items(self, post: dict) -> List[dict]:
+        """Медиа поста: элементы альбома, одно медиа или ничего для текста"""
+        if post.get('album'):
+            return post['album']
+        return [post] if post.get('media_type') else []
+    
+    def _request_for(self, post: dict):
+        """Выбор запроса поста для канала: медиа, которое бот канала уже загрузил, отправляется по file_id
+
+        Запросы кэшируются по набору file_id, поэтому тело формы по-прежнему
+        кодируется один раз на бота, а не на канал.
+        """
+        prepared: Dict[Tuple[Optional[str], ...], Union[PreparedRequest, UploadRequest]] = {}
+        sources = [media_key(item) for item in self._media_items(post)]
+        
+        def request_for(channel) -> Union[PreparedRequest, UploadRequest]:
+            token = self.token_pool.token_for(channel)
+            file_ids = tuple(self.file_ids.get(token, source) for source in sources)
+            request = prepared.get(file_ids)
+            if request is None:
+                request = prepared[file_ids] = self._prepare_post(post, file_ids)
+            return request
+        
+        return request_for
+    
+    def _media_post(self, media_type: str, media_url: str, caption: str, parse_mode: str) -> dict:
+        """Пост с медиа; медиа сохраняется в кэш (в первый раз), и дальше его узнают по хешу содержимого
+
+        Фото перед загрузкой уменьшается и пережимается (image_prep.py).
+        """
+        return {
+            'media_type': media_type,
+            'media_url': media_url,
+            'media_sha256': prepare_media(media_type, self.media_store.resolve(media_url)),
+            'caption': caption,
+            'parse_mode': parse_mode
+        }
+    
+    def _message_id(self, sent) -> Optional[int]:
+        """message_id отправленного поста (у альбома - первого сообщения)"""
+        if isinstance(sent, list):
+            sent = sent[0] if sent else {}
+        return sent.get('message_id')
+    
+    def _remember_upload(self, post: dict, channel, sent):
+        """Сохранение file_id, которые Telegram вернул после отправки медиа (альбом - список сообщений)"""
+        items = self._media_items(post)
+        if not items:
+            return
+        
+        token = self.token_pool.token_for(channel)
+        messages = sent if isinstance(sent, list) else [sent]
+        for item, message in zip(items, messages):
+            source = media_key(item)
+            if self.file_ids.get(token, source) is None:
+                file_id = sent_file_id(self.MEDIA_METHODS[item['media_type']][1], message)
+                if file_id:
+                    self.file_ids.put(token, source, file_id)
+    
+    def _check_upload_error(self, post: dict, channel, error: SendError):
+        """Если Telegram не принял сохраненный file_id, он забывается, и отправка повторяется с загрузкой
+
+        У альбома не известно, какой из file_id устарел, поэтому забываются все.
+        """
+        items = self._media_items(post)
+        if items and is_file_id_error(error):
+            token = self.token_pool.token_for(channel)
+            forgotten = [self.file_ids.forget(token, media_key(item)) for item in items]
+            if any(forgotten):
+                logger.warning(f"♻️ file_id медиа {', '.join(item['media_url'] for item in items)} устарел, загружаем заново")
+                raise SendError(error.description, transient=True)
+    
+    def _send_media(self, chat_id: str, media_type: str, media_url: str, caption: str = "", parse_mode: str = 'HTML'):
+        """Одна попытка отправки медиа, при ошибке выбрасывает SendError"""
+        post = self._media_post(media_type, media_url, caption, parse_mode)
+        request = self._request_for(post)(chat_id)
+        try:
+            sent = self._request(request.method, request.body(chat_id), request.timeout, chat_id)
+        except SendError as e:
+            self._check_upload_error(post, chat_id, e)
+            raise
+        self._remember_upload(post, chat_id, sent)
+        return sent
+    
+    async def _send_media_async(self, chat_id: str, media_type: str, media_url: str, caption: str = "", parse_mode: str = 'HTML'):
+        """Одна попытка отправки медиа из asyncio, при ошибке выбрасывает SendError"""
+        # Первое скачивание медиа в кэш не должно блокировать цикл событий
+        post = await asyncio.get_running_loop().run_in_executor(
+            None, self._media_post, media_type, media_url, caption, parse_mode
+        )
+        request = self._request_for(post)(chat_id)
+        try:
+            sent = await self._request_async(request.method, request.body(chat_id), request.timeout, chat_id)
+        except SendError as e:
+            self._check_upload_error(post, chat_id, e)
+            raise
+        self._remember_upload(post, chat_id, sent)
+        return sent
     
     def send_photo(self, chat_id: str, photo_url: str, caption: str = "", parse_mode: str = 'HTML') -> bool:
         """Отправка фотографии"""
         try:
-            url = f"{self.api_url}/sendPhoto"
-            data = {
-                'chat_id': chat_id,
-                'photo': photo_url,
-                'caption': caption,
-                'parse_mode': parse_mode
-            }
-            response = requests.post(url, data=data, timeout=15)
-            
-            if response.status_code == 200:
-                logger.info(f"✅ Фото отправлено в {chat_id}")
-                return True
-            else:
-                logger.error(f"❌ Ошибка отправки фото в {chat_id}: {response.text}")
-                return False
+            retry_call(lambda: self._send_media(chat_id, 'photo', photo_url, caption, parse_mode), self.retry_policy, chat_id)
+            logger.info(f"✅ Фото отправлено в {chat_id}")
+            return True
                 
         except Exception as e:
-            logger.error(f"❌ Ошибка при отправке фото в {chat_id}: {e}")
+            logger.error(f"❌ Ошибка отправки фото в {chat_id}: {e}")
             return False
     
     def send_video(self, chat_id: str, video_url: str, caption: str = "", parse_mode: str = 'HTML') -> bool:
         """Отправка видео"""
         try:
-            url = f"{self.api_url}/sendVideo"
-            data = {
-                'chat_id': chat_id,
-                'video': video_url,
-                'caption': caption,
-                'parse_mode': parse_mode
-            }
-            response = requests.post(url, data=data, timeout=20)
-            
-            if response.status_code == 200:
-                logger.info(f"✅ Видео отправлено в {chat_id}")
-                return True
-            else:
-                logger.error(f"❌ Ошибка отправки видео в {chat_id}: {response.text}")
-                return False
+            retry_call(lambda: self._send_media(chat_id, 'video', video_url, caption, parse_mode), self.retry_policy, chat_id)
+            logger.info(f"✅ Видео отправлено в {chat_id}")
+            return True
                 
         except Exception as e:
-            logger.error(f"❌ Ошибка при отправке видео в {chat_id}: {e}")
+            logger.error(f"❌ Ошибка отправки видео в {chat_id}: {e}")
             return False
     
     def send_document(self, chat_id: str, document_url: str, caption: str = "", parse_mode: str = 'HTML') -> bool:
         """Отправка документа"""
         try:
-            url = f"{self.api_url}/sendDocument"
-            data = {
-                'chat_id': chat_id,
-                'document': document_url,
-                'caption': caption,
-                'parse_mode': parse_mode
-            }
-            response = requests.post(url, data=data, timeout=20)
-            
-            if response.status_code == 200:
-                logger.info(f"✅ Документ отправлен в {chat_id}")
-                return True
-            else:
-                logger.error(f"❌ Ошибка отправки документа в {chat_id}: {response.text}")
-                return False
+            retry_call(lambda: self._send_media(chat_id, 'document', document_url, caption, parse_mode), self.retry_policy, chat_id)
+            logger.info(f"✅ Документ отправлен в {chat_id}")
+            return True
                 
         except Exception as e:
-            logger.error(f"❌ Ошибка при отправке документа в {chat_id}: {e}")
+            logger.error(f"❌ Ошибка отправки документа в {chat_id}: {e}")
             return False
     
-    def send_media_to_all_channels(self, media_type: str, media_url: str, caption: str = "", parse_mode: str = 'HTML') -> Dict[str, bool]:
-        """Отправка медиа во все каналы"""
-        results = {}
-        
-        logger.info(f"🚀 Начинаем публикацию {media_type} в {len(self.channels)} каналов")
+    async def _send_media_with_retry_async(self, chat_id: str, media_type: str, media_url: str, caption: str, parse_mode: str) -> bool:
+        """Отправка медиа из asyncio с повторами при временных ошибках"""
+        try:
+            await retry_call_async(
+                lambda: self._send_media_async(chat_id, media_type, media_url, caption, parse_mode),
+                self.retry_policy,
+                chat_id
+            )
+            logger.info(f"✅ Медиа ({media_type}) отправлено в {chat_id}")
+            return True
+                
+        except Exception as e:
+            logger.error(f"❌ Ошибка отправки медиа ({media_type}) в {chat_id}: {e}")
+            return False
+    
+    async def send_photo_async(self, chat_id: str, photo_url: str, caption: str = "", parse_mode: str = 'HTML') -> bool:
+        """Отправка фотографии из asyncio"""
+        return await self._send_media_with_retry_async(chat_id, 'photo', photo_url, caption, parse_mode)
+    
+    async def send_video_async(self, chat_id: str, video_url: str, caption: str = "", parse_mode: str = 'HTML') -> bool:
+        """Отправка видео из asyncio"""
+        return await self._send_media_with_retry_async(chat_id, 'video', video_url, caption, parse_mode)
+    
+    async def send_document_async(self, chat_id: str, document_url: str, caption: str = "", parse_mode: str = 'HTML') -> bool:
+        """Отправка документа из asyncio"""
+        return await self._send_media_with_retry_async(chat_id, 'document', document_url, caption, parse_mode)
+    
+    def _send_batch(self, post_id: int, post: dict, channels: List, on_result=None) -> Dict[str, bool]:
+        """Отправка поста в часть каналов"""
+        # Тело запроса и строка лога собираются один раз, для канала меняется только chat_id;
+        # медиа загружается при первой успешной отправке, дальше идет по file_id
+        request_for = self._request_for(post)
+        sent_text = self._sent_text(post)
         
-        for channel in self.channels:
-            if media_type == 'photo':
-                success = self.send_photo(str(channel), media_url, caption, parse_mode)
-            elif media_type == 'video':
-                success = self.send_video(str(channel), media_url, caption, parse_mode)
-            elif media_type == 'document':
-                success = self.send_document(str(channel), media_url, caption, parse_mode)
-            else:
-                success = self.send_message(str(channel), caption, parse_mode)
+        def send(channel):
+            # Повтор или досылка после перезапуска не должны публиковать пост второй раз
+            if self.ledger.is_delivered(post_id, channel):
+                logger.info(f"⏭️ Пост {post_id} уже опубликован в {channel}")
+                return True
             
-            results[channel] = success
+            # Каналы на карантине пропускаются без запроса
+            if self.breaker.should_skip(channel):
+                return False
+            
+            request = request_for(channel)
+            try:
+                sent = self._request(request.method, request.body(channel), request.timeout, channel)
+                logger.info(f"{sent_text} {channel}")
+            except SendError as e:
+                self._check_upload_error(post, channel, e)
+                self.breaker.record_failure(channel, e)
+                raise
+            
+            self._remember_upload(post, channel, sent)
+            self.ledger.record(post_id, channel, self._message_id(sent))
+            self.breaker.record_success(channel)
+            return True
+        
+        # Временные ошибки повторяются из очереди, не задерживая остальные каналы
+        return deliver_with_requeue(channels, send, self.retry_policy, on_result)
+    
+    def _sent_text(self, post: dict) -> str:
+        """Начало строки лога об успешной отправке поста"""
+        if post.get('album'):
+            return f"✅ Альбом ({len(post['album'])}) отправлен в"
+        media_type = post.get('media_type')
+        return f"✅ Медиа ({media_type}) отправлено в" if media_type else "✅ Сообщение отправлено в"
+    
+    async def _publish_to_channel_async(self, post_id: int, post: dict, request: Union[PreparedRequest, UploadRequest],
+                                        sent_text: str, channel) -> bool:
+        """Отправка подготовленного поста в один канал при параллельной рассылке"""
+        # Повтор или досылка после перезапуска не должны публиковать пост второй раз
+        if self.ledger.is_delivered(post_id, channel):
+            logger.info(f"⏭️ Пост {post_id} уже опубликован в {channel}")
+            return True
+        
+        try:
+            sent = await self._call_async(request.method, request.body(channel), request.timeout, channel)
+        except SendError as e:
+            self._check_upload_error(post, channel, e)
+            if e.transient:
+                # Временные ошибки повторяет iter_fan_out
+                raise
+            self.breaker.record_failure(channel, e)
+            logger.error(f"❌ Ошибка отправки в {channel}: {e}")
+            return False
+        
+        self._remember_upload(post, channel, sent)
+        self.ledger.record(post_id, channel, self._message_id(sent))
+        self.breaker.record_success(channel)
+        logger.info(f"{sent_text} {channel}")
+        return True
+    
+    def _upload_leaders(self, post_id: int, post: dict, channels: List) -> List:
+        """Каналы для первой загрузки медиа: по одному на каждого бота, у которого еще нет file_id
+
+        Выбираются каналы без ошибок, куда пост еще не доставлен.
+        """
+        leaders = {}
+        sources = [media_key(item) for item in self._media_items(post)]
+        for channel in channels:
+            token = self.token_pool.token_for(channel)
+            if token in leaders or all(self.file_ids.get(token, source) is not None for source in sources):
+                continue
+            if self.ledger.is_delivered(post_id, channel) or self.breaker.has_failures(channel):
+                continue
+            leaders[token] = channel
+        return list(leaders.values())
+    
+    def _stream_batch_async(self, post_id: int, post: dict, channels: List):
+        """Отправка поста в часть каналов параллельно, не более FANOUT_CONCURRENCY одновременно
+
+        Медиа сначала загружается в один канал каждого бота, а остальные
+        каналы получают его по file_id: Telegram скачивает файл один раз.
+        """
+        # Тело запроса и строка лога собираются один раз, для канала меняется только chat_id
+        request_for = self._request_for(post)
+        sent_text = self._sent_text(post)
+        
+        has_media = bool(self._media_items(post))
+        
+        def fan_out(batch: List):
+            return iter_fan_out(
+                batch,
+                lambda channel: self._publish_to_channel_async(post_id, post, request_for(channel), sent_text, channel),
+                # Таймаут канала не короче таймаута запроса (загрузка файла с диска дольше)
+                timeout=max(request_for(channel).timeout for channel in batch) if has_media and batch else None,
+                rate_limiter=self.rate_limiter,
+                retry_policy=self.retry_policy,
+                # Каналы на карантине пропускаются без запроса
+                skip=self.breaker.should_skip
+            )
+        
+        return iter_fan_out_leaders(
+            channels,
+            lambda remaining: self._upload_leaders(post_id, post, remaining),
+            self.UPLOAD_ROUNDS if has_media else 0,
+            fan_out
+        )
+    
+    def _publish(self, post: dict, post_key: Optional[str] = None, on_result=None) -> Dict[str, bool]:
+        """Запись рассылки в очередь доставки и ее отправка"""
+        self.assign_channels()
+        post_id = self.outbox.enqueue(post_key, post, self.channels)
+        results = self._drain(post_id, on_result)
         
         successful = sum(1 for success in results.values() if success)
         failed = len(results) - successful
@@ -189,194 +465,151 @@ class MediaTelegramBot:
         logger.info(f"📊 Результаты: {successful} успешно, {failed} с ошибками")
         return results
     
-    def send_message_to_all_channels(self, text: str, parse_mode: str = 'HTML') -> Dict[str, bool]:
+    def send_media_to_all_channels(self, media_type: str, media_url: str, caption: str = "", parse_mode: str = 'HTML',
+                                   post_key: Optional[str] = None, on_result=None) -> Dict[str, bool]:
+        """Отправка медиа во все каналы"""
+        logger.info(f"🚀 Начинаем публикацию {media_type} в {len(self.channels)} каналов")
+        
+        if media_type not in self.MEDIA_METHODS:
+            return self.send_message_to_all_channels(caption, parse_mode, post_key, on_result)
+        
+        post = self._media_post(media_type, media_url, caption, parse_mode)
+        return self._publish(post, post_key, on_result)
+    
+    def send_message_to_all_channels(self, text: str, parse_mode: str = 'HTML', post_key: Optional[str] = None, on_result=None) -> Dict[str, bool]:
         """Отправка текстового сообщения во все каналы"""
-        results = {}
+        logger.info(f"🚀 Начинаем публикацию в {len(self.channels)} каналов")
+        return self._publish({'text': text, 'parse_mode': parse_mode}, post_key, on_result)
+    
+    async def _publish_async(self, post: dict, post_key: Optional[str] = None) -> Dict[str, bool]:
+        """Запись рассылки в очередь доставки и ее параллельная отправка (asyncio)"""
+        await self.assign_channels_async()
+        post_id = self.outbox.enqueue(post_key, post, self.channels)
+        results = await drain_async(self.outbox, self._stream_batch_async, post_id)
+        
+        successful = sum(1 for success in results.values() if success)
+        logger.info(f"📊 Результаты: {successful} успешно, {len(results) - successful} с ошибками")
+        return results
+    
+    async def send_media_to_all_channels_async(self, media_type: str, media_url: str, caption: str = "", parse_mode: str = 'HTML',
+                                               post_key: Optional[str] = None) -> Dict[str, bool]:
+        """Отправка медиа во все каналы (asyncio)"""
+        logger.info(f"🚀 Начинаем публикацию {media_type} в {len(self.channels)} каналов")
+        
+        if media_type not in self.MEDIA_METHODS:
+            return await self.send_message_to_all_channels_async(caption, parse_mode, post_key)
+        
+        # Первое скачивание медиа в кэш не должно блокировать цикл событий
+        post = await asyncio.get_running_loop().run_in_executor(
+            None, self._media_post, media_type, media_url, caption, parse_mode
+        )
+        return await self._publish_async(post, post_key)
+    
+    def send_album_to_all_channels(self, items: List[AlbumItem], caption: str = "", parse_mode: str = 'HTML',
+                                   post_key: Optional[str] = None, on_result=None) -> Dict[str, bool]:
+        """Отправка альбома (2-10 элементов: (тип медиа, ссылка или файл)) во все каналы одним запросом на канал
+
+        При неверном альбоме выбрасывает ValueError до начала рассылки.
+        """
+        validate_album(items)
+        logger.info(f"🚀 Начинаем публикацию альбома ({len(items)}) в {len(self.channels)} каналов")
+        
+        post = album_post(items, caption, parse_mode)
+        return self._publish(post, post_key, on_result)
+    
+    async def send_album_to_all_channels_async(self, items: List[AlbumItem], caption: str = "", parse_mode: str = 'HTML',
+                                               post_key: Optional[str] = None) -> Dict[str, bool]:
+        """Отправка альбома во все каналы (asyncio)"""
+        validate_album(items)
+        logger.info(f"🚀 Начинаем публикацию альбома ({len(items)}) в {len(self.channels)} каналов")
         
+        # Первое скачивание медиа в кэш не должно блокировать цикл событий
+        post = await asyncio.get_running_loop().run_in_executor(None, album_post, items, caption, parse_mode)
+        return await self._publish_async(post, post_key)
+    
+    async def send_message_to_all_channels_async(self, text: str, parse_mode: str = 'HTML', post_key: Optional[str] = None) -> Dict[str, bool]:
+        """Отправка текстового сообщения во все каналы (asyncio)"""
         logger.info(f"🚀 Начинаем публикацию в {len(self.channels)} каналов")
+        return await self._publish_async({'text': text, 'parse_mode': parse_mode}, post_key)
+    
+    def start_command(self, chat_id: str, args: None):
+        """Обработчик команды /start"""
+        self.send_message(chat_id, self.router.start_text, 'HTML')
+    
+    def help_command(self, chat_id: str, args: None):
+        """Обработчик команды /help"""
+        self.send_message(chat_id, self.router.help_text, 'HTML')
+    
+    def post_command(self, chat_id: str, post_text: str):
+        """Обработчик команды /post"""
+        if not post_text:
+            # Если текст не указан, используем ближайший шаблон
+            time_str = datetime.now(self.timezone).strftime('%H:%M')
+            post_text = self.templates.upcoming(time_str)['text']
         
-        for channel in self.channels:
-            success = self.send_message(str(channel), text, parse_mode)
-            results[channel] = success
+        # Публикуем во все каналы; ход и отчет - в одном сообщении
+        self._broadcast_with_progress(
+            chat_id,
+            f"🚀 Начинаю публикацию в {len(self.channels)} каналов...",
+            "публикации",
+            lambda on_result: self.send_message_to_all_channels(post_text, on_result=on_result)
+        )
+    
+    def photo_command(self, chat_id: str, args: Tuple[str, str]):
+        """Обработчик команды /photo"""
+        photo_url, caption = args
+        if not photo_url:
+            self.send_message(chat_id, "❌ Укажите URL фото или файл: /photo https://example.com/photo.jpg [подпись]")
+            return
         
-        successful = sum(1 for success in results.values() if success)
-        failed = len(results) - successful
+        # Публикуем во все каналы; ход и отчет - в одном сообщении
+        self._broadcast_with_progress(
+            chat_id,
+            f"📸 Начинаю публикацию фото в {len(self.channels)} каналов...",
+            "публикации фото",
+            lambda on_result: self.send_media_to_all_channels('photo', photo_url, caption, on_result=on_result)
+        )
+    
+    def video_command(self, chat_id: str, args: Tuple[str, str]):
+        """Обработчик команды /video"""
+        video_url, caption = args
+        if not video_url:
+            self.send_message(chat_id, "❌ Укажите URL видео или файл: /video https://example.com/video.mp4 [подпись]")
+            return
         
-        logger.info(f"📊 Результаты: {successful} успешно, {failed} с ошибками")
-        return results
+        # Публикуем во все каналы; ход и отчет - в одном сообщении
+        self._broadcast_with_progress(
+            chat_id,
+            f"🎥 Начинаю публикацию видео в {len(self.channels)} каналов...",
+            "публикации видео",
+            lambda on_result: self.send_media_to_all_channels('video', video_url, caption, on_result=on_result)
+        )
     
-    def get_updates(self):
-        """Получение обновлений от Telegram"""
+    def album_command(self, chat_id: str, args: Tuple[List[AlbumItem], str]):
+        """Обработчик команды /album"""
+        items, caption = args
         try:
-            url = f"{self.api_url}/getUpdates"
-            params = {
-                'offset': self.last_update_id + 1,
-                'timeout': 10
-            }
-            response = requests.get(url, params=params, timeout=15)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('ok'):
-                    return data.get('result', [])
-            return []
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка получения обновлений: {e}")
-            return []
+            validate_album(items)
+        except ValueError as e:
+            self.send_message(
+                chat_id,
+                f"❌ {e}: /album https://example.com/1.jpg https://example.com/2.jpg [подпись] (до {ALBUM_MAX_ITEMS} элементов)"
+            )
+            return
+        
+        # Публикуем во все каналы; ход и отчет - в одном сообщении
+        self._broadcast_with_progress(
+            chat_id,
+            f"🖼 Начинаю публикацию альбома в {len(self.channels)} каналов...",
+            "публикации альбома",
+            lambda on_result: self.send_album_to_all_channels(items, caption, on_result=on_result)
+        )
     
-    def process_message(self, message):
-        """Обработка сообщения"""
-        try:
-            chat_id = message['chat']['id']
-            text = message.get('text', '')
-            
-            if text.startswith('/start'):
-                welcome_text = """
-🤖 <b>Добро пожаловать в бот автопостов!</b>
-
-<b>Доступные команды:</b>
-/post - Отправить пост во все каналы
-/photo - Отправить фото во все каналы
-/video - Отправить видео во все каналы
-/status - Проверить статус бота
-/help - Показать справку
-
-<b>Автоматические посты:</b>
-Бот автоматически публикует посты по расписанию:
-"""
-                for time in PUBLISH_SCHEDULE:
-                    welcome_text += f"• {time} МСК\n"
-                
-                self.send_message(chat_id, welcome_text, 'HTML')
-                
-            elif text.startswith('/help'):
-                help_text = """
-📖 <b>Справка по командам:</b>
-
-<b>/post</b> - Отправить текст во все каналы
-Использование: /post [текст сообщения]
-Пример: /post Привет всем!
-
-<b>/photo</b> - Отправить фото во все каналы
-Использование: /photo [URL фото] [подпись]
-Пример: /photo https://example.com/photo.jpg Моя фотография
-
-<b>/video</b> - Отправить видео во все каналы
-Использование: /video [URL видео] [подпись]
-Пример: /video https://example.com/video.mp4 Мое видео
-
-<b>/status</b> - Проверить статус бота
-Показывает количество каналов и время следующей публикации
-
-<b>/help</b> - Показать эту справку
-
-<b>Автоматические посты:</b>
-Бот публикует посты по расписанию в указанное время.
-"""
-                self.send_message(chat_id, help_text, 'HTML')
-                
-            elif text.startswith('/post'):
-                # Получаем текст после /post
-                post_text = text[5:].strip()
-                
-                if not post_text:
-                    # Если текст не указан, используем шаблон
-                    current_time = datetime.now(self.timezone)
-                    time_str = current_time.strftime('%H:%M')
-                    
-                    template = None
-                    for scheduled_time in sorted(POST_TEMPLATES.keys()):
-                        if scheduled_time >= time_str:
-                            template = POST_TEMPLATES[scheduled_time]
-                            break
-                    
-                    if not template:
-                        template = list(POST_TEMPLATES.values())[0]
-                    
-                    post_text = template['text']
-                
-                # Отправляем сообщение о начале публикации
-                self.send_message(chat_id, f"🚀 Начинаю публикацию в {len(self.channels)} каналов...")
-                
-                # Публикуем во все каналы
-                results = self.send_message_to_all_channels(post_text)
-                
-                # Отправляем отчет
-                successful = sum(1 for success in results.values() if success)
-                failed = len(results) - successful
-                
-                report = f"""
-📊 <b>Результаты публикации:</b>
-
-✅ Успешно: {successful}
-❌ Ошибки: {failed}
-📤 Всего каналов: {len(results)}
-"""
-                self.send_message(chat_id, report, 'HTML')
-                
-            elif text.startswith('/photo'):
-                # Получаем URL фото и подпись после /photo
-                parts = text[6:].strip().split(' ', 1)
-                photo_url = parts[0] if parts else ""
-                caption = parts[1] if len(parts) > 1 else ""
-                
-                if not photo_url:
-                    self.send_message(chat_id, "❌ Укажите URL фото: /photo https://example.com/photo.jpg [подпись]")
-                    return
-                
-                # Отправляем сообщение о начале публикации
-                self.send_message(chat_id, f"📸 Начинаю публикацию фото в {len(self.channels)} каналов...")
-                
-                # Публикуем во все каналы
-                results = self.send_media_to_all_channels('photo', photo_url, caption)
-                
-                # Отправляем отчет
-                successful = sum(1 for success in results.values() if success)
-                failed = len(results) - successful
-                
-                report = f"""
-📊 <b>Результаты публикации фото:</b>
-
-✅ Успешно: {successful}
-❌ Ошибки: {failed}
-📤 Всего каналов: {len(results)}
-"""
-                self.send_message(chat_id, report, 'HTML')
-                
-            elif text.startswith('/video'):
-                # Получаем URL видео и подпись после /video
-                parts = text[6:].strip().split(' ', 1)
-                video_url = parts[0] if parts else ""
-                caption = parts[1] if len(parts) > 1 else ""
-                
-                if not video_url:
-                    self.send_message(chat_id, "❌ Укажите URL видео: /video https://example.com/video.mp4 [подпись]")
-                    return
-                
-                # Отправляем сообщение о начале публикации
-                self.send_message(chat_id, f"🎥 Начинаю публикацию видео в {len(self.channels)} каналов...")
-                
-                # Публикуем во все каналы
-                results = self.send_media_to_all_channels('video', video_url, caption)
-                
-                # Отправляем отчет
-                successful = sum(1 for success in results.values() if success)
-                failed = len(results) - successful
-                
-                report = f"""
-📊 <b>Результаты публикации видео:</b>
-
-✅ Успешно: {successful}
-❌ Ошибки: {failed}
-📤 Всего каналов: {len(results)}
-"""
-                self.send_message(chat_id, report, 'HTML')
-                
-            elif text.startswith('/status'):
-                current_time = datetime.now(self.timezone)
-                
-                status_text = f"""
+    def status_command(self, chat_id: str, args: None):
+        """Обработчик команды /status"""
+        current_time = datetime.now(self.timezone)
+        
+        status_text = f"""
 🤖 <b>Статус бота:</b>
 
 🕐 Текущее время: {current_time.strftime('%H:%M:%S')} МСК
@@ -387,42 +620,15 @@ class MediaTelegramBot:
 • Текст (/post)
 • Фото (/photo)
 • Видео (/video)
+• Альбом (/album)
 
 <b>Следующие публикации:</b>
 """
-                
-                for time_str in sorted(POST_TEMPLATES.keys()):
-                    template = POST_TEMPLATES[time_str]
-                    status_text += f"• {time_str} - {template['text'][:50]}...\n"
-                
-                self.send_message(chat_id, status_text, 'HTML')
-                
-            else:
-                # Обычное сообщение
-                self.send_message(chat_id, "👋 Привет! Используй /help для просмотра доступных команд.")
-                
-        except Exception as e:
-            logger.error(f"❌ Ошибка обработки сообщения: {e}")
+        self.send_message(chat_id, status_text + self.templates.status_lines, 'HTML')
     
-    def run_polling(self):
-        """Запуск polling для получения сообщений"""
-        logger.info("🚀 Запуск polling для получения сообщений")
-        
-        while True:
-            try:
-                updates = self.get_updates()
-                
-                for update in updates:
-                    self.last_update_id = update['update_id']
-                    
-                    if 'message' in update:
-                        self.process_message(update['message'])
-                
-                time.sleep(1)  # Небольшая пауза между запросами
-                
-            except Exception as e:
-                logger.error(f"❌ Ошибка в polling: {e}")
-                time.sleep(5)  # Пауза при ошибке
+    def greet(self, chat_id: str, text: str):
+        """Ответ на обычное сообщение и неизвестную команду"""
+        self.send_message(chat_id, "👋 Привет! Используй /help для просмотра доступных команд.")
 
 class Scheduler:
     """Планировщик для автоматической публикации"""
@@ -437,6 +643,12 @@ class Scheduler:
             schedule.every().day.at(time_str).do(self.publish_scheduled_post, time_str)
             logger.info(f"⏰ Запланирована публикация на {time_str} МСК")
     
+    def catch_up(self):
+        """Досылка прерванных рассылок и слотов, пропущенных во время простоя"""
+        self.bot.resume_outbox()
+        
+        publish_missed_slots(self.bot.outbox, self.schedule_times, datetime.now(self.bot.timezone), self.publish_scheduled_post)
+    
     def publish_scheduled_post(self, time_str: str):
         """Публикация по расписанию"""
         current_time = datetime.now(self.bot.timezone)
@@ -451,9 +663,15 @@ class Scheduler:
         
         message = post_template['text']
         parse_mode = post_template.get('parse_mode', 'HTML')
+        post_key = schedule_post_key(current_time, time_str)
         
-        # Публикуем во все каналы
-        results = self.bot.send_message_to_all_channels(message, parse_mode)
+        # Публикуем во все каналы (шаблон с медиа - фото, видео или документ с подписью)
+        if post_template.get('media_type'):
+            results = self.bot.send_media_to_all_channels(
+                post_template['media_type'], post_template['media_url'], message, parse_mode, post_key
+            )
+        else:
+            results = self.bot.send_message_to_all_channels(message, parse_mode, post_key)
         
         # Логируем результаты
         for channel, success in results.items():
@@ -464,6 +682,7 @@ class Scheduler:
         """Запуск планировщика"""
         logger.info("🚀 Планировщик запущен")
         self.schedule_posts()
+        self.catch_up()
         
         while True:
             schedule.run_pending()
@@ -491,15 +710,20 @@ def main():
     logger.info("⏰ Планировщик настроен и запущен")
     logger.info(f"📅 Расписание: {', '.join(PUBLISH_SCHEDULE)} МСК")
     logger.info(f"📢 Каналы: {len(CHANNELS)} каналов")
-    logger.info("🎯 Интерактивные команды: /start, /help, /post, /photo, /video, /status")
+    logger.info("🎯 Интерактивные команды: /start, /help, /post, /photo, /video, /album, /status")
     
-    # Запускаем polling для получения сообщений
+    # Запускаем webhook (если задан WEBHOOK_URL) или polling для получения сообщений
     try:
-        bot.run_polling()
+        if WEBHOOK_ENABLED:
+            bot.run_webhook()
+        else:
+            bot.run_polling()
     except KeyboardInterrupt:
         logger.info("👋 Бот остановлен пользователем")
     except Exception as e:
         logger.error(f"❌ Ошибка при запуске бота: {e}")
+    finally:
+        bot.close()
 
 if __name__ == "__main__":
     main()
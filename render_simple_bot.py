@@ -4,18 +4,23 @@
 Минимальная версия без сложных зависимостей
 """
 
-import asyncio
 import logging
 import schedule
 import time
 import threading
 from datetime import datetime
-from typing import List, Dict, Optional
-import pytz
+from typing import List, Dict, Optional, Union
 import os
-import requests
 import json
 
+from retry import SendError, deliver_with_requeue
+from outbox import drain_async, publish_missed_slots, schedule_post_key
+from commands import TEXT_COMMANDS, CommandRouter, PostTemplates
+from webhook import WEBHOOK_ENABLED
+from fanout import iter_fan_out
+from bot_api import PreparedRequest
+from raw_bot import RawTelegramBot
+
 # Импортируем конфигурацию
 try:
     from config import (
@@ -62,47 +67,103 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class SimpleTelegramBot:
+class SimpleTelegramBot(RawTelegramBot):
     """Простой Telegram бот без сложных зависимостей"""
     
-    def __init__(self, bot_token: str):
-        self.bot_token = bot_token
-        self.api_url = f"https://api.telegram.org/bot{bot_token}"
-        self.channels = CHANNELS
-        self.timezone = pytz.timezone(TIMEZONE)
-        self.last_update_id = 0
+    # Команды-рассылки: выполняются в отдельном пуле и не задерживают быстрые команды
+    BROADCAST_COMMANDS = ('/post',)
+    
+    def __init__(self, bot_token: Union[str, List[str]]):
+        super().__init__(bot_token, CHANNELS, TIMEZONE)
+        # Таблица команд: тексты /start и /help собираются один раз
+        self.router = CommandRouter(TEXT_COMMANDS, {
+            'start': self.start_command,
+            'help': self.help_command,
+            'post': self.post_command,
+            'status': self.status_command
+        }, PUBLISH_SCHEDULE, fallback=self.greet)
+        self.templates = PostTemplates(POST_TEMPLATES)
         
-    def send_message(self, chat_id: str, text: str, parse_mode: str = 'HTML') -> bool:
-        """Отправка сообщения через API"""
-        try:
-            url = f"{self.api_url}/sendMessage"
-            data = {
-                'chat_id': chat_id,
-                'text': text,
-                'parse_mode': parse_mode
-            }
-            response = requests.post(url, data=data, timeout=10)
-            
-            if response.status_code == 200:
-                logger.info(f"✅ Сообщение отправлено в {chat_id}")
+    def _send_batch(self, post_id: int, post: dict, channels: List, on_result=None) -> Dict[str, bool]:
+        """Отправка поста в часть каналов"""
+        # Тело запроса собирается один раз, для канала меняется только chat_id
+        request = self._prepare_post(post)
+        
+        def send(channel):
+            # Повтор или досылка после перезапуска не должны публиковать пост второй раз
+            if self.ledger.is_delivered(post_id, channel):
+                logger.info(f"⏭️ Пост {post_id} уже опубликован в {channel}")
                 return True
-            else:
-                logger.error(f"❌ Ошибка отправки в {chat_id}: {response.text}")
+            
+            # Каналы на карантине пропускаются без запроса
+            if self.breaker.should_skip(channel):
                 return False
-                
-        except Exception as e:
-            logger.error(f"❌ Ошибка при отправке в {chat_id}: {e}")
+            
+            try:
+                sent = self._request(request.method, request.body(channel), request.timeout, channel)
+            except SendError as e:
+                self.breaker.record_failure(channel, e)
+                raise
+            self.ledger.record(post_id, channel, sent.get('message_id'))
+            self.breaker.record_success(channel)
+            logger.info(f"✅ Сообщение отправлено в {channel}")
+            return True
+        
+        # Временные ошибки повторяются из очереди, не задерживая остальные каналы
+        return deliver_with_requeue(channels, send, self.retry_policy, on_result)
+    
+    def _prepare_post(self, post: dict) -> PreparedRequest:
+        """Запрос отправки поста, общий для всех каналов рассылки"""
+        fields = {
+            'text': post['text'],
+            'parse_mode': post.get('parse_mode', 'HTML')
+        }
+        return PreparedRequest('sendMessage', fields, 10)
+    
+    async def _publish_to_channel_async(self, post_id: int, request: PreparedRequest, channel) -> bool:
+        """Отправка подготовленного поста в один канал при параллельной рассылке"""
+        # Повтор или досылка после перезапуска не должны публиковать пост второй раз
+        if self.ledger.is_delivered(post_id, channel):
+            logger.info(f"⏭️ Пост {post_id} уже опубликован в {channel}")
+            return True
+        
+        try:
+            sent = await self._call_async(request.method, request.body(channel), request.timeout, channel)
+        except SendError as e:
+            if e.transient:
+                # Временные ошибки повторяет iter_fan_out
+                raise
+            self.breaker.record_failure(channel, e)
+            logger.error(f"❌ Ошибка отправки в {channel}: {e}")
             return False
+        
+        self.ledger.record(post_id, channel, sent.get('message_id'))
+        self.breaker.record_success(channel)
+        logger.info(f"✅ Сообщение отправлено в {channel}")
+        return True
+    
+    def _stream_batch_async(self, post_id: int, post: dict, channels: List):
+        """Отправка поста в часть каналов параллельно, не более FANOUT_CONCURRENCY одновременно"""
+        # Тело запроса собирается один раз, для канала меняется только chat_id
+        request = self._prepare_post(post)
+        return iter_fan_out(
+            channels,
+            lambda channel: self._publish_to_channel_async(post_id, request, channel),
+            rate_limiter=self.rate_limiter,
+            retry_policy=self.retry_policy,
+            # Каналы на карантине пропускаются без запроса
+            skip=self.breaker.should_skip
+        )
     
-    def send_message_to_all_channels(self, text: str, parse_mode: str = 'HTML') -> Dict[str, bool]:
+    def send_message_to_all_channels(self, text: str, parse_mode: str = 'HTML', post_key: Optional[str] = None, on_result=None) -> Dict[str, bool]:
         """Отправка сообщения во все каналы"""
-        results = {}
-        
         logger.info(f"🚀 Начинаем публикацию в {len(self.channels)} каналов")
         
-        for channel in self.channels:
-            success = self.send_message(str(channel), text, parse_mode)
-            results[channel] = success
+        self.assign_channels()
+        
+        # Сначала записываем рассылку на диск, чтобы после перезапуска дослать недоставленное
+        post_id = self.outbox.enqueue(post_key, {'text': text, 'parse_mode': parse_mode}, self.channels)
+        results = self._drain(post_id, on_result)
         
         successful = sum(1 for success in results.values() if success)
         failed = len(results) - successful
@@ -110,110 +171,47 @@ class SimpleTelegramBot:
         logger.info(f"📊 Результаты: {successful} успешно, {failed} с ошибками")
         return results
     
-    def get_updates(self):
-        """Получение обновлений от Telegram"""
-        try:
-            url = f"{self.api_url}/getUpdates"
-            params = {
-                'offset': self.last_update_id + 1,
-                'timeout': 10
-            }
-            response = requests.get(url, params=params, timeout=15)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('ok'):
-                    return data.get('result', [])
-            return []
-            
-        except Exception as e:
-            logger.error(f"❌ Ошибка получения обновлений: {e}")
-            return []
+    async def send_message_to_all_channels_async(self, text: str, parse_mode: str = 'HTML', post_key: Optional[str] = None) -> Dict[str, bool]:
+        """Отправка сообщения во все каналы (asyncio)"""
+        logger.info(f"🚀 Начинаем публикацию в {len(self.channels)} каналов")
+        
+        await self.assign_channels_async()
+        
+        post_id = self.outbox.enqueue(post_key, {'text': text, 'parse_mode': parse_mode}, self.channels)
+        results = await drain_async(self.outbox, self._stream_batch_async, post_id)
+        
+        successful = sum(1 for success in results.values() if success)
+        logger.info(f"📊 Результаты: {successful} успешно, {len(results) - successful} с ошибками")
+        return results
     
-    def process_message(self, message):
-        """Обработка сообщения"""
-        try:
-            chat_id = message['chat']['id']
-            text = message.get('text', '')
-            
-            if text.startswith('/start'):
-                welcome_text = """
-🤖 <b>Добро пожаловать в бот автопостов!</b>
-
-<b>Доступные команды:</b>
-/post - Отправить пост во все каналы
-/status - Проверить статус бота
-/help - Показать справку
-
-<b>Автоматические посты:</b>
-Бот автоматически публикует посты по расписанию:
-"""
-                for time in PUBLISH_SCHEDULE:
-                    welcome_text += f"• {time} МСК\n"
-                
-                self.send_message(chat_id, welcome_text, 'HTML')
-                
-            elif text.startswith('/help'):
-                help_text = """
-📖 <b>Справка по командам:</b>
-
-<b>/post</b> - Отправить пост во все каналы
-Использование: /post [текст сообщения]
-Пример: /post Привет всем!
-
-<b>/status</b> - Проверить статус бота
-Показывает количество каналов и время следующей публикации
-
-<b>/help</b> - Показать эту справку
-
-<b>Автоматические посты:</b>
-Бот публикует посты по расписанию в указанное время.
-"""
-                self.send_message(chat_id, help_text, 'HTML')
-                
-            elif text.startswith('/post'):
-                # Получаем текст после /post
-                post_text = text[5:].strip()
-                
-                if not post_text:
-                    # Если текст не указан, используем шаблон
-                    current_time = datetime.now(self.timezone)
-                    time_str = current_time.strftime('%H:%M')
-                    
-                    template = None
-                    for scheduled_time in sorted(POST_TEMPLATES.keys()):
-                        if scheduled_time >= time_str:
-                            template = POST_TEMPLATES[scheduled_time]
-                            break
-                    
-                    if not template:
-                        template = list(POST_TEMPLATES.values())[0]
-                    
-                    post_text = template['text']
-                
-                # Отправляем сообщение о начале публикации
-                self.send_message(chat_id, f"🚀 Начинаю публикацию в {len(self.channels)} каналов...")
-                
-                # Публикуем во все каналы
-                results = self.send_message_to_all_channels(post_text)
-                
-                # Отправляем отчет
-                successful = sum(1 for success in results.values() if success)
-                failed = len(results) - successful
-                
-                report = f"""
-📊 <b>Результаты публикации:</b>
-
-✅ Успешно: {successful}
-❌ Ошибки: {failed}
-📤 Всего каналов: {len(results)}
-"""
-                self.send_message(chat_id, report, 'HTML')
-                
-            elif text.startswith('/status'):
-                current_time = datetime.now(self.timezone)
-                
-                status_text = f"""
+    def start_command(self, chat_id: str, args: None):
+        """Обработчик команды /start"""
+        self.send_message(chat_id, self.router.start_text, 'HTML')
+    
+    def help_command(self, chat_id: str, args: None):
+        """Обработчик команды /help"""
+        self.send_message(chat_id, self.router.help_text, 'HTML')
+    
+    def post_command(self, chat_id: str, post_text: str):
+        """Обработчик команды /post"""
+        if not post_text:
+            # Если текст не указан, используем ближайший шаблон
+            time_str = datetime.now(self.timezone).strftime('%H:%M')
+            post_text = self.templates.upcoming(time_str)['text']
+        
+        # Публикуем во все каналы; ход и отчет - в одном сообщении
+        self._broadcast_with_progress(
+            chat_id,
+            f"🚀 Начинаю публикацию в {len(self.channels)} каналов...",
+            "публикации",
+            lambda on_result: self.send_message_to_all_channels(post_text, on_result=on_result)
+        )
+    
+    def status_command(self, chat_id: str, args: None):
+        """Обработчик команды /status"""
+        current_time = datetime.now(self.timezone)
+        
+        status_text = f"""
 🤖 <b>Статус бота:</b>
 
 🕐 Текущее время: {current_time.strftime('%H:%M:%S')} МСК
@@ -222,39 +220,11 @@ class SimpleTelegramBot:
 
 <b>Следующие публикации:</b>
 """
-                
-                for time_str in sorted(POST_TEMPLATES.keys()):
-                    template = POST_TEMPLATES[time_str]
-                    status_text += f"• {time_str} - {template['text'][:50]}...\n"
-                
-                self.send_message(chat_id, status_text, 'HTML')
-                
-            else:
-                # Обычное сообщение
-                self.send_message(chat_id, "👋 Привет! Используй /help для просмотра доступных команд.")
-                
-        except Exception as e:
-            logger.error(f"❌ Ошибка обработки сообщения: {e}")
+        self.send_message(chat_id, status_text + self.templates.status_lines, 'HTML')
     
-    def run_polling(self):
-        """Запуск polling для получения сообщений"""
-        logger.info("🚀 Запуск polling для получения сообщений")
-        
-        while True:
-            try:
-                updates = self.get_updates()
-                
-                for update in updates:
-                    self.last_update_id = update['update_id']
-                    
-                    if 'message' in update:
-                        self.process_message(update['message'])
-                
-                time.sleep(1)  # Небольшая пауза между запросами
-                
-            except Exception as e:
-                logger.error(f"❌ Ошибка в polling: {e}")
-                time.sleep(5)  # Пауза при ошибке
+    def greet(self, chat_id: str, text: str):
+        """Ответ на обычное сообщение и неизвестную команду"""
+        self.send_message(chat_id, "👋 Привет! Используй /help для просмотра доступных команд.")
 
 class Scheduler:
     """Планировщик для автоматической публикации"""
@@ -269,6 +239,12 @@ class Scheduler:
             schedule.every().day.at(time_str).do(self.publish_scheduled_post, time_str)
             logger.info(f"⏰ Запланирована публикация на {time_str} МСК")
     
+    def catch_up(self):
+        """Досылка прерванных рассылок и слотов, пропущенных во время простоя"""
+        self.bot.resume_outbox()
+        
+        publish_missed_slots(self.bot.outbox, self.schedule_times, datetime.now(self.bot.timezone), self.publish_scheduled_post)
+    
     def publish_scheduled_post(self, time_str: str):
         """Публикация по расписанию"""
         current_time = datetime.now(self.bot.timezone)
@@ -285,7 +261,7 @@ class Scheduler:
         parse_mode = post_template.get('parse_mode', 'HTML')
         
         # Публикуем во все каналы
-        results = self.bot.send_message_to_all_channels(message, parse_mode)
+        results = self.bot.send_message_to_all_channels(message, parse_mode, schedule_post_key(current_time, time_str))
         
         # Логируем результаты
         for channel, success in results.items():
@@ -296,6 +272,7 @@ class Scheduler:
         """Запуск планировщика"""
         logger.info("🚀 Планировщик запущен")
         self.schedule_posts()
+        self.catch_up()
         
         while True:
             schedule.run_pending()
@@ -325,13 +302,18 @@ def main():
     logger.info(f"📢 Каналы: {len(CHANNELS)} каналов")
     logger.info("🎯 Интерактивные команды: /start, /help, /post, /status")
     
-    # Запускаем polling для получения сообщений
+    # Запускаем webhook (если задан WEBHOOK_URL) или polling для получения сообщений
     try:
-        bot.run_polling()
+        if WEBHOOK_ENABLED:
+            bot.run_webhook()
+        else:
+            bot.run_polling()
     except KeyboardInterrupt:
         logger.info("👋 Бот остановлен пользователем")
     except Exception as e:
         logger.error(f"❌ Ошибка при запуске бота: {e}")
+    finally:
+        bot.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Повторная отправка при временных ошибках Telegram
+Разбирает retry_after из ответа 429 и делит ошибки на временные и постоянные.
+Повторяются только ошибки, при которых запрос точно не дошел до Telegram
+(соединение не установлено, 429, 5xx): таймаут ответа повтором не лечится,
+он мог бы опубликовать пост второй раз.
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+# Импортируем конфигурацию
+try:
+    from config import RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY
+except ImportError:
+    # Если config.py недоступен, используем переменные окружения
+    RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', '5'))
+    RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', '1'))
+    RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '30'))
+
+logger = logging.getLogger(__name__)
+
+
+class SendError(Exception):
+    """Ошибка отправки с признаком, стоит ли повторять запрос"""
+
+    def __init__(self, description: str, transient: bool = False, retry_after: Optional[float] = None,
+                 outcome_unknown: bool = False):
+        super().__init__(description)
+        self.description = description
+        self.transient = transient
+        self.retry_after = retry_after
+        # Ответа нет: неизвестно, выполнил ли Telegram запрос
+        self.outcome_unknown = outcome_unknown
+
+
+def error_from_response(status_code: int, payload: Optional[dict], text: str = "") -> SendError:
+    """Классификация ответа Bot API с ошибкой"""
+    payload = payload or {}
+    description = payload.get('description') or text or f"HTTP {status_code}"
+    retry_after = (payload.get('parameters') or {}).get('retry_after')
+
+    if status_code == 429 or retry_after:
+        return SendError(description, transient=True, retry_after=float(retry_after or 1))
+    if status_code >= 500:
+        return SendError(description, transient=True)
+    return SendError(description, transient=False)
+
+
+def unknown_outcome(error: Exception) -> SendError:
+    """Ошибка после отправки запроса (таймаут ответа, обрыв соединения)
+
+    Telegram мог уже опубликовать пост, а повтор опубликовал бы его второй
+    раз, поэтому такая ошибка не повторяется: доставка в канал считается
+    неудачной, и по логу ее можно проверить вручную.
+    """
+    return SendError(f"Нет ответа Telegram, пост мог быть опубликован: {str(error) or error.__class__.__name__}",
+                     transient=False, outcome_unknown=True)
+
+
+# Ошибки httpx (python-telegram-bot 20+), при которых запрос точно не ушел в Telegram
+_HTTPX_NOT_SENT = ('ConnectError', 'ConnectTimeout', 'PoolTimeout')
+
+
+def classify_exception(error: Exception) -> SendError:
+    """Классификация исключения python-telegram-bot, requests или asyncio"""
+    if isinstance(error, SendError):
+        return error
+
+    try:
+        from telegram import error as tg_error
+    except ImportError:
+        tg_error = None
+
+    if tg_error is not None:
+        if isinstance(error, tg_error.RetryAfter):
+            retry_after = error.retry_after
+            if hasattr(retry_after, 'total_seconds'):
+                retry_after = retry_after.total_seconds()
+            return SendError(str(error), transient=True, retry_after=float(retry_after))
+
+        # BadRequest наследуется от NetworkError, поэтому проверяем постоянные ошибки первыми
+        permanent = tuple(
+            getattr(tg_error, name) for name in
+            ('BadRequest', 'Forbidden', 'Unauthorized', 'InvalidToken', 'ChatMigrated')
+            if hasattr(tg_error, name)
+        )
+        if isinstance(error, permanent):
+            return SendError(str(error), transient=False)
+        if isinstance(error, tg_error.NetworkError):
+            # Без исходного исключения это ответ сервера 5xx; повторять можно и ошибки
+            # до отправки (соединение не установлено, нет свободного соединения в пуле)
+            cause = error.__cause__
+            if (cause is None and not isinstance(error, tg_error.TimedOut)) \
+                    or type(cause).__name__ in _HTTPX_NOT_SENT or 'Pool timeout' in str(error):
+                return SendError(str(error), transient=True)
+            return unknown_outcome(error)
+
+    try:
+        import requests
+        from urllib3.exceptions import NewConnectionError
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            # Соединение не установлено - запрос не ушел; иначе ответ потерян после отправки
+            reason = getattr(error.args[0], 'reason', None) if error.args else None
+            if isinstance(error, requests.ConnectTimeout) or isinstance(reason, NewConnectionError):
+                return SendError(str(error), transient=True)
+            return unknown_outcome(error)
+    except ImportError:
+        pass
+
+    if isinstance(error, ConnectionRefusedError):
+        return SendError(str(error) or error.__class__.__name__, transient=True)
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return unknown_outcome(error)
+
+    return SendError(str(error), transient=False)
+
+
+class RetryPolicy:
+    """Экспоненциальная задержка со случайным разбросом"""
+
+    def __init__(
+        self,
+        max_attempts: int = RETRY_MAX_ATTEMPTS,
+        base_delay: float = RETRY_BASE_DELAY,
+        max_delay: float = RETRY_MAX_DELAY
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, error: SendError, attempt: int) -> bool:
+        """Повторяем только временные ошибки и не больше max_attempts попыток"""
+        return error.transient and attempt < self.max_attempts
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Задержка перед попыткой attempt + 1"""
+        if retry_after:
+            # Telegram сам сказал, сколько ждать; разброс не дает всем каналам проснуться разом
+            return retry_after + random.uniform(0, self.base_delay)
+
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return random.uniform(delay / 2, delay)
+
+
+def retry_call(send: Callable[[], Any], policy: Optional[RetryPolicy] = None, target: Any = None) -> Any:
+    """Синхронный вызов с повторами; после последней попытки пробрасывает SendError"""
+    policy = policy or RetryPolicy()
+    attempt = 1
+
+    while True:
+        try:
+            return send()
+        except Exception as e:
+            error = classify_exception(e)
+
+        if not policy.should_retry(error, attempt):
+            raise error
+
+        delay = policy.delay(attempt, error.retry_after)
+        logger.warning(f"🔁 Повтор отправки в {target} через {delay:.1f} сек (попытка {attempt + 1}/{policy.max_attempts}): {error}")
+        time.sleep(delay)
+        attempt += 1
+
+
+async def retry_call_async(send: Callable[[], Awaitable[Any]], policy: Optional[RetryPolicy] = None, target: Any = None) -> Any:
+    """Асинхронный вызов с повторами; после последней попытки пробрасывает SendError"""
+    policy = policy or RetryPolicy()
+    attempt = 1
+
+    while True:
+        try:
+            return await send()
+        except Exception as e:
+            error = classify_exception(e)
+
+        if not policy.should_retry(error, attempt):
+            raise error
+
+        delay = policy.delay(attempt, error.retry_after)
+        logger.warning(f"🔁 Повтор отправки в {target} через {delay:.1f} сек (попытка {attempt + 1}/{policy.max_attempts}): {error}")
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+def deliver_with_requeue(
+    channels: Iterable[Any],
+    send: Callable[[Any], Any],
+    policy: Optional[RetryPolicy] = None,
+    on_result: Optional[Callable[[Any, bool], None]] = None
+) -> Dict[Any, bool]:
+    """Синхронная рассылка с очередью повторов
+
+    Каналы с временной ошибкой возвращаются в очередь со своим временем
+    готовности, а остальные каналы тем временем продолжают отправляться.
+    send(channel) возвращает результат или выбрасывает исключение;
+    on_result(channel, success) вызывается, как только результат канала известен.
+    """
+    policy = policy or RetryPolicy()
+    results = {}
+
+    # Очередь с приоритетом по времени готовности; порядковый номер сохраняет порядок каналов
+    queue = [(0.0, seq, channel, 1) for seq, channel in enumerate(channels)]
+
+    while queue:
+        ready_at, seq, channel, attempt = heapq.heappop(queue)
+        delay = ready_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        try:
+            results[channel] = bool(send(channel))
+        except Exception as e:
+            error = classify_exception(e)
+
+            if policy.should_retry(error, attempt):
+                delay = policy.delay(attempt, error.retry_after)
+                logger.warning(f"🔁 Повтор отправки в {channel} через {delay:.1f} сек (попытка {attempt + 1}/{policy.max_attempts}): {error}")
+                heapq.heappush(queue, (time.monotonic() + delay, seq, channel, attempt + 1))
+                continue
+
+            logger.error(f"❌ Ошибка отправки в {channel}: {error}")
+            results[channel] = False
+
+        if on_result:
+            on_result(channel, results[channel])
+
+    return results
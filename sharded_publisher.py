@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Рассылка в нескольких процессах
+Каналы делятся между PUBLISH_WORKERS процессами по хешу; у каждого процесса
+свой цикл событий и свой пул HTTP-соединений, а координатор собирает
+результаты и счетчики в общий поток хода рассылки.
+
+Часть i всегда отправляет один и тот же процесс (свой пул из одного
+процесса на часть): счетчики предохранителя, кэш журнала доставок,
+file_id и лимит на чат канала живут в одном процессе, а перед каждой
+частью процесс перечитывает их из базы (сброс карантина в веб-панели,
+доставки и file_id, записанные другими процессами).
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+
+from fanout import FanOutProgress, ProgressCounter, FANOUT_CONCURRENCY, FANOUT_TIMEOUT
+from outbox import Delivery, OUTBOX_BATCH_SIZE
+from rate_limiter import set_process_share
+from telegram_bot import TelegramPublisher
+
+# Импортируем конфигурацию
+try:
+    from config import PUBLISH_WORKERS
+except ImportError:
+    # Если config.py недоступен, используем переменные окружения
+    PUBLISH_WORKERS = int(os.getenv('PUBLISH_WORKERS', '0'))
+
+logger = logging.getLogger(__name__)
+
+# Состояние процесса-исполнителя: создается один раз при его запуске
+_worker_publisher: Optional[TelegramPublisher] = None
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def shard_of(channel: Any, workers: int) -> int:
+    """Номер процесса для канала (crc32 не зависит от PYTHONHASHSEED, в отличие от hash)"""
+    return zlib.crc32(str(channel).encode('utf-8')) % workers
+
+
+def partition(deliveries: List[Delivery], workers: int) -> List[List[Delivery]]:
+    """Разбиение доставок по процессам"""
+    shards: List[List[Delivery]] = [[] for _ in range(workers)]
+    for delivery in deliveries:
+        shards[shard_of(delivery[2], workers)].append(delivery)
+    return shards
+
+
+def _init_worker(tokens: List[str], concurrency: int, timeout: float, workers: int, log_level: Optional[int]):
+    """Запуск процесса-исполнителя части: свой цикл событий, свой Bot и доля лимита"""
+    global _worker_publisher, _worker_loop
+
+    if log_level is not None:
+        # Процесс настраивает логи заново при импорте, уровень координатора до него не доходит
+        for name in (None, 'httpx'):
+            logging.getLogger(name).setLevel(log_level)
+
+    # Каждый процесс шлет от тех же ботов, поэтому общий лимит бота делится между процессами
+    set_process_share(1.0 / workers)
+    _worker_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_worker_loop)
+    _worker_publisher = TelegramPublisher(tokens, concurrency, timeout)
+
+
+async def _send_shard(post_id: int, post: Dict[str, Any], deliveries: List[Delivery]) -> Tuple[Dict[Any, bool], Dict[str, Any]]:
+    """Отправка своей части каналов и запись результатов в очередь доставки"""
+    publisher = _worker_publisher
+    # Закрепление каналов за ботами вычисляет координатор
+    publisher.token_pool.reload()
+    # Состояние в памяти процесса могли изменить веб-панель и другие процессы
+    publisher.breaker.reload()
+    publisher.ledger.reload()
+    publisher.albums.file_ids.reload()
+
+    delivery_ids = {channel: delivery_id for delivery_id, _, channel in deliveries}
+    started = time.monotonic()
+    sent: Dict[int, bool] = {}
+    results: Dict[Any, bool] = {}
+    try:
+        async for channel, success in publisher._stream_batch(post_id, post, list(delivery_ids)):
+            sent[delivery_ids[channel]] = success
+            results[channel] = success
+    finally:
+        publisher.outbox.complete(sent)
+
+    stats = {
+        'pid': os.getpid(),
+        'channels': len(results),
+        'successful': sum(1 for success in results.values() if success),
+        'elapsed': time.monotonic() - started
+    }
+    return results, stats
+
+
+def _publish_shard(post_id: int, post: Dict[str, Any], deliveries: List[Delivery]) -> Tuple[Dict[Any, bool], Dict[str, Any]]:
+    """Точка входа процесса-исполнителя"""
+    return _worker_loop.run_until_complete(_send_shard(post_id, post, deliveries))
+
+
+class ShardedPublisher(TelegramPublisher):
+    """Публикация с разделением каналов между процессами
+
+    Координатор записывает рассылку в очередь доставки, забирает доставки
+    и раздает их процессам; процессы отправляют и сами отмечают результаты
+    в той же базе (SQLite в режиме WAL допускает несколько процессов).
+    Текст и альбомы рассылаются одинаково: медиа альбома координатор
+    скачивает в кэш до записи рассылки, процессы берут его с диска.
+    """
+
+    def __init__(self, bot_token: Union[str, List[str]], workers: int = PUBLISH_WORKERS,
+                 concurrency: int = FANOUT_CONCURRENCY, timeout: float = FANOUT_TIMEOUT,
+                 log_level: Optional[int] = None):
+        super().__init__(bot_token, concurrency, timeout)
+        self.workers = workers
+        # Уровень логов процессов (None - как настроит импорт telegram_bot)
+        self.log_level = log_level
+        # Пул из одного процесса на каждую часть каналов
+        self.executors: List[Optional[ProcessPoolExecutor]] = [None] * workers
+        # Накопленные счетчики процессов {pid: {...}} для мониторинга
+        self.worker_stats: Dict[int, Dict[str, Any]] = {}
+
+    def _get_executor(self, shard: int) -> ProcessPoolExecutor:
+        """Процесс части запускается при первой рассылке, после закрепления каналов за ботами"""
+        if self.executors[shard] is None:
+            # spawn: процесс не наследует открытые соединения SQLite и HTTP родителя
+            self.executors[shard] = ProcessPoolExecutor(
+                max_workers=1,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(self.token_pool.tokens, self.concurrency, self.timeout, self.workers, self.log_level)
+            )
+            logger.info(f"🧩 Запущен процесс рассылки {shard + 1} из {self.workers}")
+        return self.executors[shard]
+
+    def _merge_stats(self, stats: Dict[str, Any]):
+        """Добавление счетчиков процесса к накопленным"""
+        total = self.worker_stats.setdefault(stats['pid'], {'channels': 0, 'successful': 0, 'elapsed': 0.0})
+        total['channels'] += stats['channels']
+        total['successful'] += stats['successful']
+        total['elapsed'] += stats['elapsed']
+
+    async def _run_shard(self, index: int, post_id: int, post: Dict[str, Any],
+                         shard: List[Delivery]) -> Dict[Any, bool]:
+        """Отправка части каналов в ее процессе; если процесс упал, доставки части возвращаются в очередь"""
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor(index)
+        try:
+            results, stats = await loop.run_in_executor(executor, _publish_shard, post_id, post, shard)
+        except Exception as e:
+            logger.error(f"❌ Процесс рассылки {index + 1} не завершил часть из {len(shard)} каналов: {e!r}")
+            if isinstance(e, BrokenProcessPool) and self.executors[index] is executor:
+                # Пул с упавшим процессом больше не принимает задачи: следующая рассылка запустит новый
+                self.executors[index] = None
+            # Завершенные процессом доставки release не трогает, остальные дошлются при следующем запуске
+            # (уже опубликованное пропустит журнал доставки)
+            self.outbox.release(delivery_id for delivery_id, _, _ in shard)
+            return {channel: False for _, _, channel in shard}
+
+        self._merge_stats(stats)
+        return results
+
+    async def _dispatch(self, deliveries: List[Delivery]) -> AsyncIterator[Tuple[Any, bool]]:
+        """Раздача доставок процессам и выдача результатов по мере завершения частей
+
+        Ошибка одного процесса не прерывает выдачу результатов остальных.
+        """
+        by_post: Dict[int, List[Delivery]] = {}
+        for delivery in deliveries:
+            by_post.setdefault(delivery[1], []).append(delivery)
+
+        tasks = []
+        for post_id, post_deliveries in by_post.items():
+            post = self.outbox.payload(post_id)
+            for index, shard in enumerate(partition(post_deliveries, self.workers)):
+                if shard:
+                    tasks.append(asyncio.ensure_future(self._run_shard(index, post_id, post, shard)))
+
+        try:
+            for task in asyncio.as_completed(tasks):
+                for channel, success in (await task).items():
+                    yield channel, success
+        finally:
+            # Потребитель прервал перебор: результаты процессов больше не нужны
+            for task in tasks:
+                task.cancel()
+
+    async def _publish_post_stream(self, post: dict, post_key: Optional[str]) -> AsyncIterator[FanOutProgress]:
+        """Запись поста в очередь доставки и рассылка силами процессов; результаты приходят частями по процессам"""
+        logger.info(f"🧩 Рассылка идет в {self.workers} процессах")
+
+        await self.assign_channels()
+
+        post_id = self.outbox.enqueue(post_key, post, self.channels)
+        deliveries = self.outbox.claim(self.outbox.pending_count(post_id), post_id)
+        counter = ProgressCounter(len(deliveries))
+
+        try:
+            async for channel, success in self._dispatch(deliveries):
+                yield counter.add(channel, success)
+        finally:
+            # Завершенные пары release не трогает, остальные возвращаются в очередь
+            self.outbox.release(delivery_id for delivery_id, _, _ in deliveries)
+
+        summary = counter.summary()
+        self._count_summary(summary)
+        yield summary
+
+    async def resume_outbox(self) -> Dict[str, bool]:
+        """Досылка рассылок, прерванных перезапуском (вызывать только при старте)"""
+        self.outbox.recover()
+        await self.assign_channels()
+
+        results = {}
+        attempted = set()
+        while True:
+            deliveries = self.outbox.claim(OUTBOX_BATCH_SIZE * self.workers)
+            if not deliveries:
+                break
+            if any(delivery_id in attempted for delivery_id, _, _ in deliveries):
+                # Вернулись доставки части, процесс которой упал: их дошлет следующий запуск
+                self.outbox.release(delivery_id for delivery_id, _, _ in deliveries)
+                break
+            attempted.update(delivery_id for delivery_id, _, _ in deliveries)
+            try:
+                async for channel, success in self._dispatch(deliveries):
+                    results[channel] = success
+            finally:
+                # Завершенные пары release не трогает, остальные возвращаются в очередь
+                self.outbox.release(delivery_id for delivery_id, _, _ in deliveries)
+
+        if results:
+            successful = sum(1 for success in results.values() if success)
+            logger.info(f"♻️ Дослано после перезапуска: {successful} из {len(results)}")
+
+        return results
+
+    def close(self):
+        """Остановка процессов рассылки"""
+        for index, executor in enumerate(self.executors):
+            if executor is not None:
+                executor.shutdown()
+                self.executors[index] = None
+
+
+def create_publisher(bot_token: Union[str, List[str]]) -> TelegramPublisher:
+    """Публикатор в одном процессе или, если задан PUBLISH_WORKERS > 1, в нескольких"""
+    if PUBLISH_WORKERS > 1:
+        return ShardedPublisher(bot_token, PUBLISH_WORKERS)
+    return TelegramPublisher(bot_token)
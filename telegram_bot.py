@@ -2,17 +2,13 @@ import asyncio
 import logging
 import schedule
 import time
-from datetime import datetime
-from typing import List, Dict, Optional
-import pytz
-from telegram import Bot
-from telegram.error import TelegramError
+from fanout import run_background, run_sync
+from outbox import schedule_post_key
+from publisher import TelegramPublisher, catch_up
 from config import (
     BOT_TOKEN, 
     CHANNELS, 
     PUBLISH_SCHEDULE, 
-    TIMEZONE, 
-    POST_TEMPLATES,
     LOG_LEVEL,
     LOG_FILE
 )
@@ -28,68 +24,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class TelegramPublisher:
-    """Класс для публикации сообщений в Telegram каналы"""
-    
-    def __init__(self, bot_token: str):
-        self.bot = Bot(token=bot_token)
-        self.channels = CHANNELS
-        self.timezone = pytz.timezone(TIMEZONE)
-        
-    async def publish_to_channel(self, channel: str, message: str, parse_mode: str = 'HTML') -> bool:
-        """Публикация сообщения в один канал"""
-        try:
-            await self.bot.send_message(
-                chat_id=channel,
-                text=message,
-                parse_mode=parse_mode
-            )
-            logger.info(f"✅ Сообщение успешно отправлено в {channel}")
-            return True
-        except TelegramError as e:
-            logger.error(f"❌ Ошибка при отправке в {channel}: {e}")
-            return False
-        except Exception as e:
-            logger.error(f"❌ Неожиданная ошибка при отправке в {channel}: {e}")
-            return False
-    
-    async def publish_to_all_channels(self, message: str, parse_mode: str = 'HTML') -> Dict[str, bool]:
-        """Публикация сообщения во все каналы"""
-        results = {}
-        
-        logger.info(f"🚀 Начинаем публикацию сообщения в {len(self.channels)} каналов")
-        
-        # Создаем задачи для всех каналов
-        tasks = []
-        for channel in self.channels:
-            task = self.publish_to_channel(channel, message, parse_mode)
-            tasks.append((channel, task))
-        
-        # Выполняем все задачи параллельно
-        for channel, task in tasks:
-            try:
-                result = await task
-                results[channel] = result
-            except Exception as e:
-                logger.error(f"❌ Ошибка при обработке канала {channel}: {e}")
-                results[channel] = False
-        
-        # Подсчитываем результаты
-        successful = sum(1 for success in results.values() if success)
-        failed = len(results) - successful
-        
-        logger.info(f"📊 Результаты публикации: {successful} успешно, {failed} с ошибками")
-        
-        return results
-    
-    def get_current_time_moscow(self) -> datetime:
-        """Получение текущего времени в МСК"""
-        return datetime.now(self.timezone)
-    
-    def get_post_for_time(self, time_str: str) -> Optional[Dict[str, str]]:
-        """Получение шаблона поста для указанного времени"""
-        return POST_TEMPLATES.get(time_str)
-
 class Scheduler:
     """Планировщик для автоматической публикации"""
     
@@ -100,9 +34,17 @@ class Scheduler:
     def schedule_posts(self):
         """Настройка расписания публикации"""
         for time_str in self.schedule_times:
-            schedule.every().day.at(time_str).do(self.publish_scheduled_post, time_str)
+            schedule.every().day.at(time_str).do(self.run_scheduled_post, time_str)
             logger.info(f"⏰ Запланирована публикация на {time_str} МСК")
     
+    def run_scheduled_post(self, time_str: str):
+        """Запуск публикации по расписанию из потока планировщика"""
+        run_sync(self.publish_scheduled_post(time_str))
+    
+    def catch_up(self):
+        """Досылка прерванных рассылок и слотов, пропущенных во время простоя"""
+        catch_up(self.publisher, self.schedule_times, self.run_scheduled_post)
+    
     async def publish_scheduled_post(self, time_str: str):
         """Публикация по расписанию"""
         current_time = self.publisher.get_current_time_moscow()
@@ -119,7 +61,7 @@ class Scheduler:
         parse_mode = post_template.get('parse_mode', 'HTML')
         
         # Публикуем во все каналы
-        results = await self.publisher.publish_to_all_channels(message, parse_mode)
+        results = await self.publisher.publish_to_all_channels(message, parse_mode, schedule_post_key(current_time, time_str))
         
         # Логируем результаты
         for channel, success in results.items():
@@ -130,6 +72,7 @@ class Scheduler:
         """Запуск планировщика"""
         logger.info("🚀 Планировщик запущен")
         self.schedule_posts()
+        self.catch_up()
         
         while True:
             schedule.run_pending()
@@ -144,13 +87,15 @@ async def main():
         logger.error("❌ Необходимо указать BOT_TOKEN в config.py или переменной окружения")
         return
     
-    # Создаем экземпляры классов
-    publisher = TelegramPublisher(BOT_TOKEN)
+    # Создаем экземпляры классов (при PUBLISH_WORKERS > 1 рассылка идет в нескольких процессах)
+    from sharded_publisher import create_publisher
+    publisher = create_publisher(BOT_TOKEN)
     scheduler = Scheduler(publisher)
     
     # Тестируем подключение к боту
     try:
-        bot_info = await publisher.bot.get_me()
+        # Боты публикатора работают в общем цикле процесса вместе с планировщиком
+        bot_info = await run_background(publisher.bot.get_me())
         logger.info(f"✅ Бот подключен: @{bot_info.username}")
     except Exception as e:
         logger.error(f"❌ Ошибка подключения к боту: {e}")
@@ -0,0 +1,67 @@
+"""
+Общие фикстуры тестов: локальный Bot API (fake_bot_api) и бот на прямых запросах к нему
+Окружение задается до импорта модулей бота: config.py читает его при импорте
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Очередь доставки, журнал и предохранитель ботов - во временной базе, а не в outbox.db проекта
+os.environ['OUTBOX_PATH'] = os.path.join(tempfile.mkdtemp(prefix='tests-'), 'outbox.db')
+# Тесты проверяют логику доставки, а не лимиты Telegram
+os.environ['RATE_LIMIT_GLOBAL'] = '1000000'
+os.environ['RATE_LIMIT_PER_CHAT'] = '1000000'
+os.environ['RATE_LIMIT_PER_GROUP'] = '1000000'
+os.environ['RETRY_BASE_DELAY'] = '0.01'
+
+import fanout  # noqa: E402
+from fake_bot_api import FakeBotAPI  # noqa: E402
+
+# Канал, из которого бот удален: Telegram отвечает 403 "bot was kicked"
+DEAD_CHAT = '-100999'
+
+# Токен вида <id бота>:<секрет>, как у настоящих ботов
+TOKEN = '123456:TEST'
+
+_channel_ids = iter(range(1, 10 ** 9))
+
+
+@pytest.fixture(scope='session')
+def fake_api():
+    """Локальный Bot API на свободном порту; боты обращаются к нему вместо api.telegram.org"""
+    api = FakeBotAPI(host='127.0.0.1', port=0, latency=0, rate_429=0, error_rate=0, dead_chats=[DEAD_CHAT])
+    url = api.start()
+    base_url, file_url = fanout.BOT_API_BASE_URL, fanout.BOT_API_FILE_URL
+    fanout.BOT_API_BASE_URL = f"{url}/bot"
+    fanout.BOT_API_FILE_URL = f"{url}/file/bot"
+    yield api
+    fanout.BOT_API_BASE_URL, fanout.BOT_API_FILE_URL = base_url, file_url
+    api.stop()
+
+
+def calls(api: FakeBotAPI, method: str) -> int:
+    """Сколько раз локальный Bot API получил запрос метода"""
+    return api.stats()['calls'].get(method, 0)
+
+
+@pytest.fixture
+def channels():
+    """Новые ID каналов для каждого теста: журнал и предохранитель общие на процесс"""
+    return [f"-100{next(_channel_ids)}" for _ in range(5)]
+
+
+@pytest.fixture
+def simple_bot(fake_api, channels):
+    """SimpleTelegramBot, рассылающий в channels через локальный Bot API"""
+    from render_simple_bot import SimpleTelegramBot
+
+    bot = SimpleTelegramBot(TOKEN)
+    bot.channels = channels
+    yield bot
+    bot.close()
@@ -0,0 +1,88 @@
+"""Тела запросов Bot API: форма с дописанным chat_id и multipart с файлами с диска"""
+
+from urllib.parse import parse_qs
+
+import pytest
+
+from bot_api import UPLOAD_CHUNK_SIZE, MultipartBody, PreparedRequest, UploadRequest
+
+
+def form(body: bytes):
+    return {key: values[0] for key, values in parse_qs(body.decode('ascii'), keep_blank_values=True).items()}
+
+
+@pytest.mark.parametrize('chat_id', ['-1001234567890', '@my_channel', -100123, 'a&b=c d'])
+def test_prepared_body_splices_chat_id(chat_id):
+    fields = {'text': 'Привет & <b>всем</b> 100%', 'parse_mode': 'HTML'}
+    request = PreparedRequest('sendMessage', fields, 30)
+
+    assert form(request.body(chat_id)) == {'chat_id': str(chat_id), **fields}
+
+
+def test_prepared_body_drops_none_fields():
+    request = PreparedRequest('sendMessage', {'text': 'a', 'parse_mode': None}, 30)
+
+    assert form(request.body('-1001')) == {'chat_id': '-1001', 'text': 'a'}
+    # Общая часть закодирована один раз и не меняется от канала к каналу
+    assert request.body('-1001').endswith(request.tail)
+    assert request.body('-1002').endswith(request.tail)
+
+
+def test_prepared_body_accepted_by_bot_api(simple_bot, channels):
+    text = 'Пост & <b>ссылка</b> https://example.com/?a=1&b=2'
+    request = PreparedRequest('sendMessage', {'text': text, 'parse_mode': 'HTML'}, 10)
+
+    sent = simple_bot._request(request.method, request.body(channels[0]), request.timeout, channels[0])
+
+    assert sent['text'] == text
+    assert sent['chat']['id'] == int(channels[0])
+
+
+@pytest.fixture
+def files(tmp_path):
+    sizes = {'empty.bin': 0, 'small.txt': 10, 'large.mp4': UPLOAD_CHUNK_SIZE * 3 + 7}
+    paths = {}
+    for name, size in sizes.items():
+        path = tmp_path / name
+        path.write_bytes(bytes(range(256)) * (size // 256) + b'x' * (size % 256))
+        paths[name] = str(path)
+    return paths
+
+
+@pytest.mark.parametrize('names', [[], ['empty.bin'], ['small.txt'], ['large.mp4', 'small.txt', 'empty.bin']])
+def test_multipart_content_length(files, names):
+    body = MultipartBody(
+        {'chat_id': '-1001', 'caption': 'Подпись "в кавычках"', 'parse_mode': None},
+        [(f'file{i}', files[name], name) for i, name in enumerate(names)]
+    )
+    data = b''.join(body.chunks())
+
+    assert int(body.headers['Content-Length']) == len(data)
+    assert len(body.reader()) == len(data)
+    assert body.reader().read() == data
+    assert b'parse_mode' not in data
+
+
+def test_multipart_reader_reads_by_size(files):
+    body = MultipartBody({'chat_id': '-1001'}, [('video', files['large.mp4'], 'large.mp4')])
+    reader = body.reader()
+
+    parts = []
+    while True:
+        part = reader.read(1000)
+        if not part:
+            break
+        assert len(part) <= 1000
+        parts.append(part)
+
+    assert b''.join(parts) == b''.join(body.chunks())
+
+
+def test_upload_accepted_by_bot_api(simple_bot, channels, files):
+    request = UploadRequest('sendDocument', {'caption': 'Файл', 'parse_mode': 'HTML'},
+                            [('document', files['large.mp4'], 'large.mp4')], 10)
+
+    sent = simple_bot._request(request.method, request.body(channels[0]), request.timeout, channels[0])
+
+    assert sent['caption'] == 'Файл'
+    assert sent['document']['file_size'] == UPLOAD_CHUNK_SIZE * 3 + 7
@@ -0,0 +1,92 @@
+"""Предохранитель каналов: карантин после threshold ошибок подряд и пробные отправки"""
+
+import time
+
+import pytest
+
+from circuit_breaker import CircuitBreaker
+from conftest import DEAD_CHAT, calls
+from retry import SendError
+
+KICKED = SendError("Forbidden: bot was kicked from the channel chat")
+
+
+@pytest.fixture
+def breaker(tmp_path):
+    breaker = CircuitBreaker(str(tmp_path / 'outbox.db'), threshold=3, probe_hours=1)
+    yield breaker
+    breaker.close()
+
+
+def test_opens_after_threshold(breaker):
+    for _ in range(2):
+        breaker.record_failure('-1001', KICKED)
+    assert not breaker.should_skip('-1001')
+
+    breaker.record_failure('-1001', KICKED)
+
+    assert breaker.should_skip('-1001')
+    assert [entry['channel'] for entry in breaker.quarantined()] == ['-1001']
+
+
+def test_counts_only_dead_channel_errors(breaker):
+    for error in (SendError("Bad Request: can't parse entities"), SendError("Timed out", transient=True)):
+        for _ in range(5):
+            breaker.record_failure('-1001', error)
+
+    assert not breaker.has_failures('-1001')
+    assert not breaker.should_skip('-1001')
+
+
+def test_success_resets_counter(breaker):
+    for _ in range(2):
+        breaker.record_failure('-1001', KICKED)
+    breaker.record_success('-1001')
+    breaker.record_failure('-1001', KICKED)
+
+    assert not breaker.should_skip('-1001')
+
+
+def test_probe_once_per_interval(breaker):
+    for _ in range(3):
+        breaker.record_failure('-1001', KICKED)
+
+    # Время пробы подошло: одна рассылка проходит в канал, следующая проба - через probe_hours
+    breaker.states['-1001']['next_probe'] = time.time() - 1
+    assert not breaker.should_skip('-1001')
+    assert breaker.should_skip('-1001')
+    assert breaker.states['-1001']['next_probe'] > time.time() + breaker.probe_interval - 60
+
+    breaker.record_success('-1001')
+    assert not breaker.should_skip('-1001')
+    assert breaker.quarantined() == []
+
+
+def test_reset_reaches_other_process(tmp_path):
+    path = str(tmp_path / 'outbox.db')
+    worker, dashboard = CircuitBreaker(path, threshold=1), CircuitBreaker(path, threshold=1)
+    worker.record_failure('-1001', KICKED)
+    assert worker.should_skip('-1001')
+
+    assert dashboard.reset('-1001')
+    worker.reload()
+
+    assert not worker.should_skip('-1001')
+
+
+def test_dead_channel_quarantined_in_broadcast(simple_bot, fake_api, channels):
+    simple_bot.channels = channels + [DEAD_CHAT]
+    simple_bot.breaker.reset(DEAD_CHAT)
+
+    for _ in range(simple_bot.breaker.threshold):
+        results = simple_bot.send_message_to_all_channels('Пост')
+        assert results[DEAD_CHAT] is False
+    sent = calls(fake_api, 'sendMessage')
+
+    results = simple_bot.send_message_to_all_channels('Пост')
+
+    # Канал на карантине пропускается без запроса, остальные получают пост
+    assert results[DEAD_CHAT] is False
+    assert all(results[channel] for channel in channels)
+    assert calls(fake_api, 'sendMessage') - sent == len(channels)
+    simple_bot.breaker.reset(DEAD_CHAT)
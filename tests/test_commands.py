@@ -0,0 +1,65 @@
+"""Таблица команд: выбор обработчика, разбор аргументов и команды другому боту (/post@other_bot)"""
+
+import pytest
+
+from commands import POST, START, STATUS, TEXT_COMMANDS, CommandRouter, split_command
+
+
+def handlers():
+    return {'post': lambda chat_id, args: None, 'status': lambda chat_id, args: None}
+
+
+@pytest.fixture
+def router():
+    return CommandRouter(TEXT_COMMANDS, handlers(), fallback=lambda chat_id, text: None, username='my_bot')
+
+
+def test_split_command():
+    assert split_command('/Post@My_Bot привет') == ('post', 'My_Bot', ' привет')
+    assert split_command('/status') == ('status', '', '')
+    assert split_command('/post/x') is None
+    assert split_command('привет') is None
+
+
+def test_routes_command_with_args(router):
+    handler, args = router.route('/post  Привет всем!')
+
+    assert handler is router.handlers['post']
+    assert args == 'Привет всем!'
+
+
+@pytest.mark.parametrize('text', ['/post@my_bot текст', '/post@MY_BOT текст', '/post текст'])
+def test_accepts_own_username(router, text):
+    assert router.route(text) == (router.handlers['post'], 'текст')
+
+
+def test_ignores_other_bot(router):
+    assert router.route('/post@other_bot текст') is None
+    assert router.route('/status@other_bot') is None
+
+
+def test_any_username_before_get_me():
+    # Пока имя бота не загружено из getMe, команда с любым @ принимается
+    router = CommandRouter(TEXT_COMMANDS, handlers())
+
+    assert router.route('/status@whatever_bot') == (router.handlers['status'], None)
+
+
+def test_fallback_for_text_and_unknown_commands(router):
+    assert router.route('привет') == (router.fallback, 'привет')
+    # У /start нет обработчика - сообщение уходит в fallback целиком
+    assert router.route('/start@my_bot') == (router.fallback, '/start@my_bot')
+    assert CommandRouter(TEXT_COMMANDS, handlers()).route('привет') is None
+
+
+def test_unknown_handler_rejected():
+    with pytest.raises(ValueError):
+        CommandRouter((POST, STATUS), {'post': print, 'photo': print})
+
+
+def test_help_lists_only_commands_with_summary():
+    router = CommandRouter((POST, STATUS, START), {}, schedule=['08:00'])
+
+    assert '/post - ' in router.start_text
+    assert '/start - ' not in router.start_text
+    assert '08:00 МСК' in router.start_text
@@ -0,0 +1,53 @@
+"""Журнал доставок: пост публикуется в канал не больше одного раза"""
+
+from conftest import calls
+from delivery_ledger import CACHED_POSTS, DeliveryLedger
+from outbox import PENDING
+
+
+def test_record_and_lookup(tmp_path):
+    ledger = DeliveryLedger(str(tmp_path / 'outbox.db'))
+
+    ledger.record(1, '-1001', 42)
+
+    assert ledger.is_delivered(1, '-1001')
+    assert not ledger.is_delivered(1, '-1002')
+    assert ledger.get(1, '-1001') == 42
+    assert ledger.messages(1) == {'-1001': 42}
+
+
+def test_deliveries_survive_restart_and_cache_eviction(tmp_path):
+    path = str(tmp_path / 'outbox.db')
+    ledger = DeliveryLedger(path)
+    ledger.record(1, '-1001', 42)
+    for post_id in range(2, CACHED_POSTS + 3):
+        ledger.record(post_id, '-1001', post_id)
+
+    assert 1 not in ledger.cache
+    assert ledger.is_delivered(1, '-1001')
+    assert DeliveryLedger(path).get(1, '-1001') == 42
+
+
+def test_reload_sees_other_process(tmp_path):
+    path = str(tmp_path / 'outbox.db')
+    worker, other = DeliveryLedger(path), DeliveryLedger(path)
+    assert not worker.is_delivered(1, '-1001')
+
+    other.record(1, '-1001', 42)
+    worker.reload()
+
+    assert worker.is_delivered(1, '-1001')
+
+
+def test_resume_does_not_send_twice(simple_bot, fake_api, channels):
+    post_id = simple_bot.outbox.enqueue(None, {'text': 'Пост'}, channels)
+    simple_bot._drain(post_id)
+    sent = calls(fake_api, 'sendMessage')
+
+    # Сбой между отправкой и записью результата в очередь: доставки снова ждут отправки
+    with simple_bot.outbox.lock:
+        simple_bot.outbox.conn.execute("UPDATE deliveries SET status = ? WHERE post_id = ?", (PENDING, post_id))
+    results = simple_bot.resume_outbox()
+
+    assert results == {channel: True for channel in channels}
+    assert calls(fake_api, 'sendMessage') == sent
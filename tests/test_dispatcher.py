@@ -0,0 +1,134 @@
+"""Обработка обновлений в пулах: порядок внутри чата и рассылки отдельно от быстрых команд"""
+
+import threading
+import time
+
+import pytest
+
+from dispatcher import ChatDispatcher, update_chat, update_command
+
+_update_ids = iter(range(1, 10 ** 9))
+
+
+def update(chat_id, text):
+    return {'update_id': next(_update_ids), 'message': {'chat': {'id': chat_id}, 'text': text}}
+
+
+class Recorder:
+    """Обработчик, запоминающий порядок выполнения; /post выполняется delay секунд"""
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.done = []
+
+    def __call__(self, update):
+        text = update['message']['text']
+        if text.startswith('/post'):
+            time.sleep(self.delay)
+        with self.lock:
+            self.done.append((update_chat(update), text))
+
+    def texts(self, chat_id):
+        with self.lock:
+            return [text for chat, text in self.done if chat == chat_id]
+
+
+@pytest.fixture
+def dispatch():
+    dispatchers = []
+
+    def create(handler, **kwargs):
+        dispatcher = ChatDispatcher(handler, ['/post'], **kwargs)
+        dispatchers.append(dispatcher)
+        return dispatcher
+
+    yield create
+    for dispatcher in dispatchers:
+        dispatcher.shutdown()
+
+
+def wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "обновления не обработаны"
+        time.sleep(0.01)
+
+
+def test_update_helpers():
+    assert update_command(update(1, '/post@my_bot текст')) == '/post'
+    assert update_command(update(1, 'текст')) == ''
+    assert update_command({'update_id': 1}) == ''
+    assert update_chat(update(42, '/status')) == 42
+
+
+def test_keeps_order_within_chat(dispatch):
+    recorder = Recorder()
+    dispatcher = dispatch(recorder, workers=8)
+    texts = [f"/status {i}" for i in range(50)]
+
+    for text in texts:
+        dispatcher.submit(update(1, text))
+    dispatcher.shutdown()
+
+    assert recorder.texts(1) == texts
+    assert dispatcher.queued == 0
+
+
+def test_broadcasts_of_chat_run_one_at_a_time(dispatch):
+    recorder = Recorder(delay=0.05)
+    dispatcher = dispatch(recorder, broadcast_workers=4)
+    posts = [f"/post {i}" for i in range(4)]
+
+    for text in posts:
+        dispatcher.submit(update(1, text))
+    dispatcher.shutdown()
+
+    assert recorder.texts(1) == posts
+
+
+def test_fast_command_not_blocked_by_broadcast(dispatch):
+    release = threading.Event()
+    recorder = Recorder()
+
+    def handler(update):
+        if update['message']['text'].startswith('/post'):
+            release.wait(5)
+        recorder(update)
+
+    dispatcher = dispatch(handler, workers=1, broadcast_workers=1)
+    dispatcher.submit(update(1, '/post долгая рассылка'))
+    dispatcher.submit(update(1, '/status'))
+
+    wait_for(lambda: recorder.texts(1) == ['/status'])
+    release.set()
+    wait_for(lambda: recorder.texts(1) == ['/status', '/post долгая рассылка'])
+
+
+def test_chats_run_in_parallel(dispatch):
+    recorder = Recorder(delay=0.2)
+    dispatcher = dispatch(recorder, broadcast_workers=4)
+
+    started = time.monotonic()
+    for chat_id in range(4):
+        dispatcher.submit(update(chat_id, '/post'))
+    dispatcher.shutdown()
+
+    assert len(recorder.done) == 4
+    assert time.monotonic() - started < 0.6
+
+
+def test_handler_error_does_not_stop_chat(dispatch):
+    recorder = Recorder()
+
+    def handler(update):
+        if update['message']['text'] == '/status fail':
+            raise RuntimeError("сбой")
+        recorder(update)
+
+    dispatcher = dispatch(handler)
+    for text in ('/status 1', '/status fail', '/status 2'):
+        dispatcher.submit(update(1, text))
+    dispatcher.shutdown()
+
+    assert recorder.texts(1) == ['/status 1', '/status 2']
@@ -0,0 +1,80 @@
+"""Очередь доставки: постановка, захват, возврат после перезапуска и освобождение"""
+
+import pytest
+
+from conftest import calls
+from outbox import DELIVERED, FAILED, IN_PROGRESS, PENDING, Outbox
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    outbox = Outbox(str(tmp_path / 'outbox.db'))
+    yield outbox
+    outbox.close()
+
+
+def statuses(outbox: Outbox, post_id: int):
+    rows = outbox.conn.execute("SELECT channel, status FROM deliveries WHERE post_id = ?", (post_id,)).fetchall()
+    return dict(rows)
+
+
+def test_enqueue_same_key_returns_same_post(outbox):
+    post_id = outbox.enqueue('slot:08:00', {'text': 'a'}, ['-1001', '-1002'])
+
+    assert outbox.enqueue('slot:08:00', {'text': 'b'}, ['-1003']) == post_id
+    assert outbox.payload(post_id) == {'text': 'a'}
+    assert outbox.pending_count(post_id) == 2
+    assert outbox.has_post('slot:08:00')
+
+
+def test_claim_takes_each_delivery_once(outbox):
+    post_id = outbox.enqueue(None, {'text': 'a'}, ['-1001', '-1002', '-1003'])
+
+    first = outbox.claim(2, post_id)
+    second = outbox.claim(2, post_id)
+
+    assert [channel for _, _, channel in first] == ['-1001', '-1002']
+    assert [channel for _, _, channel in second] == ['-1003']
+    assert outbox.claim(2, post_id) == []
+    assert set(statuses(outbox, post_id).values()) == {IN_PROGRESS}
+
+
+def test_complete_records_results(outbox):
+    post_id = outbox.enqueue(None, {'text': 'a'}, ['-1001', '-1002'])
+    (ok_id, _, _), (failed_id, _, _) = outbox.claim(10, post_id)
+
+    outbox.complete({ok_id: True, failed_id: False})
+
+    assert statuses(outbox, post_id) == {'-1001': DELIVERED, '-1002': FAILED}
+    assert outbox.pending_count() == 0
+
+
+def test_recover_returns_interrupted_deliveries(outbox):
+    post_id = outbox.enqueue(None, {'text': 'a'}, ['-1001', '-1002'])
+    (delivered_id, _, _), _ = outbox.claim(10, post_id)
+    outbox.complete({delivered_id: True})
+
+    # Перезапуск посреди рассылки: вторая доставка осталась захваченной
+    assert outbox.recover() == 1
+    assert statuses(outbox, post_id) == {'-1001': DELIVERED, '-1002': PENDING}
+    assert [channel for _, _, channel in outbox.claim(10, post_id)] == ['-1002']
+
+
+def test_release_keeps_completed_deliveries(outbox):
+    post_id = outbox.enqueue(None, {'text': 'a'}, ['-1001', '-1002', '-1003'])
+    deliveries = outbox.claim(10, post_id)
+    outbox.complete({deliveries[0][0]: True, deliveries[1][0]: False})
+
+    outbox.release(delivery_id for delivery_id, _, _ in deliveries)
+
+    assert statuses(outbox, post_id) == {'-1001': DELIVERED, '-1002': FAILED, '-1003': PENDING}
+
+
+def test_broadcast_goes_through_outbox(simple_bot, fake_api, channels):
+    sent_before = calls(fake_api, 'sendMessage')
+
+    results = simple_bot.send_message_to_all_channels('Пост', post_key='test:outbox')
+
+    assert results == {channel: True for channel in channels}
+    assert calls(fake_api, 'sendMessage') - sent_before == len(channels)
+    assert simple_bot.outbox.pending_count() == 0
@@ -0,0 +1,41 @@
+"""Номер последнего принятого обновления: после перезапуска команды не приходят повторно"""
+
+import json
+
+from conftest import TOKEN
+from polling import POLL_TIMEOUT, UpdateOffsets, updates_request
+
+
+def test_offset_defaults_to_zero(tmp_path):
+    assert UpdateOffsets(str(tmp_path / 'outbox.db')).get(TOKEN) == 0
+
+
+def test_offset_survives_restart(tmp_path):
+    path = str(tmp_path / 'outbox.db')
+    offsets = UpdateOffsets(path)
+    offsets.save(TOKEN, 10)
+    offsets.save(TOKEN, 11)
+    offsets.close()
+
+    assert UpdateOffsets(path).get(TOKEN) == 11
+
+
+def test_offset_per_bot(tmp_path):
+    offsets = UpdateOffsets(str(tmp_path / 'outbox.db'))
+    offsets.save('111:A', 5)
+    offsets.save('222:B', 7)
+
+    assert offsets.get('111:A') == 5
+    assert offsets.get('222:B') == 7
+    # Хранится ID бота, а не токен: после смены секрета offset сохраняется
+    assert offsets.get('111:NEW') == 5
+    stored = offsets.conn.execute("SELECT bot_id FROM update_offsets ORDER BY bot_id").fetchall()
+    assert stored == [(111,), (222,)]
+
+
+def test_updates_request():
+    assert updates_request(12, ['message']) == {
+        'offset': 12,
+        'timeout': POLL_TIMEOUT,
+        'allowed_updates': json.dumps(['message'])
+    }
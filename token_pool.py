@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Рассылка через несколько ботов
+Лимиты Telegram считаются на бота, поэтому каждый канал закрепляется за одним
+из ботов пула, который в нем администратор, и общая скорость рассылки растет
+с числом ботов. Закрепление вычисляется один раз и хранится в базе очереди
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from fanout import fan_out
+from outbox import OUTBOX_PATH
+from rate_limiter import ChatId, RateLimiter, get_rate_limiter
+from retry import classify_exception
+
+# Импортируем конфигурацию
+try:
+    from config import BOT_EXTRA_TOKENS, SHARD_REFRESH_HOURS
+except ImportError:
+    # Если config.py недоступен, используем переменные окружения
+    BOT_EXTRA_TOKENS = [token.strip() for token in os.getenv('BOT_EXTRA_TOKENS', '').split(',') if token.strip()]
+    SHARD_REFRESH_HOURS = float(os.getenv('SHARD_REFRESH_HOURS', '24'))
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+-- channel без типа: SQLite хранит ID канала как есть (число или @username);
+-- вместо токена хранится только ID бота (часть токена до двоеточия)
+CREATE TABLE IF NOT EXISTS channel_bots (
+    channel NOT NULL PRIMARY KEY,
+    bot_id INTEGER NOT NULL,
+    checked_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Статусы участника, с которыми бот может публиковать в канал
+ADMIN_STATUSES = ('administrator', 'creator')
+
+
+def bot_id(token: str) -> int:
+    """ID бота - часть токена до двоеточия (запрос getMe не нужен)"""
+    return int(token.split(':', 1)[0])
+
+
+def check_failed(error: Exception) -> bool:
+    """Проверка прав не состоялась (429, 5xx, нет соединения или ответа)
+
+    Постоянная ошибка Telegram (чат не найден, бот не участник) - ответ
+    "не администратор", а не сбой проверки.
+    """
+    error = classify_exception(error)
+    return error.transient or error.outcome_unknown
+
+
+def pool_tokens(bot_token: Union[str, Iterable[str]]) -> List[str]:
+    """Токены пула: переданный токен (или список токенов) и BOT_EXTRA_TOKENS, без повторов"""
+    tokens = [bot_token] if isinstance(bot_token, str) else list(bot_token)
+    return list(dict.fromkeys(tokens + BOT_EXTRA_TOKENS))
+
+
+class ShardedRateLimiter:
+    """Ограничители нескольких ботов за интерфейсом RateLimiter
+
+    Запрос в чат проходит через ограничитель бота, который в этот чат пишет,
+    поэтому лимиты ботов складываются.
+    """
+
+    def __init__(self, route: Callable[[Optional[ChatId]], RateLimiter]):
+        self.route = route
+
+    def penalize(self, chat_id: Optional[ChatId], seconds: float):
+        self.route(chat_id).penalize(chat_id, seconds)
+
+    def acquire(self, chat_id: Optional[ChatId] = None):
+        self.route(chat_id).acquire(chat_id)
+
+    async def acquire_async(self, chat_id: Optional[ChatId] = None):
+        await self.route(chat_id).acquire_async(chat_id)
+
+
+class CheckRateLimiter:
+    """Ограничитель для проверки прав: запрос (канал, токен) ждет общий лимит своего бота
+
+    getChatMember не пост в канал, поэтому лимит канала не расходуется.
+    """
+
+    def penalize(self, check: Tuple[Any, str], seconds: float):
+        get_rate_limiter(check[1]).penalize(None, seconds)
+
+    def acquire(self, check: Tuple[Any, str]):
+        get_rate_limiter(check[1]).acquire()
+
+    async def acquire_async(self, check: Tuple[Any, str]):
+        await get_rate_limiter(check[1]).acquire_async()
+
+
+class TokenPool:
+    """Пул ботов и закрепление каналов за ними
+
+    Первый токен - основной: он отвечает на команды и пишет в каналы,
+    где не администратор ни один бот пула.
+    """
+
+    def __init__(self, tokens: List[str], path: str = OUTBOX_PATH, refresh_hours: float = SHARD_REFRESH_HOURS):
+        self.tokens = tokens
+        self.primary = tokens[0]
+        self.by_id = {bot_id(token): token for token in tokens}
+        self.refresh_seconds = refresh_hours * 3600
+        # Ключи - str(ID канала): сырые боты передают chat_id строкой
+        self.assignment: Dict[str, str] = {}
+        # Время проверки закрепления: устаревшее закрепление проверяется заново
+        self.checked_at: Dict[str, float] = {}
+        self.rate_limiter = ShardedRateLimiter(lambda chat_id: get_rate_limiter(self.token_for(chat_id)))
+
+        self.lock = threading.Lock()
+        self.conn = None
+        if len(tokens) > 1:
+            self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.executescript(SCHEMA)
+            self.reload()
+
+    def reload(self):
+        """Чтение закрепления из базы (только свежие записи и только ботов этого пула)"""
+        if self.conn is None:
+            return
+
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT channel, bot_id, checked_at FROM channel_bots WHERE checked_at > ?",
+                (time.time() - self.refresh_seconds,)
+            ).fetchall()
+        rows = [row for row in rows if row[1] in self.by_id]
+        self.assignment = {str(channel): self.by_id[row_bot_id] for channel, row_bot_id, _ in rows}
+        self.checked_at = {str(channel): checked_at for channel, _, checked_at in rows}
+
+    def token_for(self, channel: Optional[ChatId]) -> str:
+        """Токен бота, который пишет в канал (ID канала может прийти и числом, и строкой)"""
+        return self.assignment.get(str(channel), self.primary)
+
+    def unassigned(self, channels: Iterable[Any]) -> List[Any]:
+        """Каналы, для которых закрепление еще не вычислено или устарело"""
+        if len(self.tokens) == 1:
+            return []
+        expired = time.time() - self.refresh_seconds
+        return [channel for channel in channels if self.checked_at.get(str(channel), 0) <= expired]
+
+    def assign(self, admins: Dict[Any, List[str]]):
+        """Закрепление каналов {канал: токены ботов-администраторов} с выравниванием нагрузки"""
+        load = {token: 0 for token in self.tokens}
+        rechecked = {str(channel) for channel in admins}
+        for channel, token in self.assignment.items():
+            # Перепроверенные каналы распределяются заново
+            if channel not in rechecked:
+                load[token] += 1
+
+        now = time.time()
+        rows = []
+        for channel, tokens in admins.items():
+            if tokens:
+                token = min(tokens, key=lambda candidate: load[candidate])
+            else:
+                logger.warning(f"⚠️ Ни один бот пула не администратор в {channel}, пишет основной бот")
+                token = self.primary
+            load[token] += 1
+            self.assignment[str(channel)] = token
+            self.checked_at[str(channel)] = now
+            rows.append((channel, bot_id(token), now))
+
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO channel_bots (channel, bot_id, checked_at) VALUES (?, ?, ?)",
+                rows
+            )
+
+        logger.info(
+            "🤖 Каналы по ботам: " +
+            ", ".join(f"{bot_id(token)}: {count}" for token, count in load.items())
+        )
+
+    def shards(self, channels: Iterable[Any]) -> Dict[str, List[Any]]:
+        """Разбиение каналов по ботам {токен: каналы}"""
+        shards: Dict[str, List[Any]] = {token: [] for token in self.tokens}
+        for channel in channels:
+            shards[self.token_for(channel)].append(channel)
+        return shards
+
+    def _log_failed(self, failed: Iterable[Any]):
+        """Каналы, где проверка не состоялась: закрепление не сохраняется и проверяется при следующей рассылке"""
+        failed = list(failed)
+        if failed:
+            logger.warning(f"⚠️ Не удалось проверить права ботов в {len(failed)} каналах, проверим при следующей рассылке")
+
+    async def refresh_async(self, is_admin: Callable[[str, Any], Awaitable[bool]], channels: Iterable[Any],
+                            concurrency: Optional[int] = None, timeout: Optional[float] = None):
+        """Проверка (асинхронно) каналов без закрепления: is_admin(токен, канал)
+
+        Запросы проходят через ограничитель своего бота и не мешают рассылке.
+        """
+        missing = self.unassigned(channels)
+        if not missing:
+            return
+
+        logger.info(f"🔍 Проверяем права {len(self.tokens)} ботов в {len(missing)} каналах")
+        admins: Dict[Any, List[str]] = {channel: [] for channel in missing}
+
+        async def check(pair: Tuple[Any, str]) -> bool:
+            channel, token = pair
+            try:
+                if await is_admin(token, channel):
+                    admins[channel].append(token)
+            except Exception as e:
+                if check_failed(e):
+                    raise
+                logger.info(f"ℹ️ Бот {bot_id(token)} не может проверить {channel}: {e}")
+            return True
+
+        pairs = [(channel, token) for channel in missing for token in self.tokens]
+        results = await fan_out(pairs, check, concurrency, timeout, CheckRateLimiter())
+        failed = {channel for (channel, _), checked in results.items() if not checked}
+        self._log_failed(failed)
+        self.assign({channel: tokens for channel, tokens in admins.items() if channel not in failed})
+
+    def refresh_sync(self, is_admin: Callable[[str, Any], bool], channels: Iterable[Any]):
+        """Проверка (синхронно) каналов без закрепления: is_admin(токен, канал)"""
+        missing = self.unassigned(channels)
+        if not missing:
+            return
+
+        logger.info(f"🔍 Проверяем права {len(self.tokens)} ботов в {len(missing)} каналах")
+        admins: Dict[Any, List[str]] = {}
+        failed = []
+        for channel in missing:
+            admins[channel] = []
+            for token in self.tokens:
+                get_rate_limiter(token).acquire()
+                try:
+                    if is_admin(token, channel):
+                        admins[channel].append(token)
+                except Exception as e:
+                    if check_failed(e):
+                        logger.warning(f"⚠️ Не удалось проверить бота {bot_id(token)} в {channel}: {e}")
+                        failed.append(channel)
+                        del admins[channel]
+                        break
+                    logger.info(f"ℹ️ Бот {bot_id(token)} не может проверить {channel}: {e}")
+
+        self._log_failed(failed)
+        self.assign(admins)
+
+    def close(self):
+        """Закрытие базы"""
+        if self.conn:
+            with self.lock:
+                self.conn.close()
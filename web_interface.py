@@ -4,13 +4,15 @@
 Позволяет запускать автопосты вручную и мониторить работу
 """
 
-import asyncio
+import json
 import logging
 import threading
 import time
 from datetime import datetime
-from flask import Flask, render_template_string, jsonify, request
-from telegram_bot import TelegramPublisher
+from flask import Flask, Response, render_template_string, jsonify, request
+from fanout import iterate_sync, run_sync
+from circuit_breaker import get_circuit_breaker
+from sharded_publisher import create_publisher
 from config import BOT_TOKEN, CHANNELS, PUBLISH_SCHEDULE, POST_TEMPLATES
 
 # Настройка логирования
@@ -30,13 +32,77 @@ bot_status = {
     'publisher': None
 }
 
+# Маппинг шаблонов
+TEMPLATE_MAP = {
+    'morning': '08:00',
+    'noon': '12:00', 
+    'afternoon': '16:00',
+    'evening': '19:00'
+}
+
 def init_bot():
     """Инициализация бота"""
     if not bot_status['publisher']:
-        bot_status['publisher'] = TelegramPublisher(BOT_TOKEN)
+        bot_status['publisher'] = create_publisher(BOT_TOKEN)
+        # Счетчики процессов рассылки (если она идет в нескольких процессах)
+        bot_status['workers'] = getattr(bot_status['publisher'], 'worker_stats', {})
         bot_status['running'] = True
         bot_status['start_time'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
+def probe_period(hours):
+    """Период пробной отправки в канал на карантине для панели (BREAKER_PROBE_HOURS)"""
+    if hours == 24:
+        return "раз в сутки"
+    if hours % 24 == 0:
+        return f"раз в {hours / 24:g} сут."
+    return f"раз в {hours:g} ч"
+
+def get_template(template):
+    """Текст и режим разметки шаблона по его имени"""
+    time_key = TEMPLATE_MAP.get(template, '08:00')
+    post_template = POST_TEMPLATES.get(time_key, {
+        'text': f'🧪 Тестовое сообщение ({template})',
+        'parse_mode': 'HTML'
+    })
+    return post_template['text'], post_template.get('parse_mode', 'HTML')
+
+def stream_publish(message, parse_mode='HTML'):
+    """Публикация с выдачей результата каждого канала строкой NDJSON"""
+    init_bot()
+    publisher = bot_status['publisher']
+    
+    def generate():
+        try:
+            for progress in iterate_sync(publisher.publish_stream(message, parse_mode)):
+                if progress.is_summary:
+                    bot_status['last_publish'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    line = {
+                        "success": True,
+                        "done": True,
+                        "successful": progress.successful,
+                        "failed": progress.failed,
+                        "total": progress.done,
+                        "elapsed": round(progress.elapsed, 2)
+                    }
+                else:
+                    # Статистика обновляется сразу, а не после всей рассылки
+                    if progress.success:
+                        bot_status['total_published'] += 1
+                    else:
+                        bot_status['errors'] += 1
+                    line = {
+                        "channel": progress.channel,
+                        "success": progress.success,
+                        "sent": progress.done,
+                        "successful": progress.successful,
+                        "total": progress.total
+                    }
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({"success": False, "done": True, "error": str(e)}, ensure_ascii=False) + "\n"
+    
+    return Response(generate(), mimetype='application/x-ndjson')
+
 @app.route('/')
 def dashboard():
     """Главная страница с мониторингом"""
@@ -244,6 +310,20 @@ def dashboard():
                 {% endfor %}
             </div>
             
+            {% if quarantine %}
+            <div class="schedule">
+                <h3>🚧 Каналы на карантине ({{ quarantine|length }})</h3>
+                <p>Рассылка пропускает эти каналы и {{ probe_period }} проверяет их одной попыткой.</p>
+                {% for item in quarantine %}
+                <div class="schedule-item">
+                    📢 {{ item.channel }}: {{ item.last_error }}<br>
+                    <small>Ошибок подряд: {{ item.failures }}, последняя: {{ item.last_failure }}, следующая проверка: {{ item.next_probe }}</small>
+                    <button class="btn btn-warning" onclick="releaseChannel('{{ item.channel }}')">🔓 Снять с карантина</button>
+                </div>
+                {% endfor %}
+            </div>
+            {% endif %}
+            
             <div style="background: #f8f9fa; padding: 20px; border-radius: 10px; margin: 20px 0;">
                 <strong>📈 Последняя публикация:</strong> {{ status.last_publish or 'Нет данных' }}<br>
                 <strong>🚀 Время запуска:</strong> {{ status.start_time or 'Нет данных' }}
@@ -269,11 +349,38 @@ def dashboard():
                 result.innerHTML = message;
             }
             
+            async function readStream(response, onLine) {
+                // Ответ приходит построчно (NDJSON): одна строка на канал и итог в конце
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                let last = null;
+                while (true) {
+                    const {value, done} = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, {stream: true});
+                    const lines = buffer.split('\\n');
+                    buffer = lines.pop();
+                    for (const line of lines) {
+                        if (!line) continue;
+                        last = JSON.parse(line);
+                        onLine(last);
+                    }
+                }
+                return last || {success: false, error: 'Пустой ответ'};
+            }
+            
+            function showProgress(data) {
+                if (!data.done) {
+                    showResult(`⏳ Отправлено в ${data.successful} из ${data.total} каналов (обработано ${data.sent})`, true);
+                }
+            }
+            
             async function testPublish(template) {
                 showLoading();
                 try {
-                    const response = await fetch('/api/test/' + template);
-                    const data = await response.json();
+                    const response = await fetch('/api/stream/' + template);
+                    const data = await readStream(response, showProgress);
                     hideLoading();
                     
                     if (data.success) {
@@ -285,7 +392,7 @@ def dashboard():
                     }
                 } catch (error) {
                     hideLoading();
-                    showResult('❌ Ошибка соединения: ' + error.message', false);
+                    showResult('❌ Ошибка соединения: ' + error.message, false);
                 }
             }
             
@@ -295,12 +402,12 @@ def dashboard():
                 
                 showLoading();
                 try {
-                    const response = await fetch('/api/test/custom', {
+                    const response = await fetch('/api/stream/custom', {
                         method: 'POST',
                         headers: {'Content-Type': 'application/json'},
                         body: JSON.stringify({message: message})
                     });
-                    const data = await response.json();
+                    const data = await readStream(response, showProgress);
                     hideLoading();
                     
                     if (data.success) {
@@ -334,6 +441,20 @@ def dashboard():
                 }
             }
             
+            async function releaseChannel(channel) {
+                try {
+                    const response = await fetch('/api/quarantine/' + encodeURIComponent(channel) + '/reset', {method: 'POST'});
+                    const data = await response.json();
+                    if (data.success) {
+                        location.reload();
+                    } else {
+                        showResult('❌ Канал не найден на карантине', false);
+                    }
+                } catch (error) {
+                    showResult('❌ Ошибка соединения: ' + error.message, false);
+                }
+            }
+            
             // Автообновление каждые 30 секунд
             setTimeout(function() {
                 location.reload();
@@ -343,11 +464,14 @@ def dashboard():
     </html>
     """
     
+    breaker = get_circuit_breaker()
     return render_template_string(template, 
                                 status=bot_status,
                                 channels_count=len(CHANNELS),
                                 schedule_count=len(PUBLISH_SCHEDULE),
-                                schedule_times=PUBLISH_SCHEDULE)
+                                schedule_times=PUBLISH_SCHEDULE,
+                                quarantine=breaker.quarantined(),
+                                probe_period=probe_period(breaker.probe_interval / 3600))
 
 @app.route('/api/status')
 def api_status():
@@ -361,22 +485,7 @@ def test_template(template):
         init_bot()
         publisher = bot_status['publisher']
         
-        # Маппинг шаблонов
-        template_map = {
-            'morning': '08:00',
-            'noon': '12:00', 
-            'afternoon': '16:00',
-            'evening': '19:00'
-        }
-        
-        time_key = template_map.get(template, '08:00')
-        post_template = POST_TEMPLATES.get(time_key, {
-            'text': f'🧪 Тестовое сообщение ({template})',
-            'parse_mode': 'HTML'
-        })
-        
-        message = post_template['text']
-        parse_mode = post_template.get('parse_mode', 'HTML')
+        message, parse_mode = get_template(template)
         
         results = await publisher.publish_to_all_channels(message, parse_mode)
         
@@ -396,24 +505,22 @@ def test_template(template):
         }
     
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(test())
-        loop.close()
-        return jsonify(result)
+        # Общий цикл событий процесса: в нем живут соединения ботов публикатора
+        return jsonify(run_sync(test()))
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
 @app.route('/api/test/custom', methods=['POST'])
 def test_custom():
     """API для тестирования пользовательского сообщения"""
+    # Запрос Flask доступен только в его потоке, а не в цикле событий
+    data = request.get_json()
+    message = data.get('message', '🧪 Пользовательское сообщение')
+    
     async def test():
         init_bot()
         publisher = bot_status['publisher']
         
-        data = request.get_json()
-        message = data.get('message', '🧪 Пользовательское сообщение')
-        
         results = await publisher.publish_to_all_channels(message)
         
         successful = sum(1 for success in results.values() if success)
@@ -432,11 +539,8 @@ def test_custom():
         }
     
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(test())
-        loop.close()
-        return jsonify(result)
+        # Общий цикл событий процесса: в нем живут соединения ботов публикатора
+        return jsonify(run_sync(test()))
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
@@ -474,14 +578,39 @@ def test_all_templates():
         }
     
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(test())
-        loop.close()
-        return jsonify(result)
+        # Общий цикл событий процесса: в нем живут соединения ботов публикатора
+        return jsonify(run_sync(test()))
     except Exception as e:
         return jsonify({"success": False, "error": str(e)})
 
+@app.route('/api/quarantine')
+def api_quarantine():
+    """API для получения каналов на карантине"""
+    return jsonify(get_circuit_breaker().quarantined())
+
+@app.route('/api/quarantine/<channel>/reset', methods=['POST'])
+def reset_quarantine(channel):
+    """API для снятия канала с карантина"""
+    # ID каналов в конфиге - числа, @username - строки
+    try:
+        channel = int(channel)
+    except ValueError:
+        pass
+    return jsonify({"success": get_circuit_breaker().reset(channel)})
+
+@app.route('/api/stream/<template>')
+def stream_template(template):
+    """API для тестирования шаблона с результатами по мере отправки"""
+    message, parse_mode = get_template(template)
+    return stream_publish(message, parse_mode)
+
+@app.route('/api/stream/custom', methods=['POST'])
+def stream_custom():
+    """API для пользовательского сообщения с результатами по мере отправки"""
+    data = request.get_json()
+    message = data.get('message', '🧪 Пользовательское сообщение')
+    return stream_publish(message)
+
 if __name__ == "__main__":
     print("🌐 Запуск веб-интерфейса для управления ботом...")
     print("📱 Откройте браузер и перейдите по адресу: http://localhost:5000")
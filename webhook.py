@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Прием обновлений Telegram через webhook
+Вместо polling Telegram сам присылает обновления POST-запросом на
+WEBHOOK_URL. Сервер на aiohttp проверяет секретный заголовок, сразу
+отвечает 200 и передает обновление обработчику отдельной задачей:
+долгая рассылка /post не задерживает ответ, и Telegram не повторяет
+обновление. Одновременные обновления обрабатываются параллельно.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+from typing import Any, Callable, Set
+
+from polling import POLL_ALLOWED_UPDATES
+
+try:
+    from aiohttp import web
+except ImportError:
+    # Без aiohttp бот получает обновления только через polling
+    web = None
+
+# Импортируем конфигурацию
+try:
+    from config import (
+        WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_WORKERS,
+        WEBHOOK_MAX_CONNECTIONS
+    )
+except ImportError:
+    # Если config.py недоступен, используем переменные окружения
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+    WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', os.getenv('PORT', '8080')))
+    WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '8'))
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+
+logger = logging.getLogger(__name__)
+
+# Заголовок, в котором Telegram присылает secret_token из setWebhook
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# Можно ли принимать обновления через webhook (задан адрес и установлен aiohttp)
+WEBHOOK_ENABLED = bool(WEBHOOK_URL) and web is not None
+if WEBHOOK_URL and web is None:
+    logger.warning("⚠️ WEBHOOK_URL задан, но aiohttp не установлен: обновления будут получаться через polling")
+
+# Обработчик обновления: получает JSON обновления, может быть корутиной
+UpdateHandler = Callable[[dict], Any]
+
+
+def webhook_secret(bot_token: str) -> str:
+    """Секрет webhook: WEBHOOK_SECRET или хеш токена бота (не меняется между перезапусками)"""
+    return WEBHOOK_SECRET or hashlib.sha256(f"webhook:{bot_token}".encode()).hexdigest()
+
+
+def webhook_address() -> str:
+    """Полный адрес webhook, который регистрируется в Telegram"""
+    return WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH
+
+
+def webhook_request(bot_token: str) -> dict:
+    """Поля запроса setWebhook"""
+    return {
+        'url': webhook_address(),
+        'secret_token': webhook_secret(bot_token),
+        'allowed_updates': json.dumps(POLL_ALLOWED_UPDATES),
+        'max_connections': WEBHOOK_MAX_CONNECTIONS
+    }
+
+
+class WebhookServer:
+    """HTTP-сервер для обновлений Telegram
+
+    На каждое обновление с верным секретом сразу отвечает 200, а handler
+    выполняется отдельной задачей. GET / отвечает "ok" для проверок
+    хостинга.
+    """
+
+    def __init__(self, handler: UpdateHandler, secret: str, path: str = WEBHOOK_PATH,
+                 listen: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT):
+        if web is None:
+            raise ImportError("Для webhook нужен aiohttp")
+
+        self.handler = handler
+        self.secret = secret
+        self.listen = listen
+        self.port = port
+        # Ссылки на задачи обработки: без них сборщик мусора может остановить задачу
+        self.tasks: Set[asyncio.Task] = set()
+        self.app = web.Application()
+        self.app.router.add_post(path, self.receive)
+        self.app.router.add_get('/', self.health)
+
+    async def health(self, request: "web.Request") -> "web.Response":
+        return web.Response(text='ok')
+
+    async def receive(self, request: "web.Request") -> "web.Response":
+        """Прием обновления: проверка секрета, ответ сразу, обработка в фоне"""
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ''), self.secret):
+            logger.warning(f"🚫 Отклонен запрос к webhook без верного секрета от {request.remote}")
+            return web.Response(status=403)
+
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+
+        task = asyncio.create_task(self._handle(update))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return web.Response()
+
+    async def _handle(self, update: dict):
+        try:
+            result = self.handler(update)
+            if asyncio.iscoroutine(result) or isinstance(result, asyncio.Future):
+                await result
+        except Exception as e:
+            logger.error(f"❌ Ошибка обработки обновления {update.get('update_id')}: {e}")
+
+    async def serve(self):
+        """Работа сервера до отмены; при остановке дожидается начатой обработки"""
+        runner = web.AppRunner(self.app)
+        await runner.setup()
+        await web.TCPSite(runner, self.listen, self.port).start()
+        logger.info(f"🌐 Webhook слушает {self.listen}:{self.port}, адрес {webhook_address()}")
+
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+            if self.tasks:
+                await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+async def serve_application(application, bot_token: str):
+    """Webhook для python-telegram-bot 20+: обновления идут в очередь Application
+
+    Их обрабатывают те же обработчики, что и при polling.
+    """
+    from telegram import Update
+
+    async with application:
+        await application.bot.set_webhook(
+            url=webhook_address(),
+            secret_token=webhook_secret(bot_token),
+            allowed_updates=POLL_ALLOWED_UPDATES,
+            max_connections=WEBHOOK_MAX_CONNECTIONS
+        )
+        await application.start()
+        try:
+            server = WebhookServer(
+                lambda update: application.update_queue.put(Update.de_json(update, application.bot)),
+                webhook_secret(bot_token)
+            )
+            await server.serve()
+        finally:
+            await application.stop()